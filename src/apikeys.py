@@ -0,0 +1,63 @@
+import hashlib
+import threading
+import time
+
+import openai
+from openai import OpenAI
+
+
+# seconds a key check is trusted before it is refreshed in the background
+KEY_CHECK_TTL = 600
+
+
+class KeyStatusCache:
+    # Validation results and model lists per API key. A key is checked with a single models.list
+    # call on a background thread and the result doubles as its model list. lookup never touches the
+    # network, it returns what is cached and starts a refresh when that is missing or older than ttl.
+    # A stale entry is still returned while it refreshes.
+    def __init__(self, log, ttl=KEY_CHECK_TTL):
+        self.log = log
+        self.ttl = ttl
+        self.entries = dict()
+        self.callbacks = dict()
+        self.lock = threading.Lock()
+
+    def lookup(self, key, callback=None):
+        # returns {"valid", "models", "error", "checked"} or None if the key hasn't been checked yet,
+        # in which case callback(entry) is called from the refresh thread once it has
+        key_hash = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        with self.lock:
+            entry = self.entries.get(key_hash)
+            stale = entry is None or time.monotonic() - entry["checked"] >= self.ttl
+            if not stale:
+                return entry
+            refreshing = key_hash in self.callbacks
+            callbacks = self.callbacks.setdefault(key_hash, [])
+            if entry is None and callback is not None:
+                callbacks.append(callback)
+        if not refreshing:
+            thread = threading.Thread(target=self.refresh, args=(key, key_hash))
+            thread.daemon = True
+            thread.start()
+        return entry
+
+    def refresh(self, key, key_hash):
+        now = time.monotonic()
+        try:
+            models = sorted(model.id for model in OpenAI(api_key=key, timeout=15).models.list())
+            entry = {"valid": True, "models": models, "error": None, "checked": now}
+        except (openai.AuthenticationError, openai.PermissionDeniedError) as error:
+            entry = {"valid": False, "models": [], "error": str(error), "checked": now}
+        except Exception as error:
+            # couldn't reach the api, this says nothing about the key so it is checked again next time
+            self.log.write(f"API key check failed: {error}")
+            entry = {"valid": None, "models": [], "error": str(error), "checked": now - self.ttl}
+        with self.lock:
+            previous = self.entries.get(key_hash)
+            if entry["valid"] is None and previous is not None and previous["valid"] is not None:
+                # keep the last real answer rather than forget a good key over a network blip
+                entry = previous
+            self.entries[key_hash] = entry
+            callbacks = self.callbacks.pop(key_hash, [])
+        for callback in callbacks:
+            callback(entry)
@@ -1,678 +1,1025 @@
-import wx
-import json
-
-import subprocess
-import os
-
-import openai
-from openai import OpenAI
-
-import csv
-
-import threading
-import multiprocessing
-from multiprocessing import Manager
-from multiprocessing import Queue
-from log import Log
-
-from job import response as response
-from job import main
-from job import read_csv_file as read_csv_file
-
-from metrics import Metrics
-
-import concurrent.futures
-
-import pathlib
-import sys
-
-import queue
-
-import ctypes
-try:
-    ctypes.windll.shcore.SetProcessDpiAwareness(True)
-except:
-    pass
-
-
-
-
-descriptions = {
-    "api_key": "Enter your OpenAI API Key here.",
-    "input_file": "Click to browse for input file",
-    "output_file": "Enter the name of your output.csv file here.",
-    "include_headers": "Check the box to keep the headers of the original file in the output file",
-    "keep_data": "Check the box to keep the non-optimized data as well as the optimized. For example if you are using the tool on Column 2, the output file will also have the original data for other columns",
-    "max_workers": "Enter the number of workers to use for the script. If you are unsure, leave this at 50.",
-    "model": "Select the model that you want to use for the script. If you are unsure, leave this at gpt-3.5-turbo.",
-    "input_cost": "Enter the cost in dollars of the input prompt. For gpt-3.5-turbo the value is $0.0015/1000 tokens.",
-    "output_cost": "Enter the cost in dollars of the input prompt. For gpt-3.5-turbo the value is $0.002/1000 tokens.",
-    "max_tokens": "Enter the maximum number of tokens to leave for the response. If you are unsure, leave this at 30.",
-    "temperature": "Enter the models temperature for the response. If you are unsure, leave this at 0.9.",
-    "task_timeout": "Enter the maximum number of seconds to wait for a response from the model before retrying the request. If you are unsure, leave this at 20.",
-    "sleep_time": "Enter the number of seconds to wait between failed requests to the model. If you are unsure, leave this at 10.",
-    "input_columns": "Enter the column numbers of the input data in the input file. Must be seperated by commas. Ex: If the input data is in columns A and B then enter 1,2.",
-    "output_column": "Enter the column number of the output data in the input file. Usually this is the same as the input column. Ex: If the output column is C then enter 3.",
-    "system_msg": "Enter the role you want the model to take on. Ex: You are a helpful assistant. If you aren't sure just leave it",
-    "separator": "Enter the separator that you want between data from multiple rows. If you want {productName} - {price} then enter ' - '. This will only work if multiple input columns are provided",
-    "row_start": "Enter the row number to start on in the input file. Ex: If you want to start on row 2 then enter 2. If you want to start on the first row then enter: start.",
-    "row_end": "Enter the row number to end on in the input file. Ex: If you want to end on row 100 then enter 100. If you want to end on the last row then enter: end.",
-}
-
-
-config_display = {
-    "api_key": "Your API Key",
-    "input_file": "Input File",
-    "output_file": "Output File",
-    "include_headers": "Include Headers",
-    "keep_data": "Keep Data",
-    "max_workers": "Max Workers",
-    "model": "Model to use",
-    "input_cost": "Input Cost (Dollars)",
-    "output_cost": "Output Cost (Dollars)",
-    "max_tokens": "Maximum Tokens",
-    "temperature": "Model Temperature",
-    "task_timeout": "Model Response Timeout",
-    "sleep_time": "Model Sleep Time",
-    "input_columns": "Input Columns",
-    "output_column": "Output Column",
-    "row_start": "Row Start",
-    "row_end": "Row End",
-    "separator": "Separator",
-    "system_msg": "System Message",
-}
-
-
-default_config = {
-    "api_key": "your_api_key_here",
-    "input_file": "input_data.csv",
-    "output_file": "output_data.csv",
-    "include_headers": True,
-    "keep_data": True,
-    "max_workers": 50,
-    "model": "gpt-3.5-turbo",
-    "input_cost": 0.0015,
-    "output_cost": 0.002,
-    "max_tokens": 30,
-    "temperature": 0.9,
-    "task_timeout": 20,
-    "sleep_time": 10,
-    "input_columns": "2",
-    "output_column": 2,
-    "row_start": "start",
-    "row_end": "end",
-    "separator": " - ",
-    "system_msg": "You are a helpful assistant",
-    # App Parameters
-    "sample_inputs": "",
-    "frame_size": (800, 800),
-}
-
-
-def is_valid_json(json_string):
-    try:
-        json.loads(json_string)
-    except ValueError:
-        return False
-    return True
-
-
-def check_if_output_file(file_path):
-    # check if output file is writeable to. ie is not open in another program
-    with open(file_path, 'w') as f:
-        f.close()
-        pass
-
-def check_if_csv_file(file_path):
-    if not os.path.isfile(file_path):
-        return False
-    if not file_path.endswith(".csv"):
-        return False
-    try:
-        with open(file_path, "r") as f:
-            csv.reader(f)
-    except:
-        return False
-    return True
-
-
-def get_datadir() -> pathlib.Path:
-
-    """
-    Returns a parent directory path
-    where persistent application data can be stored.
-
-    # linux: ~/.local/share
-    # macOS: ~/Library/Application Support
-    # windows: C:/Users/<USER>/AppData/Roaming
-    """
-
-    home = pathlib.Path.home()
-
-    if sys.platform == "win32":
-        return home / "AppData/Roaming"
-    elif sys.platform == "linux":
-        return home / ".local/share"
-    elif sys.platform == "darwin":
-        return home / "Library/Application Support"
-
-
-
-class MainFrame(wx.Frame):
-    def __init__(self):
-        self.dir_path = get_datadir() / "Callio"
-        self.text_font = wx.Font(12, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL)
-        
-        try:
-            os.mkdir(str(self.dir_path))
-        except FileExistsError:
-            pass
-        
-        self.file_path = str(self.dir_path  / 'config.json')
-        self.log = Log(str(self.dir_path / "log.txt"))
-
-
-        self.running_processes = []
-
-        if not os.path.isfile(self.file_path):
-            self.config = default_config.copy()
-            self.context = []  # list of dicts
-
-        else:
-            with open(self.file_path, "r") as f:
-                self.config = json.load(f)
-                self.context = self.config["context"]
-                for key in default_config.keys():
-                    if key not in self.config:
-                        self.config[key] = default_config[key]
-                delete_keys = [key for key in self.config.keys() if key not in default_config.keys()]
-                for key in delete_keys:
-                    del self.config[key]
-        self.text_boxes = dict()
-        
-        wx.Frame.__init__(self, None, title="Callio", size=self.config["frame_size"])
-        panel = wx.Panel(self)
-        self.StatusBar = self.CreateStatusBar() 
-        self.vbox = wx.BoxSizer(wx.VERTICAL)
-        self.Bind(wx.EVT_CLOSE, self.on_close)
-        for i, key in enumerate(self.config.keys()):
-            if key == "context":
-                continue
-            if key == "sample_inputs":
-                continue
-            if key == "frame_size":
-                continue
-            hbox = wx.BoxSizer(wx.HORIZONTAL)
-
-            label = wx.StaticText(panel, label=config_display[key])
-            label.Bind(wx.EVT_LEFT_DOWN, self.show_description)
-            label.SetToolTip(
-                descriptions.get(key, "")
-            )  # set the description as tooltip
-            hbox.Add(label, flag=wx.RIGHT, border=8)
-
-            if key in ["include_headers", "keep_data"]:
-                # Use a checkbox for true/false values.
-                self.text_boxes[key] = wx.CheckBox(panel)
-                # Check or uncheck the box based on the current value.
-                self.text_boxes[key].SetValue(self.config.get(key, False))
-
-            else:
-                self.text_boxes[key] = wx.TextCtrl(panel)
-                self.text_boxes[key].SetValue(str(self.config[key]))
-
-            if self.text_boxes[key].GetContainingSizer() is not None:
-                self.text_boxes[key].GetContainingSizer().Detach(self.text_boxes[key])
-
-            if key == "input_file":
-                self.text_boxes[key].Bind(wx.EVT_LEFT_DOWN, self.open_file_dialog)
-            elif key == "output_file":
-                self.text_boxes[key].Bind(wx.EVT_LEFT_DOWN, self.save_file_dialog)
-            elif key == "model":
-                self.text_boxes[key].Bind(wx.EVT_LEFT_DOWN, self.choose_model)
-
-            hbox.Add(self.text_boxes[key], proportion=1)
-
-            self.vbox.Add(hbox, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=10)
-
-        self.run_button = wx.Button(panel, label="Run")
-        self.run_button.Bind(wx.EVT_BUTTON, self.run_script)
-
-        self.context_button = wx.Button(panel, label="Add Context")
-        self.context_button.Bind(wx.EVT_BUTTON, self.add_context)
-
-        self.view_context_button = wx.Button(panel, label="View / Edit Context")
-        self.view_context_button.Bind(wx.EVT_BUTTON, self.view_edit_context)
-
-        self.clear_context_button = wx.Button(panel, label="Clear Context")
-        self.clear_context_button.Bind(wx.EVT_BUTTON, self.clear_context)
-
-        self.sample_responses_button = wx.Button(panel, label="View Input / Generate Sample Responses")
-        self.sample_responses_button.Bind(wx.EVT_BUTTON, self.sample_responses)
-
-        hbox = wx.BoxSizer(wx.HORIZONTAL)
-        hbox.Add(self.run_button, flag=wx.RIGHT, border=10)
-        hbox.Add(self.context_button, flag=wx.RIGHT, border=10)
-        hbox.Add(self.view_context_button, flag=wx.RIGHT, border=10)
-        hbox.Add(self.clear_context_button, flag=wx.RIGHT, border=10)
-
-        self.vbox.Add(hbox, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=10)
-        self.vbox.Add(self.sample_responses_button, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=10)
-        #vbox.Add(self.count_text, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=10)
-
-        panel.SetSizer(self.vbox)
-        panel.Fit()
-        self.client = OpenAI(api_key="")
-        self.api_key_warning = False
-
-        self.data = multiprocessing.Queue()
-        self.most_recent_message = "Started Job"
-
-        
-    def save_file_dialog(self, event):
-        file_dialog = wx.FileDialog(self, "Save", "", "",
-                                        "CSV files(*.csv)|*.*",
-                                        wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
-
-        if file_dialog.ShowModal() == wx.ID_CANCEL:
-            return
-
-        path = file_dialog.GetPath()
-        path += ".csv"
-        with open(path, "wb") as file:
-            writer = csv.writer(file, delimiter = ',')
-        self.text_boxes["output_file"].SetValue(path)
-
-    def disable_ui(self):
-        for key in self.text_boxes.keys():
-            self.text_boxes[key].Disable()
-        self.context_button.Disable()
-        self.view_context_button.Disable()
-        self.clear_context_button.Disable()
-        self.sample_responses_button.Disable()
-
-    def enable_ui(self):
-        for key in self.text_boxes.keys():
-            self.text_boxes[key].Enable()
-        self.run_button.Enable()
-        self.context_button.Enable()
-        self.view_context_button.Enable()
-        self.clear_context_button.Enable()
-        self.sample_responses_button.Enable()
-
-    def set_api_key(self):
-        self.client = OpenAI(api_key=self.config["api_key"])
-
-    def generate_sample_inputs(self, number):
-        _, _, input_column_data = read_csv_file(self.config["input_file"], self.config["input_columns"], row_start=self.config["row_start"], number=number, separator=self.config["separator"])
-        sample_inputs = ""
-        for i, input in enumerate(input_column_data):
-            sample_inputs += input + "\n"
-            if i >= number - 1:
-                break
-        return sample_inputs
-
-    def sample_responses(self, event):
-        flag = self.update_config(api_check=True)
-        if not flag:
-            return
-        # Create a popup box for user to select if they want to paste sample inputs or generate them from file
-        dlg = wx.SingleChoiceDialog(None, 'Select Option', 'Choices', ["Write Sample Inputs", "Generate Sample Inputs From File", "View Sample Inputs"])
-        
-        if dlg.ShowModal() == wx.ID_OK:
-            selection = dlg.GetSelection()
-            
-            if selection == 0:
-                text = self.config["sample_inputs"]
-            elif selection == 1 or selection == 2: 
-                # Create a text entry for the user to specify how many
-                input_box = wx.TextEntryDialog(None, f"Enter number of sample inputs to {('read' if selection == 1 else 'view')}", style=wx.OK|wx.CANCEL,value="10")
-                if input_box.ShowModal() == wx.ID_OK:
-                    number = input_box.GetValue()
-                    try:
-                        number = int(number)
-                        if number < 1:
-                            raise ValueError("Number must be greater than 0")
-                        text = self.generate_sample_inputs(number)
-                    
-                    except ValueError as e:
-                        self.log.write(str(e))
-                        wx.MessageBox(
-                            "Invalid number", "Error", wx.OK | wx.ICON_ERROR
-                        )
-                        return
-                    
-                    except Exception as e:
-                        self.log.write(str(e))
-                        wx.MessageBox(
-                            f"Error generating sample inputs: {e}", "Error", wx.OK | wx.ICON_ERROR
-                        )
-                        return
-                else:
-                    return
-        else:
-            return
-    
-        if selection == 2:
-            wx.MessageBox(
-                text, "Sample Inputs", wx.OK | wx.RESIZE_BORDER
-            )
-            return
-        
-        input_box = wx.TextEntryDialog(None, "Paste Sample Inputs on newlines", style=wx.TE_MULTILINE|wx.RESIZE_BORDER|wx.OK|wx.CANCEL,value=text)
-        
-        if input_box.ShowModal() == wx.ID_OK:
-            self.disable_ui()
-            input_data = input_box.GetValue()
-            self.config["sample_inputs"] = input_data
-            self.save_config()
-            os.system('cls' if os.name == 'nt' else 'clear')
-            
-            # Call a separate thread to process the input
-            self.StatusBar.SetStatusText("Processing Sample Inputs")
-            thread = threading.Thread(target=self.process_input, args=(input_data,))
-            thread.daemon = True
-            thread.start()
-        else:
-            return
-
-    def on_responses_generated(self, futures):
-        self.enable_ui()
-        self.StatusBar.SetStatusText("Responses Generated")
-        text = ""
-        for future in futures:
-            text += future + "\n"
-        wx.MessageBox(
-            text, "Sample Responses", wx.OK | wx.RESIZE_BORDER
-        )
-
-    def process_input(self, input):
-        try:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=self.config["max_workers"]) as executor:
-                input_data = [data for data in input.split("\n") if len(data) > 0]
-                futures = executor.map(self.sample_assistant_response, input_data)
-            wx.CallAfter(self.on_responses_generated, futures)
-        except Exception as e:
-            self.log.write(str(e))
-            raise e
-
-    def choose_model(self, event):
-        entries = self.get_model_list()
-        if len(entries) == 0:
-            wx.MessageBox(
-                "No models found", "Error", wx.OK | wx.ICON_ERROR
-            )
-        else:
-            dlg = wx.SingleChoiceDialog(None, 'Select Model', 'Choices', entries)
-            if dlg.ShowModal() == wx.ID_OK:
-                selection = dlg.GetSelection()
-                self.text_boxes["model"].SetValue(entries[selection])
-
-    def get_model_list(self):
-        try:
-            flag = self.update_config(api_check=True)
-            if not flag:
-                return
-            models = self.client.models.list()
-            model_list = [model.id for model in models]
-            return model_list
-        except Exception as e:
-            self.log.write(str(e))
-            return []
-
-    def sample_assistant_response(self, input):
-        message = [{"role": "system", "content": self.config["system_msg"]}] + self.context
-        try:
-            open_response = response(self.client, input, timeout = 7, sleep_time = 1, model=self.config["model"], context=message, temperature=self.config["temperature"], max_tokens = self.config["max_tokens"])
-            open_response = open_response.choices[0].message.content
-        except openai.APITimeoutError:
-            self.log.write("Timeout error: Sample Assistant Response")
-            open_response = "Timeout"
-        except Exception as e:
-            wx.MessageBox(
-                f"Error: {e}", "Error", wx.OK | wx.ICON_ERROR
-            )
-            self.log.write(str(e))
-            open_response = f"Error: {e}"
-        return open_response
-
-    def open_file_dialog(self, event):
-            file_dialog = wx.FileDialog(self, "Open", "", "",
-                                        "All Files (*.*)|*.*",
-                                        wx.FD_OPEN | wx.FD_FILE_MUST_EXIST)
-
-            if file_dialog.ShowModal() == wx.ID_CANCEL:
-                return
-
-            path = file_dialog.GetPath()
-            self.text_boxes["input_file"].SetValue(path)
-    
-
-    def cancel_script(self, event):
-        for process in self.running_processes:
-            if process.is_alive():
-                process.terminate()
-                process.join()
-        for child in multiprocessing.active_children():
-            child.terminate()
-            child.join()
-
-        self.main_process_cancelled = True
-        self.running_processes = list()
-
-    def process_timer(self, event):
-        try:
-            if self.main_process_cancelled or not self.main_process.is_alive():
-                self.enable_ui()
-                self.main_process.close()
-                self.run_button.SetLabel("Run")
-                self.run_button.Bind(wx.EVT_BUTTON, self.run_script)
-                if not self.main_process_cancelled:
-                    self.StatusBar.SetStatusText("Job Complete")
-                else:
-                    self.StatusBar.SetStatusText("Job Cancelled")
-                self.running_processes.remove(self.main_process)
-                self.timer_process.Stop()
-            else:
-                while not self.data.empty():
-                    self.most_recent_message = self.data.get()
-                self.StatusBar.SetStatusText(self.most_recent_message)
-        except ValueError:
-            self.timer_process.Stop()
-    def on_close(self, event):
-        # Save config file
-        self.save_config()
-
-        if wx.MessageBox("Are you sure you want to Exit?", "Confirm", wx.YES_NO | wx.NO_DEFAULT | wx.ICON_QUESTION) == wx.YES:
-            # Terminate and close the main processes
-            for process in self.running_processes:
-                if process.is_alive():
-                    process.terminate()
-                    process.join()  # Wait for the process to finish before proceeding
-                    process.close()
-
-            # Terminate and close any remaining child processes
-            for child in multiprocessing.active_children():
-                child.terminate()
-                child.join()
-                child.close()
-
-            self.Destroy()
-        else:
-            event.Veto()
- 
-    def clear_context(self, event):
-        self.context = []
-
-
-    def view_edit_context(self, event, temp_context = None):
-        if len(self.context) == 0:
-            message = ""
-        else:
-            message = json.dumps(self.context, indent=4)
-            if temp_context is None:
-                temp_context = message
-        input_box = wx.TextEntryDialog(None, "Edit Context", style= wx.TE_MULTILINE|wx.RESIZE_BORDER|wx.OK|wx.CANCEL,value=temp_context)
-        if input_box.ShowModal() == wx.ID_OK:
-            valid_context = []
-            message = input_box.GetValue()
-            temp_context = message
-            if is_valid_json(message):
-                self.context = json.loads(message)
-                self.update_config()
-            else:
-                wx.MessageBox(
-                    f"Invalid context: {message}", "Error", wx.OK | wx.ICON_ERROR
-                )
-                self.view_edit_context(event, temp_context = temp_context)
-
-    def show_description(self, event):
-        label = event.GetEventObject()
-        description = label.GetToolTip().GetTip()
-        wx.MessageBox(description, "Description", wx.OK | wx.ICON_INFORMATION)
-
-
-    def add_context(self, event):
-        entries = ["User", "Assistant"]
-        dlg = wx.MultiChoiceDialog(None, 'Select Role', 'Choices', entries)
-        if not self.update_config(api_check=True):
-            return
-
-        if dlg.ShowModal() == wx.ID_OK:
-            selections = dlg.GetSelections()
-
-            for idx in selections:
-                role = entries[idx]
-
-                default = ""
-                # Add additional button for 'Assistant'
-                if role == "Assistant":
-                    self.disable_ui()
-                    self.StatusBar.SetStatusText("Generating Sample Assistant Response")
-                    response = self.sample_assistant_response("")
-                    self.enable_ui()
-                    default = response
-                    self.StatusBar.SetStatusText("Sample Assistant Response Generated")
-                dialog = wx.TextEntryDialog(None, "Enter text for: " + role, style = wx.TE_MULTILINE|wx.RESIZE_BORDER|wx.OK|wx.CANCEL, value=default)
-
-
-                if dialog.ShowModal() == wx.ID_OK:
-                    self.context.append({"role": role.lower(), "content": dialog.GetValue()})
-
-
-
-
-    def is_api_key_valid(self, key):
-        try:
-            client = OpenAI(api_key=key)
-            client.models.list()
-            return True
-        except Exception as e:
-            print(e)
-            self.log.write(str(e))
-            return False
-
-
-    def save_config(self,api_check=False):
-        flag = self.update_config(api_check)
-        with open(self.file_path, "w") as f:
-            json.dump(self.config, f)
-        return flag
-           
-    def update_config(self, api_check=False):
-        # update config file
-        flag = True
-
-
-
-        for key in self.config.keys():
-            if key == "context":
-                continue
-            if key == "sample_inputs":
-                continue
-            if key == "frame_size":
-                size = self.GetSize()
-                self.config["frame_size"] = (size[0], size[1])
-                continue
-            value = self.text_boxes[key].GetValue()
-            if isinstance(self.config[key], int):
-                value = int(value)
-            elif isinstance(self.config[key], float):
-                value = float(value)
-
-            self.config[key] = value
-        self.config["context"] = self.context
-
-        if not self.client.api_key == self.config["api_key"]:
-            self.set_api_key()
-        
-        if api_check:
-            if not self.is_api_key_valid(self.config["api_key"]):
-               wx.MessageBox("API Key Invalid or Check Connection", "Error", wx.OK | wx.ICON_ERROR)
-               return False
-        return True
-
-    def run_script(self, event):
-        flag = self.save_config(api_check=True)
-        if not flag:
-            return
-        os.system('cls' if os.name == 'nt' else 'clear')
-        if not check_if_csv_file(self.config["input_file"]):
-            wx.MessageBox(
-                "Input file does not exist or not valid csv",
-                "Error",
-                wx.OK | wx.ICON_ERROR,
-            )
-            return
-        try:
-            check_if_output_file(self.config["output_file"])
-        except Exception as e:
-            self.log.write(str(e))
-            wx.MessageBox(
-                f"Job Error: {e}",
-                "Error",
-                wx.OK | wx.ICON_ERROR,
-            )
-            return
-        try:
-            self.disable_ui()
-            self.StatusBar.SetStatusText("Started Job")
-            self.main_process = multiprocessing.Process(target=call_job, args=(self.config, self.log.log_path, self.data))
-            self.main_process.start()
-            self.main_process_cancelled = False
-            self.running_processes.append(self.main_process)
-            self.run_button.SetLabel("Cancel")
-            self.run_button.Bind(wx.EVT_BUTTON, self.cancel_script)
-            self.timer_process = wx.Timer(self)
-            self.Bind(wx.EVT_TIMER, self.process_timer, self.timer_process)
-            self.timer_process.Start(1000)
-        except Exception as e:
-            self.log.write(f"Job Runtime Error: {e}")
-            self.enable_ui()
-            self.StatusBar.SetStatusText("Job Runtime Error")
-            wx.MessageBox(
-                f"A runtime error occured: {e}",
-                "Error",
-                wx.OK | wx.ICON_ERROR,
-            )
-            return
-        return
-
-def call_job(config, log, data):
-    try:
-        main(config, log, data, fake=False, error=True)
-    except Exception as e:
-        raise e
-    return
-
-
-def APPmain():
-    app = wx.App(False)
-    frame = MainFrame()
-    frame.Show()
-    app.MainLoop()
-
-
-if __name__ == "__main__":
-    multiprocessing.freeze_support()
-    APPmain()
+import wx
+import json
+
+import os
+
+import openai
+from openai import OpenAI
+
+import csv
+
+import threading
+import multiprocessing
+from log import Log
+from datadir import get_datadir
+
+from job import response as response
+from job import stream_response
+from job import main
+from planner import plan_job, format_plan
+from progress import Progress
+from apikeys import KeyStatusCache
+from rowindex import RowIndexes
+from readers import FILE_FORMATS, file_format, pyarrow
+
+import concurrent.futures
+
+import collections
+import time
+
+import ctypes
+try:
+    ctypes.windll.shcore.SetProcessDpiAwareness(True)
+except:
+    pass
+
+
+
+
+# seconds between redraws of a sample response that is streaming in
+SAMPLE_REFRESH_INTERVAL = 0.1
+
+
+descriptions = {
+    "api_key": "Enter your OpenAI API Key here.",
+    "input_file": "Click to browse for input file. It can be a .csv, .jsonl, .parquet or .arrow file, parquet and arrow files need pyarrow installed.",
+    "output_file": "Enter the name of your output.csv file here. A name ending in .jsonl or .parquet writes that format instead, parquet needs pyarrow installed.",
+    "include_headers": "Check the box to keep the headers of the original file in the output file",
+    "keep_data": "Check the box to keep the non-optimized data as well as the optimized. For example if you are using the tool on Column 2, the output file will also have the original data for other columns",
+    "max_workers": "Enter the number of workers to use for the script. If you are unsure, leave this at 50.",
+    "model": "Select the model that you want to use for the script. If you are unsure, leave this at gpt-3.5-turbo.",
+    "input_cost": "Enter the cost in dollars of the input prompt. For gpt-3.5-turbo the value is $0.0015/1000 tokens.",
+    "output_cost": "Enter the cost in dollars of the input prompt. For gpt-3.5-turbo the value is $0.002/1000 tokens.",
+    "max_tokens": "Enter the maximum number of tokens to leave for the response. If you are unsure, leave this at 30.",
+    "temperature": "Enter the models temperature for the response. If you are unsure, leave this at 0.9.",
+    "task_timeout": "Enter the maximum number of seconds to wait for a response from the model before retrying the request. If you are unsure, leave this at 20.",
+    "sleep_time": "Enter the number of seconds to wait between failed requests to the model. If you are unsure, leave this at 10.",
+    "input_columns": "Enter the column numbers of the input data in the input file. Must be seperated by commas. Ex: If the input data is in columns A and B then enter 1,2.",
+    "output_column": "Enter the column number of the output data in the input file. Usually this is the same as the input column. Ex: If the output column is C then enter 3.",
+    "system_msg": "Enter the role you want the model to take on. Ex: You are a helpful assistant. If you aren't sure just leave it",
+    "separator": "Enter the separator that you want between data from multiple rows. If you want {productName} - {price} then enter ' - '. This will only work if multiple input columns are provided",
+    "row_start": "Enter the row number to start on in the input file. Ex: If you want to start on row 2 then enter 2. If you want to start on the first row then enter: start.",
+    "row_end": "Enter the row number to end on in the input file. Ex: If you want to end on row 100 then enter 100. If you want to end on the last row then enter: end.",
+    "flush_rows": "Enter the number of completed rows to write before flushing the output file to disk. If you are unsure, leave this at 100.",
+    "flush_interval": "Enter the maximum number of seconds between flushes of the output file. If you are unsure, leave this at 5.",
+    "cancel_timeout": "Enter the number of seconds a cancelled job waits for requests already sent before it writes the completed rows and stops. Enter 0 to stop right away. Requests still running then get up to the task timeout more to answer, their responses are kept for the next run.",
+    "resume": "Check the box to resume an interrupted job. Completed rows are kept in a journal next to the output file and are skipped when the job is run again with the same settings.",
+    "adaptive_workers": "Check the box to let the job find the number of workers itself. It starts low, adds workers while responses are fast and cuts back on rate limit errors and timeouts. Max Workers becomes the upper bound.",
+    "processes": "Enter the number of processes to split the job between. Each process runs a slice of the rows with its share of Max Workers and the rate limits, and the outputs are joined in order at the end. Use more than 1 for very large jobs where one process can't keep up. If you are unsure, leave this at 1.",
+    "engine": "Enter thread to run requests on a pool of worker threads, or async to run them all on one event loop. Async can keep thousands of requests in flight with Max Workers set much higher. If you are unsure, leave this at thread.",
+    "retry_budget": "Enter the share of requests that may be retried over the whole job, on top of the first 100 retries. Rate limits, server errors, timeouts and dropped connections are retried with backoff, once the budget is used up the job stops instead of piling retries on a failing API. If you are unsure, leave this at 0.2.",
+    "hedge_percentile": "Enter a latency percentile, like 0.95, to send a second copy of any request still waiting after that share of requests would have finished, and use whichever answers first. This cuts the slow tail at the end of a job at a small extra cost. Enter 0 to turn it off.",
+    "hedge_max_ratio": "Enter the most second copies to send, as a share of all requests. This caps the extra cost of hedging. If you are unsure, leave this at 0.05.",
+    "clients": "Enter API keys or OpenAI compatible endpoints to spread requests over, as a JSON list like [{\"api_key\": \"sk-...\", \"weight\": 2, \"rpm_limit\": 500}, {\"base_url\": \"https://llm.internal/v1\", \"api_key\": \"...\"}]. Each entry can have base_url, api_key (defaults to Your API Key), weight, rpm_limit, tpm_limit and name, an empty entry {} is Your API Key. A client that is rate limited or failing is rested for a while, cost and tokens are reported per client. Leave it as [] to use only Your API Key.",
+    "longest_first": "Check the box to send the longest rows first instead of in file order, so a few long rows left until last don't keep the job running after everything else is done. The output file is still written in the original row order.",
+    "schedule_window": "Enter the number of rows read ahead and sorted longest first at a time when Longest First is checked. More rows sort better but hold more rows in memory. If you are unsure, leave this at 10000.",
+    "rpm_limit": "Enter the requests per minute limit of your organization for this model. Requests are held back so the job runs just under it instead of being rate limited. Enter 0 for no limit.",
+    "tpm_limit": "Enter the tokens per minute limit of your organization for this model. Each request is counted as its prompt plus Maximum Tokens until the actual usage is known. Enter 0 for no limit.",
+    "use_cache": "Check the box to reuse responses saved from earlier jobs with the same model, messages and settings instead of paying for them again. Uncheck it when you want fresh responses, they will replace the saved ones.",
+    "cache_size_mb": "Enter the maximum size of the saved responses in megabytes. The least recently used responses are removed once it is full. If you are unsure, leave this at 512.",
+    "deduplicate": "Check the box to send each distinct input only once. Rows with the same input as an earlier row get that row's response. Uncheck it if you want a separate response for every row.",
+    "dedup_entries": "Enter the number of recent distinct responses kept in memory for Deduplicate Inputs. A duplicate of an older input is looked up in the saved responses or sent again. More entries catch more duplicates but use more memory. If you are unsure, leave this at 10000.",
+    "mode": "Enter realtime to send requests as the job runs, or batch to submit them through the OpenAI Batch API. Batch jobs can take up to 24 hours but cost half as much, use it for large jobs that aren't urgent.",
+    "batch_discount": "Enter the fraction of the normal price charged for batch requests, used to calculate the cost. If you are unsure, leave this at 0.5.",
+    "batch_poll_interval": "Enter the number of seconds to wait between checks on submitted batches. If you are unsure, leave this at 60.",
+    "stream_samples": "Check the box to stream sample responses into a live view as they are written, with each sample's time to first token and total time. Use it to compare models and Maximum Tokens by latency before running a job.",
+    "pack_rows": "Enter the number of rows to send together in one request. The context is then sent once for all of them instead of once per row, which saves prompt tokens. Rows whose answer can't be read back are sent again on their own. Leave this at 1 to send every row on its own.",
+}
+
+
+config_display = {
+    "api_key": "Your API Key",
+    "input_file": "Input File",
+    "output_file": "Output File",
+    "include_headers": "Include Headers",
+    "keep_data": "Keep Data",
+    "max_workers": "Max Workers",
+    "model": "Model to use",
+    "input_cost": "Input Cost (Dollars)",
+    "output_cost": "Output Cost (Dollars)",
+    "max_tokens": "Maximum Tokens",
+    "temperature": "Model Temperature",
+    "task_timeout": "Model Response Timeout",
+    "sleep_time": "Model Sleep Time",
+    "input_columns": "Input Columns",
+    "output_column": "Output Column",
+    "row_start": "Row Start",
+    "row_end": "Row End",
+    "separator": "Separator",
+    "system_msg": "System Message",
+    "flush_rows": "Flush Every (Rows)",
+    "flush_interval": "Flush Every (Seconds)",
+    "resume": "Resume Interrupted Job",
+    "cancel_timeout": "Cancel Timeout (Seconds)",
+    "engine": "Engine",
+    "processes": "Processes",
+    "retry_budget": "Retry Budget",
+    "hedge_percentile": "Hedge After Percentile",
+    "hedge_max_ratio": "Max Hedged Share",
+    "clients": "Client Pool",
+    "longest_first": "Longest First",
+    "schedule_window": "Longest First Window (Rows)",
+    "rpm_limit": "Requests Per Minute Limit",
+    "tpm_limit": "Tokens Per Minute Limit",
+    "use_cache": "Use Cached Responses",
+    "cache_size_mb": "Cache Size (MB)",
+    "deduplicate": "Deduplicate Inputs",
+    "dedup_entries": "Deduplication Memory (Responses)",
+    "pack_rows": "Rows Per Request",
+    "mode": "Mode",
+    "batch_discount": "Batch Cost Multiplier",
+    "batch_poll_interval": "Batch Poll Interval",
+    "adaptive_workers": "Adaptive Workers",
+    "stream_samples": "Stream Sample Responses",
+}
+
+
+default_config = {
+    "api_key": "your_api_key_here",
+    "input_file": "input_data.csv",
+    "output_file": "output_data.csv",
+    "include_headers": True,
+    "keep_data": True,
+    "max_workers": 50,
+    "model": "gpt-3.5-turbo",
+    "input_cost": 0.0015,
+    "output_cost": 0.002,
+    "max_tokens": 30,
+    "temperature": 0.9,
+    "task_timeout": 20,
+    "sleep_time": 10,
+    "input_columns": "2",
+    "output_column": 2,
+    "row_start": "start",
+    "row_end": "end",
+    "separator": " - ",
+    "system_msg": "You are a helpful assistant",
+    "flush_rows": 100,
+    "flush_interval": 5,
+    "resume": True,
+    "cancel_timeout": 30,
+    "engine": "thread",
+    "processes": 1,
+    "adaptive_workers": True,
+    "retry_budget": 0.2,
+    "hedge_percentile": 0.0,
+    "hedge_max_ratio": 0.05,
+    "rpm_limit": 0,
+    "tpm_limit": 0,
+    "clients": [],
+    "longest_first": False,
+    "schedule_window": 10000,
+    "use_cache": True,
+    "cache_size_mb": 512,
+    "deduplicate": True,
+    "dedup_entries": 10000,
+    "pack_rows": 1,
+    "mode": "realtime",
+    "batch_discount": 0.5,
+    "batch_poll_interval": 60,
+    "stream_samples": True,
+    # App Parameters
+    "sample_inputs": "",
+    "frame_size": (800, 800),
+}
+
+
+def is_valid_json(json_string):
+    try:
+        json.loads(json_string)
+    except ValueError:
+        return False
+    return True
+
+
+def check_if_output_file(file_path):
+    # check if output file is writeable to. ie is not open in another program
+    with open(file_path, 'w') as f:
+        f.close()
+        pass
+
+def check_if_input_file(file_path):
+    if not os.path.isfile(file_path):
+        return False
+    if os.path.splitext(file_path)[1].lower() not in FILE_FORMATS:
+        return False
+    # parquet and arrow files need pyarrow
+    if file_format(file_path) in ["parquet", "arrow"] and pyarrow is None:
+        return False
+    try:
+        with open(file_path, "r") as f:
+            csv.reader(f)
+    except:
+        return False
+    return True
+
+
+class ProgressPanel(wx.Panel):
+    # Live view of a running job, sampled from its shared Progress on the frame's timer. The graph
+    # shows rows per second over the last history samples.
+    def __init__(self, parent, history=120):
+        wx.Panel.__init__(self, parent)
+        self.samples = collections.deque(maxlen=history)
+        self.last_sample = None
+        self.summary = wx.StaticText(self, label="")
+        self.graph = wx.Panel(self, size=(-1, 90))
+        self.graph.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.graph.Bind(wx.EVT_PAINT, self.on_paint)
+        vbox = wx.BoxSizer(wx.VERTICAL)
+        vbox.Add(self.summary, flag=wx.EXPAND | wx.BOTTOM, border=5)
+        vbox.Add(self.graph, proportion=1, flag=wx.EXPAND)
+        self.SetSizer(vbox)
+
+    def reset(self):
+        self.samples.clear()
+        self.last_sample = None
+        self.summary.SetLabel("")
+        self.graph.Refresh()
+
+    def update(self, values):
+        if self.last_sample is not None and values["elapsed"] > self.last_sample["elapsed"]:
+            seconds = values["elapsed"] - self.last_sample["elapsed"]
+            self.samples.append(max(values["rows"] - self.last_sample["rows"], 0) / seconds)
+        self.last_sample = values
+        rows = int(values["rows"])
+        elapsed = values["elapsed"]
+        rate = rows / elapsed if elapsed > 0 else 0
+        lines = []
+        if values["total"] >= 0:
+            remaining = max(int(values["total"]) - rows, 0)
+            eta = f"{remaining / self.samples[-1]:.0f}s" if len(self.samples) > 0 and self.samples[-1] > 0 else "-"
+            lines.append(f"Completed: {rows} / {int(values['total'])} | Remaining: {remaining} | ETA: {eta}")
+        else:
+            lines.append(f"Completed: {rows}")
+        lines.append(
+            f"Rows/s: {self.samples[-1] if len(self.samples) > 0 else 0:.1f} (avg {rate:.1f}) | Tokens/s: {(values['input_tokens'] + values['output_tokens']) / elapsed if elapsed > 0 else 0:.0f} | Requests: {int(values['requests'])} ({values['requests'] / elapsed if elapsed > 0 else 0:.1f}/s) | p50 {values['latency_p50']:.2f}s | p95 {values['latency_p95']:.2f}s"
+        )
+        lines.append(
+            f"Cost: ${values['cost']:.4f} | Input Tokens: {int(values['input_tokens'])} | Output Tokens: {int(values['output_tokens'])}"
+        )
+        lines.append(
+            f"Workers: {int(values['workers'])}/{int(values['max_workers'])} | Errors: {int(values['errors'])} | Retries: {int(values['retries'])} | Failed Rows: {int(values['failed'])}"
+        )
+        line = f"Cache Hits: {int(values['cache_hits'])} | Cache Misses: {int(values['cache_misses'])} | Duplicates: {int(values['saved_calls'])}"
+        if values["packing_saved_tokens"] > 0:
+            line += f" | Packing: ~{int(values['packing_saved_tokens'])} prompt tokens saved"
+        lines.append(line)
+        self.summary.SetLabel("\n".join(lines))
+        self.graph.Refresh()
+        self.Layout()
+
+    def on_paint(self, event):
+        dc = wx.AutoBufferedPaintDC(self.graph)
+        dc.SetBackground(wx.WHITE_BRUSH)
+        dc.Clear()
+        width, height = self.graph.GetClientSize()
+        if len(self.samples) < 2 or width <= 0 or height <= 0:
+            return
+        peak = max(max(self.samples), 1)
+        step = width / (self.samples.maxlen - 1)
+        offset = width - step * (len(self.samples) - 1)
+        points = [wx.Point(int(offset + i * step), int(height - 1 - sample / peak * (height - 15))) for i, sample in enumerate(self.samples)]
+        dc.SetPen(wx.Pen(wx.Colour(0, 120, 215), 2))
+        dc.DrawLines(points)
+        dc.SetTextForeground(wx.Colour(100, 100, 100))
+        dc.DrawText(f"{peak:.1f} rows/s", 2, 0)
+
+
+def format_sample_latency(first_tokens, latencies):
+    # median and slowest of the samples that finished
+    text = ""
+    for label, values in [("First Token", first_tokens), ("Total", latencies)]:
+        values = sorted(value for value in values if value is not None)
+        if len(values) > 0:
+            text += f" | {label}: median {values[len(values) // 2]:.2f}s, max {values[-1]:.2f}s"
+    return text
+
+
+class SampleResultsFrame(wx.Frame):
+    # Live view of streamed sample responses. Each sample's row fills in as its tokens arrive and gets
+    # its time to first token and total time when it finishes, the selected sample's whole response
+    # is shown below the list. Updates for a window that was closed are dropped.
+    def __init__(self, parent, inputs, model, max_tokens):
+        wx.Frame.__init__(self, parent, title=f"Sample Responses - {model}, max tokens {max_tokens}", size=(900, 600))
+        panel = wx.Panel(self)
+        self.inputs = inputs
+        self.responses = [""] * len(inputs)
+        self.first_tokens = [None] * len(inputs)
+        self.latencies = [None] * len(inputs)
+        self.finished = 0
+        self.selected = None
+        self.list = wx.ListCtrl(panel, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for column, (label, width) in enumerate([("Input", 220), ("Response", 400), ("First Token", 90), ("Total", 80), ("Tokens", 70)]):
+            self.list.InsertColumn(column, label, width=width)
+        for index, input in enumerate(inputs):
+            self.list.InsertItem(index, input)
+        self.list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_select)
+        self.summary = wx.StaticText(panel, label="")
+        self.detail = wx.TextCtrl(panel, style=wx.TE_MULTILINE | wx.TE_READONLY)
+        vbox = wx.BoxSizer(wx.VERTICAL)
+        vbox.Add(self.summary, flag=wx.EXPAND | wx.ALL, border=5)
+        vbox.Add(self.list, proportion=2, flag=wx.EXPAND | wx.LEFT | wx.RIGHT, border=5)
+        vbox.Add(self.detail, proportion=1, flag=wx.EXPAND | wx.ALL, border=5)
+        panel.SetSizer(vbox)
+        self.update_summary()
+        self.Show()
+
+    def on_select(self, event):
+        self.selected = event.GetIndex()
+        self.detail.SetValue(self.responses[self.selected])
+
+    def show_text(self, index, text):
+        if not self:
+            return
+        self.responses[index] = text
+        self.list.SetItem(index, 1, text.replace("\n", " "))
+        if index == self.selected:
+            self.detail.SetValue(text)
+
+    def finish(self, index, text, first_token, latency, usage):
+        if not self:
+            return
+        self.show_text(index, text)
+        self.first_tokens[index] = first_token
+        self.latencies[index] = latency
+        self.finished += 1
+        self.list.SetItem(index, 2, f"{first_token:.2f}s" if first_token is not None else "-")
+        self.list.SetItem(index, 3, f"{latency:.2f}s" if latency is not None else "-")
+        self.list.SetItem(index, 4, str(usage.completion_tokens) if usage is not None else "-")
+        self.update_summary()
+
+    def update_summary(self):
+        self.summary.SetLabel(f"Completed: {self.finished}/{len(self.inputs)}" + format_sample_latency(self.first_tokens, self.latencies))
+
+
+class MainFrame(wx.Frame):
+    def __init__(self):
+        self.dir_path = get_datadir() / "Callio"
+        self.text_font = wx.Font(12, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL)
+        
+        try:
+            os.mkdir(str(self.dir_path))
+        except FileExistsError:
+            pass
+        
+        self.file_path = str(self.dir_path  / 'config.json')
+        self.log = Log(str(self.dir_path / "log.txt"))
+
+
+        self.running_processes = []
+
+        if not os.path.isfile(self.file_path):
+            self.config = default_config.copy()
+            self.context = []  # list of dicts
+
+        else:
+            with open(self.file_path, "r") as f:
+                self.config = json.load(f)
+                self.context = self.config["context"]
+                for key in default_config.keys():
+                    if key not in self.config:
+                        self.config[key] = default_config[key]
+                delete_keys = [key for key in self.config.keys() if key not in default_config.keys()]
+                for key in delete_keys:
+                    del self.config[key]
+        self.text_boxes = dict()
+        
+        wx.Frame.__init__(self, None, title="Callio", size=self.config["frame_size"])
+        panel = wx.Panel(self)
+        self.StatusBar = self.CreateStatusBar() 
+        self.vbox = wx.BoxSizer(wx.VERTICAL)
+        # the settings scroll on their own so the buttons and the progress panel below them stay in view
+        settings = wx.ScrolledWindow(panel, style=wx.VSCROLL)
+        settings.SetScrollRate(0, 10)
+        settings.SetMinSize((-1, 200))
+        settings_box = wx.BoxSizer(wx.VERTICAL)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+        for i, key in enumerate(self.config.keys()):
+            if key == "context":
+                continue
+            if key == "sample_inputs":
+                continue
+            if key == "frame_size":
+                continue
+            hbox = wx.BoxSizer(wx.HORIZONTAL)
+
+            label = wx.StaticText(settings, label=config_display[key])
+            label.Bind(wx.EVT_LEFT_DOWN, self.show_description)
+            label.SetToolTip(
+                descriptions.get(key, "")
+            )  # set the description as tooltip
+            hbox.Add(label, flag=wx.RIGHT, border=8)
+
+            if key in ["include_headers", "keep_data", "resume", "adaptive_workers", "use_cache", "deduplicate", "stream_samples", "longest_first"]:
+                # Use a checkbox for true/false values.
+                self.text_boxes[key] = wx.CheckBox(settings)
+                # Check or uncheck the box based on the current value.
+                self.text_boxes[key].SetValue(self.config.get(key, False))
+
+            else:
+                self.text_boxes[key] = wx.TextCtrl(settings)
+                # lists are edited as json
+                self.text_boxes[key].SetValue(json.dumps(self.config[key]) if isinstance(self.config[key], list) else str(self.config[key]))
+
+            if self.text_boxes[key].GetContainingSizer() is not None:
+                self.text_boxes[key].GetContainingSizer().Detach(self.text_boxes[key])
+
+            if key == "input_file":
+                self.text_boxes[key].Bind(wx.EVT_LEFT_DOWN, self.open_file_dialog)
+            elif key == "output_file":
+                self.text_boxes[key].Bind(wx.EVT_LEFT_DOWN, self.save_file_dialog)
+            elif key == "model":
+                self.text_boxes[key].Bind(wx.EVT_LEFT_DOWN, self.choose_model)
+
+            hbox.Add(self.text_boxes[key], proportion=1)
+
+            settings_box.Add(hbox, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=10)
+
+        settings_box.AddSpacer(10)
+        settings.SetSizer(settings_box)
+        self.vbox.Add(settings, proportion=1, flag=wx.EXPAND)
+
+        self.run_button = wx.Button(panel, label="Run")
+        self.run_button.Bind(wx.EVT_BUTTON, self.run_script)
+
+        self.context_button = wx.Button(panel, label="Add Context")
+        self.context_button.Bind(wx.EVT_BUTTON, self.add_context)
+
+        self.view_context_button = wx.Button(panel, label="View / Edit Context")
+        self.view_context_button.Bind(wx.EVT_BUTTON, self.view_edit_context)
+
+        self.clear_context_button = wx.Button(panel, label="Clear Context")
+        self.clear_context_button.Bind(wx.EVT_BUTTON, self.clear_context)
+
+        self.sample_responses_button = wx.Button(panel, label="View Input / Generate Sample Responses")
+        self.sample_responses_button.Bind(wx.EVT_BUTTON, self.sample_responses)
+
+        self.estimate_button = wx.Button(panel, label="Estimate Cost / Runtime")
+        self.estimate_button.Bind(wx.EVT_BUTTON, self.estimate_job)
+
+        hbox = wx.BoxSizer(wx.HORIZONTAL)
+        hbox.Add(self.run_button, flag=wx.RIGHT, border=10)
+        hbox.Add(self.context_button, flag=wx.RIGHT, border=10)
+        hbox.Add(self.view_context_button, flag=wx.RIGHT, border=10)
+        hbox.Add(self.clear_context_button, flag=wx.RIGHT, border=10)
+
+        self.vbox.Add(hbox, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=10)
+        self.vbox.Add(self.sample_responses_button, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=10)
+        self.vbox.Add(self.estimate_button, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=10)
+
+        self.progress_panel = ProgressPanel(panel)
+        self.vbox.Add(self.progress_panel, flag=wx.EXPAND | wx.ALL, border=10)
+        #vbox.Add(self.count_text, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.TOP, border=10)
+
+        panel.SetSizer(self.vbox)
+        self.client = OpenAI(api_key="")
+        self.api_key_warning = False
+        # key checks and model lists come from here so the ui never waits on the api
+        self.keys = KeyStatusCache(self.log)
+        self.key_action = None
+        self.keys.lookup(self.config["api_key"])
+        # byte offsets into input files so previews from any row_start don't read the whole file
+        self.row_indexes = RowIndexes(self.dir_path / "row_index")
+        self.indexed_file = None
+        self.index_input_file()
+
+        self.progress = None
+
+        
+    def save_file_dialog(self, event):
+        file_dialog = wx.FileDialog(self, "Save", "", "",
+                                        "CSV files(*.csv)|*.*",
+                                        wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
+
+        if file_dialog.ShowModal() == wx.ID_CANCEL:
+            return
+
+        path = file_dialog.GetPath()
+        path += ".csv"
+        with open(path, "wb") as file:
+            writer = csv.writer(file, delimiter = ',')
+        self.text_boxes["output_file"].SetValue(path)
+
+    def disable_ui(self):
+        for key in self.text_boxes.keys():
+            self.text_boxes[key].Disable()
+        self.context_button.Disable()
+        self.view_context_button.Disable()
+        self.clear_context_button.Disable()
+        self.sample_responses_button.Disable()
+        self.estimate_button.Disable()
+
+    def enable_ui(self):
+        for key in self.text_boxes.keys():
+            self.text_boxes[key].Enable()
+        self.run_button.Enable()
+        self.context_button.Enable()
+        self.view_context_button.Enable()
+        self.clear_context_button.Enable()
+        self.sample_responses_button.Enable()
+        self.estimate_button.Enable()
+
+    def set_api_key(self):
+        self.client = OpenAI(api_key=self.config["api_key"])
+        # start checking a new key while it is still being typed into the other boxes
+        self.keys.lookup(self.config["api_key"])
+
+    def index_input_file(self):
+        if self.config["input_file"] != self.indexed_file and file_format(self.config["input_file"]) == "csv" and check_if_input_file(self.config["input_file"]):
+            self.indexed_file = self.config["input_file"]
+            self.row_indexes.prefetch(self.indexed_file)
+
+    def generate_sample_inputs(self, number):
+        input_column_data = self.row_indexes.preview(self.config["input_file"], self.config["input_columns"], self.config["row_start"], number, separator=self.config["separator"])
+        sample_inputs = ""
+        for i, input in enumerate(input_column_data):
+            sample_inputs += input + "\n"
+            if i >= number - 1:
+                break
+        return sample_inputs
+
+    def sample_responses(self, event):
+        flag = self.update_config(api_check=True, retry=lambda: self.sample_responses(event))
+        if not flag:
+            return
+        # Create a popup box for user to select if they want to paste sample inputs or generate them from file
+        dlg = wx.SingleChoiceDialog(None, 'Select Option', 'Choices', ["Write Sample Inputs", "Generate Sample Inputs From File", "View Sample Inputs"])
+        
+        if dlg.ShowModal() == wx.ID_OK:
+            selection = dlg.GetSelection()
+            
+            if selection == 0:
+                text = self.config["sample_inputs"]
+            elif selection == 1 or selection == 2: 
+                # Create a text entry for the user to specify how many
+                input_box = wx.TextEntryDialog(None, f"Enter number of sample inputs to {('read' if selection == 1 else 'view')}", style=wx.OK|wx.CANCEL,value="10")
+                if input_box.ShowModal() == wx.ID_OK:
+                    number = input_box.GetValue()
+                    try:
+                        number = int(number)
+                        if number < 1:
+                            raise ValueError("Number must be greater than 0")
+                        text = self.generate_sample_inputs(number)
+                    
+                    except ValueError as e:
+                        self.log.write(str(e))
+                        wx.MessageBox(
+                            "Invalid number", "Error", wx.OK | wx.ICON_ERROR
+                        )
+                        return
+                    
+                    except Exception as e:
+                        self.log.write(str(e))
+                        wx.MessageBox(
+                            f"Error generating sample inputs: {e}", "Error", wx.OK | wx.ICON_ERROR
+                        )
+                        return
+                else:
+                    return
+        else:
+            return
+    
+        if selection == 2:
+            wx.MessageBox(
+                text, "Sample Inputs", wx.OK | wx.RESIZE_BORDER
+            )
+            return
+        
+        input_box = wx.TextEntryDialog(None, "Paste Sample Inputs on newlines", style=wx.TE_MULTILINE|wx.RESIZE_BORDER|wx.OK|wx.CANCEL,value=text)
+        
+        if input_box.ShowModal() == wx.ID_OK:
+            self.disable_ui()
+            input_data = input_box.GetValue()
+            self.config["sample_inputs"] = input_data
+            self.save_config()
+            os.system('cls' if os.name == 'nt' else 'clear')
+            
+            # Call a separate thread to process the input
+            self.StatusBar.SetStatusText("Processing Sample Inputs")
+            if self.config["stream_samples"]:
+                inputs = [data for data in input_data.split("\n") if len(data) > 0]
+                frame = SampleResultsFrame(self, inputs, self.config["model"], self.config["max_tokens"])
+                thread = threading.Thread(target=self.stream_inputs, args=(inputs, frame))
+            else:
+                thread = threading.Thread(target=self.process_input, args=(input_data,))
+            thread.daemon = True
+            thread.start()
+        else:
+            return
+
+    def on_responses_generated(self, futures):
+        self.enable_ui()
+        self.StatusBar.SetStatusText("Responses Generated")
+        text = ""
+        for future in futures:
+            text += future + "\n"
+        wx.MessageBox(
+            text, "Sample Responses", wx.OK | wx.RESIZE_BORDER
+        )
+
+    def process_input(self, input):
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.config["max_workers"]) as executor:
+                input_data = [data for data in input.split("\n") if len(data) > 0]
+                futures = executor.map(self.sample_assistant_response, input_data)
+            wx.CallAfter(self.on_responses_generated, futures)
+        except Exception as e:
+            self.log.write(str(e))
+            raise e
+
+    def stream_inputs(self, inputs, frame):
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(self.config["max_workers"], len(inputs)))) as executor:
+                results = list(executor.map(lambda item: self.stream_sample(frame, *item), enumerate(inputs)))
+            # kept in the log so models and max tokens can be compared after the window is closed
+            first_tokens = [first_token for first_token, _ in results]
+            latencies = [latency for _, latency in results]
+            self.log.write(f"Sample Responses: {self.config['model']}, max tokens {self.config['max_tokens']}, {len(inputs)} samples" + format_sample_latency(first_tokens, latencies))
+        except Exception as e:
+            self.log.write(str(e))
+        wx.CallAfter(self.on_samples_streamed)
+
+    def stream_sample(self, frame, index, input):
+        message = [{"role": "system", "content": self.config["system_msg"]}] + self.context
+        last_update = 0
+
+        def on_text(text):
+            # a redraw per token would flood the ui thread, the finished text is always shown
+            nonlocal last_update
+            now = time.monotonic()
+            if now - last_update >= SAMPLE_REFRESH_INTERVAL:
+                last_update = now
+                wx.CallAfter(frame.show_text, index, text)
+
+        try:
+            text, first_token, latency, usage = stream_response(self.client, input, timeout=7, sleep_time=1, model=self.config["model"], context=message, temperature=self.config["temperature"], max_tokens=self.config["max_tokens"], on_text=on_text)
+        except openai.APITimeoutError:
+            self.log.write("Timeout error: Sample Assistant Response")
+            text, first_token, latency, usage = "Timeout", None, None, None
+        except Exception as e:
+            self.log.write(str(e))
+            text, first_token, latency, usage = f"Error: {e}", None, None, None
+        wx.CallAfter(frame.finish, index, text, first_token, latency, usage)
+        return first_token, latency
+
+    def on_samples_streamed(self):
+        self.enable_ui()
+        self.StatusBar.SetStatusText("Responses Generated")
+
+    def estimate_job(self, event):
+        if not self.update_config():
+            return
+        if not check_if_input_file(self.config["input_file"]):
+            wx.MessageBox(
+                "Input file does not exist or is not a csv, jsonl, parquet or arrow file. Parquet and arrow files need pyarrow installed",
+                "Error",
+                wx.OK | wx.ICON_ERROR,
+            )
+            return
+        self.disable_ui()
+        self.StatusBar.SetStatusText("Estimating Job")
+        # Tokenizing a large input takes a while, keep it off the UI thread
+        thread = threading.Thread(target=self.process_estimate, args=(dict(self.config),))
+        thread.daemon = True
+        thread.start()
+
+    def process_estimate(self, config):
+        try:
+            text = format_plan(plan_job(config))
+        except Exception as e:
+            self.log.write(str(e))
+            text = f"Error estimating job: {e}"
+        wx.CallAfter(self.on_estimate_generated, text)
+
+    def on_estimate_generated(self, text):
+        self.enable_ui()
+        self.StatusBar.SetStatusText("Estimate Generated")
+        wx.MessageBox(
+            text, "Job Estimate", wx.OK | wx.RESIZE_BORDER
+        )
+
+    def choose_model(self, event):
+        entries = self.get_model_list(retry=lambda: self.choose_model(event))
+        if entries is None:
+            return
+        if len(entries) == 0:
+            wx.MessageBox(
+                "No models found", "Error", wx.OK | wx.ICON_ERROR
+            )
+        else:
+            dlg = wx.SingleChoiceDialog(None, 'Select Model', 'Choices', entries)
+            if dlg.ShowModal() == wx.ID_OK:
+                selection = dlg.GetSelection()
+                self.text_boxes["model"].SetValue(entries[selection])
+
+    def get_model_list(self, retry=None):
+        # the models come with the key check, None while the key is still being checked
+        flag = self.update_config(api_check=True, retry=retry)
+        if not flag:
+            return None
+        return self.keys.lookup(self.config["api_key"])["models"]
+
+    def sample_assistant_response(self, input):
+        message = [{"role": "system", "content": self.config["system_msg"]}] + self.context
+        try:
+            open_response = response(self.client, input, timeout = 7, sleep_time = 1, model=self.config["model"], context=message, temperature=self.config["temperature"], max_tokens = self.config["max_tokens"])
+            open_response = open_response.choices[0].message.content
+        except openai.APITimeoutError:
+            self.log.write("Timeout error: Sample Assistant Response")
+            open_response = "Timeout"
+        except Exception as e:
+            wx.MessageBox(
+                f"Error: {e}", "Error", wx.OK | wx.ICON_ERROR
+            )
+            self.log.write(str(e))
+            open_response = f"Error: {e}"
+        return open_response
+
+    def open_file_dialog(self, event):
+            file_dialog = wx.FileDialog(self, "Open", "", "",
+                                        "All Files (*.*)|*.*",
+                                        wx.FD_OPEN | wx.FD_FILE_MUST_EXIST)
+
+            if file_dialog.ShowModal() == wx.ID_CANCEL:
+                return
+
+            path = file_dialog.GetPath()
+            self.text_boxes["input_file"].SetValue(path)
+    
+
+    def cancel_script(self, event):
+        # ask the job to stop, it writes the completed rows and exits on its own
+        self.progress.request_cancel()
+        self.main_process_cancelled = True
+        self.cancel_time = time.monotonic()
+        self.run_button.Disable()
+        self.StatusBar.SetStatusText("Cancelling Job, waiting for requests in flight")
+
+    def terminate_processes(self):
+        for process in self.running_processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for child in multiprocessing.active_children():
+            child.terminate()
+            child.join()
+
+    def process_timer(self, event):
+        try:
+            values, message = self.progress.read()
+            if self.main_process_cancelled and self.main_process.is_alive():
+                # calls abandoned by the cancel can keep the process alive after the job has finished,
+                # give up on a job that doesn't finish well after its cancel timeout and the task timeout
+                # it gives those calls to reach the journal
+                if values["finished"] or time.monotonic() - self.cancel_time > self.config["cancel_timeout"] + self.config["task_timeout"] + 30:
+                    self.terminate_processes()
+            if not self.main_process.is_alive():
+                self.enable_ui()
+                self.main_process.close()
+                self.run_button.SetLabel("Run")
+                self.run_button.Bind(wx.EVT_BUTTON, self.run_script)
+                self.progress_panel.update(values)
+                if not values["finished"]:
+                    self.StatusBar.SetStatusText("Job Cancelled" if self.main_process_cancelled else "Job Stopped, see log")
+                elif self.main_process_cancelled:
+                    self.StatusBar.SetStatusText(f"Job Cancelled, completed rows written, {int(values['skipped'])} rows left out")
+                else:
+                    self.StatusBar.SetStatusText("Job Complete")
+                if self.main_process in self.running_processes:
+                    self.running_processes.remove(self.main_process)
+                self.timer_process.Stop()
+            else:
+                self.progress_panel.update(values)
+                self.StatusBar.SetStatusText(message or "Running Job")
+        except ValueError:
+            self.timer_process.Stop()
+    def on_close(self, event):
+        # Save config file
+        self.save_config()
+
+        if wx.MessageBox("Are you sure you want to Exit?", "Confirm", wx.YES_NO | wx.NO_DEFAULT | wx.ICON_QUESTION) == wx.YES:
+            # Terminate and close the main processes
+            for process in self.running_processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()  # Wait for the process to finish before proceeding
+                    process.close()
+
+            # Terminate and close any remaining child processes
+            for child in multiprocessing.active_children():
+                child.terminate()
+                child.join()
+                child.close()
+
+            self.Destroy()
+        else:
+            event.Veto()
+ 
+    def clear_context(self, event):
+        self.context = []
+
+
+    def view_edit_context(self, event, temp_context = None):
+        if len(self.context) == 0:
+            message = ""
+        else:
+            message = json.dumps(self.context, indent=4)
+            if temp_context is None:
+                temp_context = message
+        input_box = wx.TextEntryDialog(None, "Edit Context", style= wx.TE_MULTILINE|wx.RESIZE_BORDER|wx.OK|wx.CANCEL,value=temp_context)
+        if input_box.ShowModal() == wx.ID_OK:
+            valid_context = []
+            message = input_box.GetValue()
+            temp_context = message
+            if is_valid_json(message):
+                self.context = json.loads(message)
+                self.update_config()
+            else:
+                wx.MessageBox(
+                    f"Invalid context: {message}", "Error", wx.OK | wx.ICON_ERROR
+                )
+                self.view_edit_context(event, temp_context = temp_context)
+
+    def show_description(self, event):
+        label = event.GetEventObject()
+        description = label.GetToolTip().GetTip()
+        wx.MessageBox(description, "Description", wx.OK | wx.ICON_INFORMATION)
+
+
+    def add_context(self, event):
+        if not self.update_config(api_check=True, retry=lambda: self.add_context(event)):
+            return
+        entries = ["User", "Assistant"]
+        dlg = wx.MultiChoiceDialog(None, 'Select Role', 'Choices', entries)
+
+        if dlg.ShowModal() == wx.ID_OK:
+            selections = dlg.GetSelections()
+
+            for idx in selections:
+                role = entries[idx]
+
+                default = ""
+                # Add additional button for 'Assistant'
+                if role == "Assistant":
+                    self.disable_ui()
+                    self.StatusBar.SetStatusText("Generating Sample Assistant Response")
+                    response = self.sample_assistant_response("")
+                    self.enable_ui()
+                    default = response
+                    self.StatusBar.SetStatusText("Sample Assistant Response Generated")
+                dialog = wx.TextEntryDialog(None, "Enter text for: " + role, style = wx.TE_MULTILINE|wx.RESIZE_BORDER|wx.OK|wx.CANCEL, value=default)
+
+
+                if dialog.ShowModal() == wx.ID_OK:
+                    self.context.append({"role": role.lower(), "content": dialog.GetValue()})
+
+
+
+
+    def check_api_key(self, retry=None):
+        # answers from the key cache, a key that hasn't been checked yet is checked in the background
+        # and retry is run once it turns out valid. Only the latest action waits for the check
+        self.key_action = retry
+        entry = self.keys.lookup(self.config["api_key"], callback=lambda entry: wx.CallAfter(self.on_api_key_checked, entry))
+        if entry is None:
+            self.StatusBar.SetStatusText("Checking API Key")
+            return False
+        if not entry["valid"]:
+            wx.MessageBox("API Key Invalid or Check Connection", "Error", wx.OK | wx.ICON_ERROR)
+            return False
+        self.key_action = None
+        return True
+
+    def on_api_key_checked(self, entry):
+        action = self.key_action
+        self.key_action = None
+        if action is None:
+            # another click waiting on the same check already handled it
+            return
+        if not entry["valid"]:
+            self.StatusBar.SetStatusText("API Key Invalid")
+            wx.MessageBox("API Key Invalid or Check Connection", "Error", wx.OK | wx.ICON_ERROR)
+            return
+        self.StatusBar.SetStatusText("API Key Valid")
+        if action is not None:
+            action()
+
+    def save_config(self,api_check=False, retry=None):
+        flag = self.update_config(api_check, retry)
+        with open(self.file_path, "w") as f:
+            json.dump(self.config, f)
+        return flag
+           
+    def update_config(self, api_check=False, retry=None):
+        # update config file
+        flag = True
+
+
+
+        for key in self.config.keys():
+            if key == "context":
+                continue
+            if key == "sample_inputs":
+                continue
+            if key == "frame_size":
+                size = self.GetSize()
+                self.config["frame_size"] = (size[0], size[1])
+                continue
+            value = self.text_boxes[key].GetValue()
+            try:
+                if isinstance(self.config[key], int):
+                    value = int(value)
+                elif isinstance(self.config[key], float):
+                    value = float(value)
+                elif isinstance(self.config[key], list):
+                    value = json.loads(value) if len(value.strip()) > 0 else []
+                    if not isinstance(value, list):
+                        raise ValueError("expected a json list")
+            except ValueError as e:
+                # the setting keeps its last good value and nothing runs until it is fixed
+                wx.MessageBox(
+                    f"Invalid {config_display[key]}: {e}", "Error", wx.OK | wx.ICON_ERROR
+                )
+                flag = False
+                continue
+
+            self.config[key] = value
+        self.config["context"] = self.context
+        if not flag:
+            return False
+
+        if not self.client.api_key == self.config["api_key"]:
+            self.set_api_key()
+        self.index_input_file()
+        
+        if api_check:
+            return self.check_api_key(retry)
+        return True
+
+    def run_script(self, event):
+        flag = self.save_config(api_check=True, retry=lambda: self.run_script(event))
+        if not flag:
+            return
+        os.system('cls' if os.name == 'nt' else 'clear')
+        if not check_if_input_file(self.config["input_file"]):
+            wx.MessageBox(
+                "Input file does not exist or is not a csv, jsonl, parquet or arrow file. Parquet and arrow files need pyarrow installed",
+                "Error",
+                wx.OK | wx.ICON_ERROR,
+            )
+            return
+        try:
+            check_if_output_file(self.config["output_file"])
+        except Exception as e:
+            self.log.write(str(e))
+            wx.MessageBox(
+                f"Job Error: {e}",
+                "Error",
+                wx.OK | wx.ICON_ERROR,
+            )
+            return
+        try:
+            self.disable_ui()
+            self.StatusBar.SetStatusText("Started Job")
+            self.progress = Progress()
+            self.progress_panel.reset()
+            self.main_process = multiprocessing.Process(target=call_job, args=(self.config, self.log.log_path, self.progress))
+            self.main_process.start()
+            self.main_process_cancelled = False
+            self.running_processes.append(self.main_process)
+            self.run_button.SetLabel("Cancel")
+            self.run_button.Bind(wx.EVT_BUTTON, self.cancel_script)
+            self.timer_process = wx.Timer(self)
+            self.Bind(wx.EVT_TIMER, self.process_timer, self.timer_process)
+            # sampling the shared progress is cheap, refresh the panel twice a second
+            self.timer_process.Start(500)
+        except Exception as e:
+            self.log.write(f"Job Runtime Error: {e}")
+            self.enable_ui()
+            self.StatusBar.SetStatusText("Job Runtime Error")
+            wx.MessageBox(
+                f"A runtime error occured: {e}",
+                "Error",
+                wx.OK | wx.ICON_ERROR,
+            )
+            return
+        return
+
+def call_job(config, log, progress):
+    try:
+        main(config, log, progress, fake=False, error=True)
+    except Exception as e:
+        raise e
+    return
+
+
+def APPmain():
+    app = wx.App(False)
+    frame = MainFrame()
+    frame.Show()
+    app.MainLoop()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    APPmain()
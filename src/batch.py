@@ -0,0 +1,122 @@
+import json
+import os
+
+
+# limits of a single batch input file
+BATCH_MAX_REQUESTS = 50000
+BATCH_MAX_BYTES = 190 * 1024 * 1024
+
+FINISHED_STATUSES = ["completed", "failed", "expired", "cancelled"]
+
+
+class BatchRunner:
+    # Runs chat completions through the OpenAI Batch API. Requests are written to jsonl files in
+    # work_dir, split at the request and size limits, uploaded and polled until every batch is done.
+    # The batch ids are saved in work_dir so a restarted job picks up its batches instead of paying
+    # for them again.
+    def __init__(self, client, work_dir, fingerprint, log, progress, poll_interval=60):
+        self.client = client
+        self.work_dir = work_dir
+        self.fingerprint = fingerprint
+        self.log = log
+        self.progress = progress
+        self.poll_interval = poll_interval
+        self.state_path = os.path.join(work_dir, "batches.json")
+        self.part = None
+        self.parts = []
+        self.failed = 0
+        os.makedirs(work_dir, exist_ok=True)
+
+    def load_batches(self):
+        if not os.path.isfile(self.state_path):
+            return []
+        with open(self.state_path, "r") as state_file:
+            state = json.load(state_file)
+        if state.get("fingerprint") != self.fingerprint:
+            return []
+        return state["batches"]
+
+    def save_batches(self, batch_ids):
+        with open(self.state_path, "w") as state_file:
+            json.dump({"fingerprint": self.fingerprint, "batches": batch_ids}, state_file)
+
+    def new_part(self):
+        self.close_part()
+        path = os.path.join(self.work_dir, f"requests-{len(self.parts) + 1:04d}.jsonl")
+        self.part = {"path": path, "file": open(path, "w", encoding="utf-8"), "requests": 0, "bytes": 0}
+        self.parts.append(path)
+
+    def close_part(self):
+        if self.part is not None:
+            self.part["file"].close()
+            self.part = None
+
+    def add_request(self, custom_id, body):
+        line = json.dumps({"custom_id": str(custom_id), "method": "POST", "url": "/v1/chat/completions", "body": body}) + "\n"
+        size = len(line.encode("utf-8"))
+        if self.part is None or self.part["requests"] >= BATCH_MAX_REQUESTS or self.part["bytes"] + size > BATCH_MAX_BYTES:
+            self.new_part()
+        self.part["file"].write(line)
+        self.part["requests"] += 1
+        self.part["bytes"] += size
+
+    def submit(self):
+        self.close_part()
+        batch_ids = []
+        for path in self.parts:
+            with open(path, "rb") as part_file:
+                uploaded = self.client.files.create(file=part_file, purpose="batch")
+            batch = self.client.batches.create(input_file_id=uploaded.id, endpoint="/v1/chat/completions", completion_window="24h")
+            self.log.write(f"Submitted batch {batch.id} for {path}")
+            batch_ids.append(batch.id)
+        self.save_batches(batch_ids)
+        return batch_ids
+
+    def wait(self, batch_ids):
+        while True:
+            batches = [self.client.batches.retrieve(batch_id) for batch_id in batch_ids]
+            finished = [batch for batch in batches if batch.status in FINISHED_STATUSES]
+            completed = sum(batch.request_counts.completed for batch in batches if batch.request_counts is not None)
+            total = sum(batch.request_counts.total for batch in batches if batch.request_counts is not None)
+            self.progress.publish(message=f"Batches Finished: {len(finished)}/{len(batches)} | Requests Completed: {completed}/{total}")
+            if len(finished) == len(batches):
+                return batches
+            # returns None when the job is cancelled, the batches are left running and stay saved
+            if self.progress.wait_for_cancel(self.poll_interval):
+                return None
+
+    def results(self, batches):
+        # yields (custom_id, output, prompt_tokens, completion_tokens) for every successful request
+        for batch in batches:
+            if batch.status != "completed":
+                self.log.write(f"Batch {batch.id} finished with status {batch.status}")
+            if batch.error_file_id is not None:
+                for line in self.client.files.content(batch.error_file_id).text.splitlines():
+                    if len(line.strip()) > 0:
+                        self.failed += 1
+                        self.log.write(f"Batch request failed: {line}")
+            if batch.output_file_id is None:
+                continue
+            for line in self.client.files.content(batch.output_file_id).text.splitlines():
+                if len(line.strip()) == 0:
+                    continue
+                result = json.loads(line)
+                body = (result.get("response") or {}).get("body") or {}
+                if result.get("error") is not None or "choices" not in body:
+                    self.failed += 1
+                    self.log.write(f"Batch request failed: {line}")
+                    continue
+                usage = body.get("usage") or {}
+                yield result["custom_id"], body["choices"][0]["message"]["content"], usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+    def remove(self):
+        self.close_part()
+        # a resumed run didn't write the request files itself, so they are found by name
+        parts = [os.path.join(self.work_dir, name) for name in os.listdir(self.work_dir) if name.startswith("requests-")]
+        for path in parts + [self.state_path]:
+            if os.path.isfile(path):
+                os.remove(path)
+        try:
+            os.rmdir(self.work_dir)
+        except OSError:
+            pass
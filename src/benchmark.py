@@ -0,0 +1,201 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from mockserver import MockOpenAIServer
+
+
+# job settings shared by every run, the cache and deduplication are off so every row is a request
+BENCHMARK_CONFIG = {
+    "api_key": "mock",
+    "include_headers": True,
+    "keep_data": True,
+    "model": "gpt-3.5-turbo",
+    "input_cost": 0.0015,
+    "output_cost": 0.002,
+    "max_tokens": 30,
+    "temperature": 0.9,
+    "task_timeout": 20,
+    "sleep_time": 1,
+    "input_columns": "2",
+    "output_column": 2,
+    "row_start": "start",
+    "row_end": "end",
+    "separator": " - ",
+    "system_msg": "You are a helpful assistant",
+    "context": [],
+    "resume": False,
+    "use_cache": False,
+    "deduplicate": False,
+    "adaptive_workers": False,
+}
+
+# a drop in rows per second past this share of the baseline is reported as a regression
+REGRESSION_TOLERANCE = 0.1
+
+
+def make_input(file_name, rows, seed=0):
+    generator = random.Random(seed)
+    words = ["amethyst", "emerald", "cut", "carats", "purple", "deep", "color", "fine", "gemstone", "oval", "mm"]
+    with open(file_name, "w", newline="") as input_file:
+        writer = csv.writer(input_file)
+        writer.writerow(["id", "name"])
+        for index in range(rows):
+            writer.writerow([index, " ".join(generator.choice(words) for _ in range(generator.randint(5, 40)))])
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_case_job(config, log_path, result_path, base_url):
+    # runs in its own process so peak memory is the job's alone
+    os.environ["OPENAI_BASE_URL"] = base_url
+    from job import create_job
+    job = create_job(config, log_path, console=False)
+    job.main()
+    summary = job.summary()
+    summary["peak_rss_mb"] = peak_rss_mb()
+    with open(result_path, "w") as result_file:
+        json.dump(summary, result_file)
+
+
+def run_case(server, directory, rows, workers, engine, extra_config=None):
+    input_file = os.path.join(directory, f"input-{rows}.csv")
+    if not os.path.isfile(input_file):
+        make_input(input_file, rows)
+    name = f"{engine}-{rows}-{workers}"
+    config = dict(BENCHMARK_CONFIG)
+    config.update({
+        "input_file": input_file,
+        "output_file": os.path.join(directory, f"output-{name}.csv"),
+        "cache_file": os.path.join(directory, "cache.sqlite"),
+        "max_workers": workers,
+        "engine": engine,
+    })
+    config.update(extra_config or {})
+    result_path = os.path.join(directory, f"result-{name}.json")
+    before = server.stats()
+    process = multiprocessing.Process(target=run_case_job, args=(config, os.path.join(directory, "log.txt"), result_path, server.url))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise Exception(f"Benchmark job {name} stopped with exit code {process.exitcode}, see {directory}/log.txt")
+    with open(result_path, "r") as result_file:
+        summary = json.load(result_file)
+    served = {key: value - before[key] for key, value in server.stats().items()}
+    requests = summary["requests"]
+    return {
+        "engine": engine,
+        "rows": rows,
+        "max_workers": workers,
+        "rows_per_second": round(summary["rows"] / summary["elapsed_seconds"], 2) if summary["elapsed_seconds"] > 0 else 0,
+        "elapsed_seconds": summary["elapsed_seconds"],
+        "p50_latency": summary.get("latency_seconds", {}).get("p50"),
+        "p99_latency": summary.get("latency_seconds", {}).get("p99"),
+        "peak_rss_mb": summary["peak_rss_mb"],
+        "requests": requests,
+        "retries": summary["retries"],
+        "retry_overhead": round(summary["retries"] / requests, 4) if requests > 0 else 0,
+        "backoff_seconds": summary["backoff_seconds"],
+        "failed_rows": summary["failed_rows"],
+        "served": served,
+    }
+
+
+def format_result(result):
+    return (
+        f"{result['engine']:>6} rows {result['rows']:>7} workers {result['max_workers']:>5} | {result['rows_per_second']:>8.1f} rows/s"
+        f" | p99 {result['p99_latency'] or 0:.3f}s | rss {result['peak_rss_mb'] or 0:.0f} MB | retries {result['retries']} ({result['retry_overhead']:.1%})"
+        f" | failed {result['failed_rows']}"
+    )
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    # returns a line for every case that got slower than the baseline by more than tolerance
+    previous = {(result["engine"], result["rows"], result["max_workers"]): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result["engine"], result["rows"], result["max_workers"]))
+        if old is None or old["rows_per_second"] <= 0:
+            continue
+        change = result["rows_per_second"] / old["rows_per_second"] - 1
+        if change < -tolerance:
+            regressions.append(f"{result['engine']} rows {result['rows']} workers {result['max_workers']}: {old['rows_per_second']} -> {result['rows_per_second']} rows/s ({change:.1%})")
+    return regressions
+
+
+def parse_list(value, kind=int):
+    return [kind(item) for item in value.split(",") if len(item) > 0]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the job runner against a local mock of the OpenAI api. Every combination of rows, workers and engine is run as its own job.")
+    parser.add_argument("--rows", type=parse_list, default=[1000], help="input sizes, comma separated")
+    parser.add_argument("--workers", type=parse_list, default=[10, 50, 200], help="max_workers values, comma separated")
+    parser.add_argument("--engines", type=lambda value: parse_list(value, str), default=["thread", "async"], help="engines, comma separated")
+    parser.add_argument("--latency", type=float, default=0.2, help="median seconds per request")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="spread of the lognormal latency, 0 for a constant latency")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests held past the job's task_timeout")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a job setting, VALUE is read as JSON when it parses")
+    parser.add_argument("--output", default=None, help="write the results to this json file")
+    parser.add_argument("--baseline", default=None, help="results json of an earlier run to compare rows per second against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="slowdown against the baseline that counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    extra_config = dict()
+    for override in args.set:
+        key, _, value = override.partition("=")
+        try:
+            extra_config[key] = json.loads(value)
+        except ValueError:
+            extra_config[key] = value
+    # a held request outlasts the job's timeout so the client gives up on it first
+    timeout_seconds = extra_config.get("task_timeout", BENCHMARK_CONFIG["task_timeout"]) + 5
+    server = MockOpenAIServer(latency=args.latency, latency_sigma=args.latency_sigma, rate_limit_rate=args.rate_limit_rate,
+                              server_error_rate=args.server_error_rate, timeout_rate=args.timeout_rate, timeout_seconds=timeout_seconds, seed=0).start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for rows, workers, engine in itertools.product(args.rows, args.workers, args.engines):
+                result = run_case(server, directory, rows, workers, engine, extra_config)
+                results.append(result)
+                print(format_result(result))
+    finally:
+        server.stop()
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+    if args.baseline is not None:
+        with open(args.baseline, "r") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression)
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import collections
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+import os
+
+
+def cache_key(model, messages, temperature, max_tokens, top_p=1):
+    data = json.dumps([model, messages, temperature, max_tokens, top_p], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    # Responses stored on disk in sqlite, keyed by cache_key. Once the stored responses grow past
+    # max_size bytes the least recently used ones are evicted down to 90% of it.
+    def __init__(self, path, max_size=512 * 1024 * 1024):
+        self.path = str(path)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, output TEXT, prompt_tokens INTEGER, completion_tokens INTEGER, size INTEGER, last_used REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        # returns (output, prompt_tokens, completion_tokens) or None
+        with self.lock:
+            row = self.connection.execute("SELECT output, prompt_tokens, completion_tokens FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+            return row
+
+    def put(self, key, output, prompt_tokens, completion_tokens):
+        size = len(key) + len(output.encode("utf-8"))
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if previous is not None:
+                self.size -= previous[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, output, prompt_tokens, completion_tokens, size, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, output, prompt_tokens, completion_tokens, size, time.time()),
+            )
+            self.size += size
+            if self.size > self.max_size:
+                self.evict(int(self.max_size * 0.9))
+            self.connection.commit()
+
+    def evict(self, target_size):
+        rows = self.connection.execute("SELECT key, size FROM responses ORDER BY last_used")
+        evicted = []
+        for key, size in rows:
+            if self.size <= target_size:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def status(self):
+        return f"Cache: {self.hits} hits / {self.misses} misses"
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class RecentOutputs:
+    # Outputs of the most recently seen distinct inputs, keyed by a digest of the input, for
+    # deduplication within a job. Only max_entries are held so memory doesn't grow with the number of
+    # distinct inputs, a duplicate of an input that has aged out is looked up like any other row.
+    # Used from the dispatching thread only.
+    def __init__(self, max_entries=10000):
+        self.max_entries = max(1, max_entries)
+        self.outputs = collections.OrderedDict()
+
+    def get(self, input):
+        key = hashlib.sha256(input.encode("utf-8")).digest()
+        output = self.outputs.get(key)
+        if output is not None:
+            self.outputs.move_to_end(key)
+        return output
+
+    def put(self, input, output):
+        key = hashlib.sha256(input.encode("utf-8")).digest()
+        self.outputs[key] = output
+        self.outputs.move_to_end(key)
+        if len(self.outputs) > self.max_entries:
+            self.outputs.popitem(last=False)
@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+
+from datadir import get_datadir
+from log import Log
+from progress import Progress
+
+
+# exit codes, so a scheduler can tell a finished job from one that needs another run
+EXIT_COMPLETE = 0
+EXIT_ERROR = 1
+EXIT_FAILED_ROWS = 2
+EXIT_CANCELLED = 3
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run a Callio job without the GUI. Progress goes to stderr and the job stats are printed to stdout as JSON when it ends.")
+    parser.add_argument("config", nargs="?", default=str(get_datadir() / "Callio" / "config.json"), help="config.json saved by the GUI, defaults to the GUI's own")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a config value, VALUE is read as JSON when it parses, e.g. --set max_workers=100")
+    parser.add_argument("--log", default=None, help="log file, defaults to log.txt next to the GUI's config")
+    parser.add_argument("--interval", type=float, default=None, help="seconds between progress lines, defaults to 1 on a terminal and 10 otherwise")
+    parser.add_argument("--quiet", action="store_true", help="don't report progress")
+    parser.add_argument("--plan", action="store_true", help="print the pre-flight estimate instead of running the job")
+    return parser.parse_args(argv)
+
+
+def load_config(path, overrides):
+    with open(path, "r") as config_file:
+        config = json.load(config_file)
+    for override in overrides:
+        key, separator, value = override.partition("=")
+        if separator == "":
+            raise ValueError(f"Override must be KEY=VALUE: {override}")
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+
+def format_progress(values, message):
+    rows = int(values["rows"])
+    elapsed = values["elapsed"]
+    line = f"Completed: {rows}"
+    if values["total"] >= 0:
+        line += f"/{int(values['total'])}"
+    line += f" | {rows / elapsed if elapsed > 0 else 0:.1f} rows/s | Cost: ${values['cost']:.4f} | Tokens: {int(values['input_tokens'] + values['output_tokens'])}"
+    if values["errors"] > 0 or values["retries"] > 0:
+        line += f" | Errors: {int(values['errors'])} | Retries: {int(values['retries'])}"
+    if len(message) > 0:
+        line += f" | {message}"
+    return line
+
+
+def report_progress(progress, interval, stop):
+    # samples the shared progress like the GUI does, a terminal gets one line rewritten in place
+    terminal = sys.stderr.isatty()
+    while not stop.wait(interval):
+        line = format_progress(*progress.read())
+        sys.stderr.write(f"\r{line}\033[K" if terminal else line + "\n")
+        sys.stderr.flush()
+    if terminal:
+        sys.stderr.write("\n")
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        config = load_config(args.config, args.set)
+    except (OSError, ValueError) as error:
+        sys.stderr.write(f"Could not load config {args.config}: {error}\n")
+        return EXIT_ERROR
+
+    if args.plan:
+        from planner import plan_job
+        print(json.dumps(plan_job(config), indent=4))
+        return EXIT_COMPLETE
+
+    # openai is most of the start up time, only pay for it once the arguments are good
+    from job import create_job
+
+    log_path = args.log or str(get_datadir() / "Callio" / "log.txt")
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    progress = Progress()
+
+    def cancel(signum, frame):
+        if progress.cancel_requested():
+            sys.stderr.write("\nStopping now\n")
+            os._exit(EXIT_CANCELLED)
+        sys.stderr.write("\nCancelling, writing completed rows. Interrupt again to stop now\n")
+        progress.request_cancel()
+
+    signal.signal(signal.SIGINT, cancel)
+    signal.signal(signal.SIGTERM, cancel)
+
+    stop = threading.Event()
+    if not args.quiet:
+        interval = args.interval or (1 if sys.stderr.isatty() else 10)
+        threading.Thread(target=report_progress, args=(progress, interval, stop), daemon=True).start()
+
+    try:
+        job = create_job(config, log_path, progress, console=False)
+        job.main()
+    except Exception as error:
+        stop.set()
+        Log(log_path).write(f"Job Runtime Error: {error}")
+        sys.stderr.write(f"Job Error: {error}\n")
+        return EXIT_ERROR
+    stop.set()
+
+    print(json.dumps(job.summary(), indent=4))
+    if job.cancelled:
+        # calls abandoned by the cancel would hold the interpreter open until they time out
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(EXIT_CANCELLED)
+    return EXIT_FAILED_ROWS if job.failed > 0 else EXIT_COMPLETE
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import math
+import threading
+import time
+import urllib.parse
+
+import openai
+from openai import OpenAI, AsyncOpenAI
+
+from metrics import Counter
+from ratelimit import RateLimiter
+from retry import classify_error, retry_after
+
+
+# seconds a member sits out after a 429 that didn't say how long to wait
+RATE_LIMIT_COOLDOWN = 5
+# failures in a row before a member sits out, and how long the first time, doubling up to the max
+FAILURE_LIMIT = 3
+FAILURE_COOLDOWN = 5
+MAX_FAILURE_COOLDOWN = 120
+
+# errors that take a member out for the rest of the job: a rejected key, or one out of credit
+MEMBER_ERRORS = (openai.AuthenticationError, openai.PermissionDeniedError, openai.RateLimitError)
+
+
+def member_error(error):
+    return classify_error(error) is None and isinstance(error, MEMBER_ERRORS)
+
+
+class PoolMember:
+    # One api key at one endpoint, with its own share of the traffic, its own rate limits and its own
+    # counts for the summary
+    def __init__(self, entry, api_key, model):
+        self.base_url = entry.get("base_url") or None
+        self.api_key = entry.get("api_key") or api_key
+        self.weight = max(entry.get("weight", 1), 0)
+        # a name for the summary and log that doesn't give the key away
+        host = urllib.parse.urlparse(self.base_url).netloc if self.base_url is not None else "api.openai.com"
+        self.name = entry.get("name") or f"{host} ...{self.api_key[-4:]}"
+        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        self.async_client = None
+        self.limiter = RateLimiter(entry.get("rpm_limit", 0), entry.get("tpm_limit", 0), model)
+        self.current = 0
+        self.available_at = 0
+        self.failures = 0
+        self.cooldowns = 0
+        self.disabled = None
+        self.requests = Counter()
+        self.errors = Counter()
+        self.prompt_tokens = Counter()
+        self.completion_tokens = Counter()
+
+
+class ClientPool:
+    # Spreads requests over several api keys and OpenAI compatible endpoints by weight, with smooth
+    # weighted round robin so each member's share is even over short stretches too. A member that is
+    # rate limited sits out for as long as it was asked to, one that keeps failing sits out for a
+    # growing while, and one whose key is rejected or out of credit is dropped for the rest of the job.
+    # When every member is out the one back soonest is used anyway and the retry policy does the waiting.
+    def __init__(self, entries, api_key, model, log=None):
+        self.members = [PoolMember(entry, api_key, model) for entry in (entries or [{}])]
+        self.log = log
+        self.lock = threading.Lock()
+
+    @property
+    def client(self):
+        # for the calls that aren't spread, like the batch api
+        return self.members[0].client
+
+    def open_async(self):
+        for member in self.members:
+            member.async_client = AsyncOpenAI(api_key=member.api_key, base_url=member.base_url, max_retries=0)
+
+    async def close_async(self):
+        for member in self.members:
+            if member.async_client is not None:
+                await member.async_client.close()
+                member.async_client = None
+
+    def choose(self):
+        now = time.monotonic()
+        with self.lock:
+            available = [member for member in self.members if member.available_at <= now and member.weight > 0]
+            if len(available) == 0:
+                return min(self.members, key=lambda member: member.available_at)
+            total = sum(member.weight for member in available)
+            for member in available:
+                member.current += member.weight
+            chosen = max(available, key=lambda member: member.current)
+            chosen.current -= total
+            return chosen
+
+    def record_success(self, member, usage):
+        member.requests.add()
+        member.prompt_tokens.add(usage.prompt_tokens)
+        member.completion_tokens.add(usage.completion_tokens)
+        with self.lock:
+            member.failures = 0
+
+    def record_failure(self, member, error):
+        member.errors.add()
+        reason = classify_error(error)
+        now = time.monotonic()
+        with self.lock:
+            if member_error(error):
+                # a rejected key or one out of credit won't come back during the job
+                if member.disabled is None:
+                    member.disabled = type(error).__name__
+                    member.available_at = math.inf
+                    self.write_log(f"Client {member.name} taken out of the pool: {error}")
+                return
+            if reason == "rate_limit":
+                wait = retry_after(error)
+                member.available_at = max(member.available_at, now + (wait if wait is not None else RATE_LIMIT_COOLDOWN))
+                return
+            if reason is None:
+                # the request was at fault, not the member
+                return
+            member.failures += 1
+            if member.failures >= FAILURE_LIMIT:
+                member.failures = 0
+                member.cooldowns += 1
+                wait = min(MAX_FAILURE_COOLDOWN, FAILURE_COOLDOWN * 2 ** (member.cooldowns - 1))
+                member.available_at = max(member.available_at, now + wait)
+                self.write_log(f"Client {member.name} failing, out of the pool for {wait}s: {error}")
+
+    def failover(self, error):
+        # True when error took its member out and another member can take the request instead, the
+        # retry then costs neither an attempt nor the retry budget. With every member out the error stands
+        if not member_error(error):
+            return False
+        with self.lock:
+            return any(member.disabled is None for member in self.members)
+
+    def write_log(self, message):
+        if self.log is not None:
+            self.log.write(message)
+
+    def summary(self, input_cost, output_cost, cost_multiplier=1):
+        summary = []
+        for member in self.members:
+            summary.append({
+                "name": member.name,
+                "weight": member.weight,
+                "requests": member.requests.value,
+                "errors": member.errors.value,
+                "prompt_tokens": member.prompt_tokens.value,
+                "completion_tokens": member.completion_tokens.value,
+                "cost": round((input_cost * member.prompt_tokens.value / 1000 + output_cost * member.completion_tokens.value / 1000) * cost_multiplier, 6),
+                "disabled": member.disabled,
+            })
+        return summary
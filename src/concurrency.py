@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+
+class Cancelled(Exception):
+    # raised to a request still waiting for a slot once the limit is closed, it was never sent
+    pass
+
+
+class AdaptiveConcurrency:
+    # AIMD limit on how many requests may be in flight at once, max_workers is the upper bound.
+    # Starts small and doubles every round trip (slow start) until the first sign of congestion,
+    # after that it grows by one per round trip. 429s and timeouts halve the limit, recent latency
+    # well above the long run average trims it by 10%, at most once per round trip so one burst of
+    # errors counts once. With adaptive off the limit just stays at max_limit. Once closed, requests
+    # waiting for a slot get Cancelled instead.
+    def __init__(self, max_limit, adaptive=True, initial_limit=10, min_limit=1, latency_tolerance=2.0, decrease_factor=0.5, latency_decrease_factor=0.9, warmup=20, cooldown=2):
+        self.max_limit = max_limit
+        self.adaptive = adaptive
+        self.min_limit = min_limit
+        self.limit = float(min(initial_limit, max_limit) if adaptive else max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.latency_decrease_factor = latency_decrease_factor
+        self.warmup = warmup
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self.slow_start = True
+        self.samples = 0
+        self.latency = None
+        self.baseline_latency = None
+        self.last_decrease = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.async_condition = None
+
+    @property
+    def current(self):
+        return max(self.min_limit, int(self.limit))
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.current and not self.closed:
+                self.condition.wait(timeout=1)
+            if self.closed:
+                raise Cancelled()
+            self.in_flight += 1
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def backoff(self, seconds):
+        # sleeps out a retry backoff, cut short once closed so the retry gives up straight away
+        with self.condition:
+            self.condition.wait_for(lambda: self.closed, timeout=seconds)
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    async def acquire_async(self):
+        if self.async_condition is None:
+            self.async_condition = asyncio.Condition()
+        async with self.async_condition:
+            await self.async_condition.wait_for(lambda: self.in_flight < self.current or self.closed)
+            if self.closed:
+                raise Cancelled()
+            self.in_flight += 1
+
+    async def wake_async(self):
+        # lets tasks waiting for a slot see that the limit was closed
+        if self.async_condition is not None:
+            async with self.async_condition:
+                self.async_condition.notify_all()
+
+    async def release_async(self):
+        async with self.async_condition:
+            self.in_flight -= 1
+            self.async_condition.notify_all()
+
+    def record_success(self, latency):
+        if not self.adaptive:
+            return
+        with self.condition:
+            self.samples += 1
+            if self.latency is None:
+                self.latency = self.baseline_latency = latency
+            self.latency = 0.9 * self.latency + 0.1 * latency
+            self.baseline_latency = 0.99 * self.baseline_latency + 0.01 * latency
+            if self.samples > self.warmup and self.latency > self.baseline_latency * self.latency_tolerance:
+                self.decrease(self.latency_decrease_factor)
+            elif self.slow_start:
+                self.limit = min(self.max_limit, self.limit + 1)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def record_congestion(self):
+        if not self.adaptive:
+            return
+        with self.condition:
+            self.decrease(self.decrease_factor)
+
+    def decrease(self, factor):
+        now = time.monotonic()
+        cooldown = self.cooldown if self.latency is None else self.latency
+        if now - self.last_decrease < cooldown:
+            return
+        self.last_decrease = now
+        self.slow_start = False
+        self.limit = max(self.min_limit, self.limit * factor)
@@ -0,0 +1,140 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from metrics import Counter
+
+
+# seconds between recomputing the hedge threshold from the latency histogram
+THRESHOLD_MAX_AGE = 1
+
+
+class HedgePolicy:
+    # Sends a second copy of a request that has been outstanding longer than the given percentile of
+    # observed latency and takes whichever succeeds first. Hedges are capped at max_ratio of the
+    # requests made so the extra spend stays bounded, and nothing is hedged until min_samples
+    # latencies have been seen. A losing copy is cancelled on the event loop. A blocking call can't be
+    # interrupted, so in thread mode the loser is left to finish and only its usage is counted.
+    def __init__(self, metrics, percentile=0.95, max_ratio=0.05, min_samples=50, workers=100):
+        self.metrics = metrics
+        self.percentile = percentile
+        self.quantile_name = f"p{int(percentile * 100)}"
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.workers = workers
+        self.executor = None
+        self.requests = Counter()
+        self.hedges = Counter()
+        self.wins = Counter()
+        self.cancelled = Counter()
+        self.extra_prompt_tokens = Counter()
+        self.extra_completion_tokens = Counter()
+        self.cached_threshold = None
+        self.threshold_time = 0
+        self.lock = threading.Lock()
+
+    def threshold(self):
+        # seconds after which a request is hedged, None until there are enough samples
+        now = time.monotonic()
+        if now - self.threshold_time >= THRESHOLD_MAX_AGE:
+            latency = self.metrics.latency.percentiles((self.percentile,))
+            self.cached_threshold = latency[self.quantile_name] if latency["count"] >= self.min_samples else None
+            self.threshold_time = now
+        return self.cached_threshold
+
+    def allow(self):
+        with self.lock:
+            if self.hedges.value >= self.max_ratio * self.requests.value:
+                return False
+            self.hedges.add()
+            return True
+
+    def record_loser(self, future):
+        # a loser that finished anyway was paid for, count it in the job's tokens so the cost is right
+        if future.cancelled() or future.exception() is not None:
+            return
+        usage = future.result().usage
+        self.extra_prompt_tokens.add(usage.prompt_tokens)
+        self.extra_completion_tokens.add(usage.completion_tokens)
+        self.metrics.input_tokens.add(usage.prompt_tokens)
+        self.metrics.output_tokens.add(usage.completion_tokens)
+
+    def run(self, attempt):
+        # attempt is a function making one request, both copies run on the policy's own threads so
+        # the worker can stop waiting on the slow one
+        self.requests.add()
+        delay = self.threshold()
+        if delay is None:
+            return attempt()
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        first = self.executor.submit(attempt)
+        done, _ = concurrent.futures.wait([first], timeout=delay)
+        if len(done) > 0 or not self.allow():
+            return first.result()
+        second = self.executor.submit(attempt)
+        pending = {first, second}
+        error = None
+        while len(pending) > 0:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self.wins.add()
+                    for loser in done - {future}:
+                        self.record_loser(loser)
+                    for loser in pending:
+                        if loser.cancel():
+                            self.cancelled.add()
+                        else:
+                            loser.add_done_callback(self.record_loser)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def run_async(self, attempt):
+        # asyncio version of run, attempt is a coroutine function
+        self.requests.add()
+        delay = self.threshold()
+        if delay is None:
+            return await attempt()
+        first = asyncio.ensure_future(attempt())
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if len(done) > 0 or not self.allow():
+                return await first
+            second = asyncio.ensure_future(attempt())
+            pending.add(second)
+            error = None
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.wins.add()
+                        for loser in done - {task}:
+                            self.record_loser(loser)
+                        self.cancelled.add(len(pending))
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def summary(self):
+        return {
+            "percentile": self.percentile,
+            "threshold_seconds": round(self.cached_threshold, 3) if self.cached_threshold is not None else None,
+            "hedges": self.hedges.value,
+            "hedge_wins": self.wins.value,
+            "losers_cancelled": self.cancelled.value,
+            "extra_prompt_tokens": self.extra_prompt_tokens.value,
+            "extra_completion_tokens": self.extra_completion_tokens.value,
+        }
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
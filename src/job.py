@@ -1,253 +1,1015 @@
-import json
-import openai
-from openai import OpenAI
-import csv
-import concurrent.futures
-import time
-import os
-import backoff
-from log import Log
-from box import Box
-
-class Job:
-    def __init__(self, config, log_path, queue):
-        self.config = config
-        self.log = Log(log_path)
-        self.api_key = self.config["api_key"]
-        self.client = OpenAI(api_key=self.api_key)
-        self.input_file_name = self.config["input_file"]
-        self.output_file_name = self.config["output_file"]
-        self.include_headers = self.config["include_headers"]
-        self.keep_data = self.config["keep_data"]
-        self.max_workers = self.config["max_workers"]
-        self.model = self.config["model"]
-        self.input_cost = self.config["input_cost"]
-        self.output_cost = self.config["output_cost"]
-        self.max_tokens = self.config["max_tokens"]
-        self.temperature = self.config["temperature"]
-        self.task_timeout = self.config["task_timeout"]
-        self.sleep_time = self.config["sleep_time"]
-        self.separator = self.config["separator"]
-
-        self.input_headers, self.input_data, self.input_column_data = read_csv_file(self.input_file_name, self.config["input_columns"], self.config["row_start"], self.config["row_end"])
-        self.output_column = self.config["output_column"] - 1 
-        self.system_msg = self.config["system_msg"]
-        self.context = self.config["context"]
-        self.output_data = []
-        self.cost = 0
-        self.message = [{"role": "system", "content": self.system_msg}] + self.context
-        self.count = len(self.input_column_data)
-        self.input_tokens = 0
-        self.output_tokens = 0
-
-        self.queue = queue
-
-    def format_multi_input(self):
-        if len(self.input_columns) > 1:
-            self.input_column_data = [self.separator.join(map(str, params)) for params in zip(*self.input_column_data)]
-
-    def update_cost(self):
-        self.cost = (
-            self.input_cost * self.input_tokens / 1000
-            + self.output_cost * self.output_tokens / 1000
-        )
-
-    def create_workers(self):
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.max_workers
-        ) as executor:
-            try:
-                futures = executor.map(self.response_wrapper, self.input_column_data)
-            except Exception as error:
-                print(f"Shutting down workers: {error}")
-                executor.shutdown(wait=False, cancel_futures=True)
-                raise error
-        return [future for future in futures]
-
-
-
-    def response_wrapper(self, input):
-        open_response = response(client=self.client, input=input, model=self.model, context=self.message, timeout=self.task_timeout, sleep_time=self.sleep_time, temperature=self.temperature, max_tokens=self.max_tokens)
-        self.input_tokens += open_response.usage.prompt_tokens
-        self.output_tokens += open_response.usage.completion_tokens
-        self.count -= 1
-        self.update_cost()
-        status_data = f"Remaining: {self.count} | Cost: ${round(self.cost, 4)} | Input Tokens: {self.input_tokens} | Output Tokens: {self.output_tokens}"
-        #print(status_data)
-        self.queue.put(status_data)
-        open_response = open_response.choices[0].message.content
-        return open_response
-
-    def write_data(self):
-        with open(self.output_file_name, "w", newline="") as output_file:
-            writer = csv.writer(output_file)
-            if self.include_headers:
-                writer.writerow(self.input_headers)
-            if self.keep_data:
-                for i, row in enumerate(self.input_data):
-                    try:
-                        row[self.output_column] = self.output_data[i]
-                    except IndexError:
-                        self.log.write("Output column is out of range")
-                        for j in range(self.output_column - len(row)):
-                            row.append(None)
-                        row.append(self.output_data[i])
-                writer.writerows(self.input_data)
-            else:
-                for i in range(len(self.output_data)):
-                    writer.writerow([self.output_data[i]])
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print("Job Complete. Output written to: " + self.output_file_name)
-        print("Total Cost: $" + str(round(self.cost, 6)))
-        print("Total Tokens: " + str(self.input_tokens + self.output_tokens))
-    
-    def main(self):
-        try:
-            self.output_data = self.create_workers()
-            self.write_data()
-        except Exception as e:
-            raise e
-
-def retry_with_exponential_backoff(
-    func,
-    initial_delay = 1,
-    exponential_base = 2,
-    jitter = True,
-    max_retries = 20,
-    errors = (openai.RateLimitError),
-):
-    def wrapper(*args, **kwargs):
-        num_retries = 0
-        delay = initial_delay
-
-        while True:
-            try:
-                return func(*args, **kwargs)
-            except (*errors,) as e:
-                num_retries += 1
-                if num_retries > max_retries:
-                    raise Exception("Max retries exceeded")
-
-                delay *= exponential_base * (1 + (jitter * random.random()))
-                time.sleep(delay)
-
-            except Exception as e:
-                raise e
-
-    return wrapper
-
-def on_giveup(details):
-    raise Exception("Max retries exceeded")
-
-@backoff.on_exception(backoff.expo, openai.RateLimitError, max_tries=15)
-def response(client, input, model, context, timeout=20, sleep_time=10,temperature=1, max_tokens=500):
-    if len(input) > 0:
-        messages = context + [{"role": "user", "content": input}]
-    else:
-        messages = context
-    try:
-        open_ai_res = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            timeout=timeout,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            top_p=1,
-        )
-    except openai.AuthenticationError as error:
-        raise error
-    except openai.APITimeoutError as error:
-        time.sleep(sleep_time)
-        open_ai_res = response(client, input, model, context, timeout, sleep_time, temperature, max_tokens)
-    except Exception as error:
-        raise error
-    return open_ai_res 
-
-
-def format_input(input_columns, separator, input_column_data):
-    if len(input_columns) > 1:
-        input_column_data = [separator.join(map(str, params)) for params in zip(*input_column_data)]
-    else:
-        input_column_data = input_column_data[0]
-    return input_column_data
-
-def read_csv_file(file_name, input_columns_input, row_start="start", row_end="end", separator=" - ", number=0):
-    with open(file_name, "r", newline="") as input_file:
-        reader = csv.reader(input_file)
-        input_columns = list()
-        input_headers = next(reader)
-        for column in input_columns_input.split(","):
-            input_columns.append(int(column) - 1)
-            if int(column) < 1:
-                raise Exception("Input column cannot be less than 1")
-        missing_columns = set(input_columns) - set(range(len(input_headers)))
-        if len(missing_columns) > 0:
-            raise Exception(f"Input column(s) {','.join([str(column + 1) for column in missing_columns])} not found in input file")
-    
-        reader_len = sum(1 for row in reader)
-        input_file.seek(0)
-        reader = csv.reader(input_file)
-        next(reader) # skip headers
-        try:
-            row_start = (0 if row_start.lower() == "start" else int(row_start))
-            if number != 0:
-                row_end = row_start + number
-            else:
-                row_end = (reader_len if row_end.lower() == "end" else int(row_end))
-            if row_end > reader_len:
-                row_end = reader_len
-            if row_start > row_end:
-                raise Exception("Row start must be less than row end")
-            if row_start < 0:
-                raise Exception("Row start cannot be less than 0")
-            if row_end < 0:
-                raise Exception("Row end cannot be less than 0") 
-        except ValueError:
-            raise Exception("Row start and row end must be integers or 'start' and 'end'")
-            row_start = "start"
-            row_end = "end"
-        rows = [row for row in reader][row_start:row_end]
-        input_data = [row for row in rows if len(row) > 0]
-        input_column_data = []
-        for column in input_columns:
-            input_column_data.append([row[column] for row in input_data])
-        input_column_data = format_input(input_columns, separator, input_column_data)
-        
-        return input_headers, input_data, input_column_data
-
-
-
-
-def main(config, log, data, fake=False,error=False):
-    job = Job(config, log, data)
-    if fake:
-        fake_job(error, data)
-    else:
-        job.main()
-
-
-if __name__ == "__main__":
-    main()
-
-
-
-
-def fake_job(error, data):
-    if error:
-        import random
-        while True:
-            if random.randint(1,10) == 7:
-                raise Exception("A RANDOM ERROR OCCURED")
-                break
-            else:
-                print(data["requests"])
-                data["requests"] += 1
-                time.sleep(5)
-    else:
-        while True:
-            time.sleep(10)
-            data["requests"] += 1
-
-        
-
-
+import json
+import openai
+import asyncio
+import concurrent.futures
+import itertools
+import collections
+import time
+import threading
+import os
+import sys
+from log import Log
+from writer import create_writer
+from readers import stream_file, parse_row_range, read_schema
+from journal import Journal, config_fingerprint
+from concurrency import AdaptiveConcurrency, Cancelled
+from ratelimit import RateLimiter
+from cache import ResponseCache, RecentOutputs, cache_key
+from datadir import get_datadir
+from batch import BatchRunner
+from metrics import Metrics, Counter
+from packing import pack_items, build_pack_input, pack_max_tokens, parse_pack_output
+from tokens import get_encoding, count_message_tokens, count_text_tokens, TOKENS_PER_MESSAGE
+from progress import Progress
+from retry import RetryPolicy
+from hedge import HedgePolicy
+from clientpool import ClientPool
+
+# seconds between progress updates, completions in between only move the counters
+PUBLISH_INTERVAL = 0.1
+# how often a dispatcher waiting on calls in flight checks for a cancel
+CANCEL_POLL_INTERVAL = 0.5
+
+class Job:
+    def __init__(self, config, log_path, progress=None, console=True, keep_journal=False):
+        self.config = config
+        # with console off nothing is printed, the headless runner reports from summary() instead
+        self.console = console
+        # a shard's journal is removed by the sharded job once every shard is merged
+        self.keep_journal = keep_journal
+        self.log = Log(log_path)
+        self.api_key = self.config["api_key"]
+        # every request goes to a member of the pool, a config without clients is a pool of the one api_key.
+        # Retries are left to the job's RetryPolicy rather than the clients' own
+        self.pool = ClientPool(self.config.get("clients"), self.api_key, self.config["model"], self.log)
+        self.client = self.pool.client
+        self.input_file_name = self.config["input_file"]
+        self.output_file_name = self.config["output_file"]
+        self.include_headers = self.config["include_headers"]
+        self.keep_data = self.config["keep_data"]
+        self.max_workers = self.config["max_workers"]
+        self.model = self.config["model"]
+        self.input_cost = self.config["input_cost"]
+        self.output_cost = self.config["output_cost"]
+        self.max_tokens = self.config["max_tokens"]
+        self.temperature = self.config["temperature"]
+        self.task_timeout = self.config["task_timeout"]
+        self.sleep_time = self.config["sleep_time"]
+        self.separator = self.config["separator"]
+        self.flush_rows = self.config.get("flush_rows", 100)
+        self.flush_interval = self.config.get("flush_interval", 5)
+        self.resume = self.config.get("resume", True)
+        # seconds a cancelled job waits for calls already in flight before abandoning them
+        self.cancel_timeout = self.config.get("cancel_timeout", 30)
+        self.engine = self.config.get("engine", "thread")
+        if self.engine not in ["thread", "async"]:
+            raise Exception(f"Unknown engine: {self.engine}, must be 'thread' or 'async'")
+        self.mode = self.config.get("mode", "realtime")
+        if self.mode not in ["realtime", "batch"]:
+            raise Exception(f"Unknown mode: {self.mode}, must be 'realtime' or 'batch'")
+        # batch requests are billed at a discount
+        self.cost_multiplier = self.config.get("batch_discount", 0.5) if self.mode == "batch" else 1
+        self.concurrency = AdaptiveConcurrency(self.max_workers, adaptive=self.config.get("adaptive_workers", True))
+        self.retry = RetryPolicy(self.sleep_time, self.config.get("retry_budget", 0.2))
+        self.limiter = RateLimiter(self.config.get("rpm_limit", 0), self.config.get("tpm_limit", 0), self.model)
+        # with use_cache off responses are still stored, just never read, so the cache gets the fresh samples
+        self.use_cache = self.config.get("use_cache", True)
+        self.deduplicate = self.config.get("deduplicate", True)
+        # rows sent together in one request, 1 sends every row on its own
+        self.pack_rows = max(1, self.config.get("pack_rows", 1))
+        # with longest_first each schedule_window rows read are sent heaviest first
+        self.longest_first = self.config.get("longest_first", False)
+        self.schedule_window = max(1, self.config.get("schedule_window", 10000))
+        self.scheduled = collections.deque()
+        self.cache = ResponseCache(self.config.get("cache_file") or get_datadir() / "Callio" / "cache.sqlite", self.config.get("cache_size_mb", 512) * 1024 * 1024)
+
+        # without keep_data only the input columns of a parquet or arrow file are read
+        self.input_headers, self.rows = stream_file(self.input_file_name, self.config["input_columns"], self.config["row_start"], self.config["row_end"], self.separator, columns=None if self.keep_data else [])
+        row_start, row_end = parse_row_range(self.config["row_start"], self.config["row_end"])
+        self.total = None if row_end is None else row_end - row_start
+        # in-flight calls, this is what bounds memory rather than the size of the input file
+        self.window = self.max_workers * 2
+        self.output_column = self.config["output_column"] - 1 
+        self.system_msg = self.config["system_msg"]
+        self.context = self.config["context"]
+        self.writer = None
+        self.failed = 0
+        self.cost = 0
+        self.message = [{"role": "system", "content": self.system_msg}] + self.context
+        self.metrics = Metrics()
+        # hedge_percentile of 0 turns hedging off
+        self.hedge = None
+        if self.config.get("hedge_percentile", 0) > 0:
+            self.hedge = HedgePolicy(self.metrics, self.config["hedge_percentile"], self.config.get("hedge_max_ratio", 0.05), workers=self.window * 2)
+        self.packing_saved_tokens = Counter()
+        if self.pack_rows > 1:
+            self.encoding = get_encoding(self.model)
+            self.context_tokens = count_message_tokens(self.message, self.encoding)
+
+        self.journal = Journal(self.output_file_name + ".journal", config_fingerprint(self.config), self.log)
+        self.completed = dict()
+
+        # deduplication state: outputs of recently finished unique inputs, input -> index of the row sent
+        # for it, and index of that row -> (input, rows waiting on it). A duplicate of an input whose output
+        # has aged out of unique_outputs is sent as a new row, and answered from the cache if it is on
+        self.unique_outputs = RecentOutputs(self.config.get("dedup_entries", 10000))
+        self.leaders = dict()
+        self.followers = dict()
+        self.saved_calls = 0
+
+        # rows handed to a worker and not yet completed, the ones among them whose request was sent,
+        # the ones answered after a cancel, and what a cancel left out of the output
+        self.in_flight = dict()
+        self.sent = set()
+        self.answered_late = set()
+        self.cancelled = False
+        self.left_out_counted = False
+        self.abandoned_rows = 0
+        self.skipped_rows = 0
+        self.rows_lock = threading.Lock()
+
+        self.progress = progress if progress is not None else Progress()
+        self.last_publish = 0
+
+    @property
+    def count(self):
+        return self.metrics.rows.value
+
+    @property
+    def input_tokens(self):
+        return self.metrics.input_tokens.value
+
+    @property
+    def output_tokens(self):
+        return self.metrics.output_tokens.value
+
+    def format_multi_input(self):
+        if len(self.input_columns) > 1:
+            self.input_column_data = [self.separator.join(map(str, params)) for params in zip(*self.input_column_data)]
+
+    def update_cost(self):
+        self.cost = (
+            self.input_cost * self.input_tokens / 1000
+            + self.output_cost * self.output_tokens / 1000
+        ) * self.cost_multiplier
+
+    def open_writer(self):
+        self.writer = create_writer(self.output_file_name, self.input_headers, self.output_column, self.keep_data, self.include_headers, self.log, self.flush_rows, self.flush_interval, output_format=self.config.get("output_format"), schema=read_schema(self.input_file_name))
+
+    def open_journal(self):
+        if self.resume:
+            self.completed = self.journal.load()
+        if len(self.completed) > 0:
+            for _, input_tokens, output_tokens in self.completed.values():
+                self.metrics.input_tokens.add(input_tokens)
+                self.metrics.output_tokens.add(output_tokens)
+            self.metrics.rows.add(len(self.completed))
+            self.update_cost()
+            self.log.write(f"Resuming job, {self.count} rows already completed")
+            self.publish(f"Resuming, {self.count} rows already completed")
+        self.journal.open(resume=len(self.completed) > 0)
+
+    def dispatch_rows(self):
+        # registers each row with the writer in input order as it is handed to a worker,
+        # rows already in the journal are written straight from it
+        for index, row, input in self.rows:
+            self.writer.expect(index)
+            if index in self.completed:
+                output = self.completed.pop(index)[0]
+                if self.deduplicate:
+                    self.unique_outputs.put(input, output)
+                self.writer.add(index, row, output)
+                continue
+            if self.deduplicate:
+                output = self.unique_outputs.get(input)
+                if output is not None:
+                    self.complete_duplicate(index, row, output)
+                    continue
+                if input in self.leaders:
+                    self.followers[self.leaders[input]][1].append((index, row))
+                    continue
+                self.leaders[input] = index
+                self.followers[index] = (input, [])
+            self.in_flight[index] = row
+            yield index, row, input
+
+    def complete_row(self, index, row, output):
+        if output is None:
+            # never sent because the job was cancelled, skip_rest writes it
+            return
+        del self.in_flight[index]
+        self.sent.discard(index)
+        self.writer.add(index, row, output)
+        if index in self.followers:
+            input, rows = self.followers.pop(index)
+            del self.leaders[input]
+            self.unique_outputs.put(input, output)
+            for follower_index, follower_row in rows:
+                self.complete_duplicate(follower_index, follower_row, output)
+
+    def complete_duplicate(self, index, row, output):
+        # same input as a row already sent, fan its output out without another call
+        self.journal.record(index, output, 0, 0)
+        self.saved_calls += 1
+        self.metrics.rows.add()
+        self.writer.add(index, row, output)
+        self.publish()
+
+    def schedule(self, items):
+        if not self.longest_first:
+            return items
+        return self.schedule_longest_first(items)
+
+    def schedule_longest_first(self, items):
+        # Sends each schedule_window items heaviest first by estimated input plus output tokens, so the
+        # longest requests of the job don't start last and leave a few workers running alone at the end.
+        # The writer still writes in input order, holding back at most about two windows of rows
+        items = iter(items)
+        while True:
+            window = list(itertools.islice(items, self.schedule_window))
+            if len(window) == 0:
+                return
+            self.scheduled = collections.deque(sorted(window, key=self.estimate_work, reverse=True))
+            while len(self.scheduled) > 0:
+                yield self.scheduled.popleft()
+
+    def estimate_work(self, item):
+        # a row is (index, row, input) and a pack (indices, rows, inputs), every answer is counted at max_tokens
+        inputs = item[2] if isinstance(item[2], tuple) else (item[2],)
+        return sum(count_text_tokens(input) for input in inputs) + self.max_tokens * len(inputs)
+
+    def cancel_requested(self):
+        if not self.cancelled and self.progress.cancel_requested():
+            self.cancelled = True
+            # requests still waiting for a slot give up rather than go out after the cancel
+            self.concurrency.close()
+            self.log.write(f"Job cancelled, waiting up to {self.cancel_timeout}s for {len(self.in_flight)} rows in flight")
+            self.publish("Cancelling, waiting for requests in flight")
+        return self.cancelled
+
+    def skip_rest(self):
+        # after a cancel, rows still in flight are written with an empty output so the rows completed
+        # after them reach the file. Returns how many rows each of them stands for, counted once the
+        # abandoned calls have had their wait. The journal keeps every finished row so running the job
+        # again picks up from here.
+        unsent = 0
+        left_out = dict()
+        for item in self.scheduled:
+            # read ahead by the scheduler but never sent, written empty like the rows in flight
+            for index in (item[0] if isinstance(item[0], tuple) else (item[0],)):
+                rows = [(index, self.in_flight.pop(index))]
+                if index in self.followers:
+                    rows += self.followers.pop(index)[1]
+                for skipped_index, skipped_row in rows:
+                    self.writer.add(skipped_index, skipped_row, "")
+                    unsent += 1
+        self.scheduled.clear()
+        for index, row in list(self.in_flight.items()):
+            rows = [(index, row)]
+            if index in self.followers:
+                rows += self.followers.pop(index)[1]
+            for skipped_index, skipped_row in rows:
+                self.writer.add(skipped_index, skipped_row, "")
+            left_out[index] = len(rows)
+        self.in_flight.clear()
+        self.skipped_rows = unsent + sum(1 for _ in self.rows)
+        return left_out
+
+    def count_left_out(self, left_out):
+        # Only rows whose request was sent count as abandoned. Rows queued for a worker that never
+        # started them, or that gave up waiting for a slot, count as skipped like the rows never read.
+        # A row answered during the wait is already counted in rows, only the duplicates waiting on it
+        # are left out. Anything answered after this goes to the journal alone and stays abandoned
+        with self.rows_lock:
+            self.left_out_counted = True
+            for index, rows in left_out.items():
+                if index in self.answered_late:
+                    self.skipped_rows += rows - 1
+                elif index in self.sent:
+                    self.abandoned_rows += rows
+                else:
+                    self.skipped_rows += rows
+        self.log.write(f"Cancelled job left out {self.abandoned_rows} rows in flight and {self.skipped_rows} rows not sent")
+
+    def create_workers(self):
+        # The concurrency limit rather than the thread count bounds the requests in flight, so a row
+        # sleeping out a retry backoff holds a thread but not a slot. There is a thread for every row
+        # in the window and for up to a window more rows in backoff, which don't count against it
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.window * 2)
+        abandoned = []
+        try:
+            if self.pack_rows > 1:
+                for indices, rows, outputs in bounded_dispatch(executor, self.process_pack, self.schedule(pack_items(self.dispatch_rows(), self.pack_rows)), self.window, self.cancel_requested, self.cancel_timeout, abandoned, self.backing_off):
+                    for index, row, output in zip(indices, rows, outputs):
+                        self.complete_row(index, row, output)
+            else:
+                for index, row, output in bounded_dispatch(executor, self.process_row, self.schedule(self.dispatch_rows()), self.window, self.cancel_requested, self.cancel_timeout, abandoned, self.backing_off):
+                    self.complete_row(index, row, output)
+        except Exception as error:
+            print(f"Shutting down workers: {error}")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise error
+        executor.shutdown(wait=not self.cancelled, cancel_futures=True)
+        if self.cancelled:
+            left_out = self.skip_rest()
+            if self.wait_for_abandoned(abandoned):
+                concurrent.futures.wait(abandoned, timeout=self.task_timeout)
+            self.count_left_out(left_out)
+
+    async def create_workers_async(self):
+        # same job as create_workers, but every row is a task on one event loop and the
+        # concurrency limit rather than a thread count limits how many requests are in flight
+        self.pool.open_async()
+        abandoned = []
+        try:
+            if self.pack_rows > 1:
+                async for indices, rows, outputs in async_bounded_dispatch(self.process_pack_async, self.schedule(pack_items(self.dispatch_rows(), self.pack_rows)), self.window, self.cancel_requested, self.cancel_timeout, abandoned, self.backing_off):
+                    for index, row, output in zip(indices, rows, outputs):
+                        self.complete_row(index, row, output)
+            else:
+                async for index, row, output in async_bounded_dispatch(self.process_row_async, self.schedule(self.dispatch_rows()), self.window, self.cancel_requested, self.cancel_timeout, abandoned, self.backing_off):
+                    self.complete_row(index, row, output)
+            if self.cancelled:
+                left_out = self.skip_rest()
+                if self.wait_for_abandoned(abandoned):
+                    await self.concurrency.wake_async()
+                    await asyncio.wait(abandoned, timeout=self.task_timeout)
+                self.count_left_out(left_out)
+        finally:
+            await self.pool.close_async()
+
+    def backing_off(self):
+        return self.metrics.backing_off.value
+
+    def wait_for_abandoned(self, abandoned):
+        # The output is complete once skip_rest has run, so it is closed before waiting. Calls abandoned
+        # by the cancel are already paid for, the journal and cache stay open for up to task_timeout
+        # more so the ones that still answer are kept for the next run. Returns True if there are any
+        self.writer.close()
+        if len(abandoned) == 0:
+            return False
+        self.log.write(f"Waiting up to {self.task_timeout}s for {len(abandoned)} abandoned requests to reach the journal")
+        self.publish(f"Cancelled, keeping the answers of {len(abandoned)} abandoned requests for the next run")
+        return True
+
+    def run_batch(self):
+        fingerprint = config_fingerprint(self.config)
+        runner = BatchRunner(self.client, self.output_file_name + ".batch", fingerprint, self.log, self.progress, self.config.get("batch_poll_interval", 60))
+        batch_ids = runner.load_batches()
+        if len(batch_ids) > 0:
+            self.log.write(f"Resuming {len(batch_ids)} submitted batches")
+        else:
+            # first pass, write a request for every row that still needs one. The inputs seen are held
+            # the way the second pass holds their outputs, so a duplicate left out here is answered there
+            seen = RecentOutputs(self.unique_outputs.max_entries)
+            for index, row, input in self.rows:
+                if self.deduplicate:
+                    if seen.get(input) is not None:
+                        continue
+                    seen.put(input, "")
+                if index in self.completed:
+                    continue
+                messages = build_messages(self.message, input)
+                if self.use_cache:
+                    cached = self.cache.get(cache_key(self.model, messages, self.temperature, self.max_tokens))
+                    if cached is not None:
+                        self.completed[index] = (cached[0], 0, 0)
+                        self.journal.record(index, cached[0], 0, 0)
+                        self.metrics.rows.add()
+                        continue
+                runner.add_request(index, {"model": self.model, "messages": messages, "temperature": self.temperature, "max_tokens": self.max_tokens, "top_p": 1})
+            if len(runner.parts) > 0:
+                batch_ids = runner.submit()
+        batches = runner.wait(batch_ids) if len(batch_ids) > 0 else []
+        if batches is None:
+            # cancelled while waiting, the batches keep running and the next run collects them
+            self.cancelled = True
+            self.log.write(f"Job cancelled while {len(batch_ids)} batches are running, run it again to collect them")
+            batches = []
+
+        fetched = set()
+        for custom_id, output, prompt_tokens, completion_tokens in runner.results(batches):
+            index = int(custom_id)
+            fetched.add(index)
+            self.completed[index] = (output, prompt_tokens, completion_tokens)
+            self.journal.record(index, output, prompt_tokens, completion_tokens)
+            self.metrics.rows.add()
+            self.metrics.input_tokens.add(prompt_tokens)
+            self.metrics.output_tokens.add(completion_tokens)
+
+        # second pass, write the output in input order from the merged results
+        _, rows = stream_file(self.input_file_name, self.config["input_columns"], self.config["row_start"], self.config["row_end"], self.separator, columns=None if self.keep_data else [])
+        for index, row, input in rows:
+            self.writer.expect(index)
+            duplicate = None
+            if self.deduplicate and index not in self.completed:
+                duplicate = self.duplicate_output(input)
+            if index in self.completed:
+                output, prompt_tokens, completion_tokens = self.completed.pop(index)
+                if index in fetched:
+                    self.cache.put(cache_key(self.model, build_messages(self.message, input), self.temperature, self.max_tokens), output, prompt_tokens, completion_tokens)
+                if self.deduplicate:
+                    self.unique_outputs.put(input, output)
+            elif duplicate is not None:
+                output = duplicate
+                self.journal.record(index, output, 0, 0)
+                self.saved_calls += 1
+                self.metrics.rows.add()
+            elif self.cancelled:
+                output = ""
+                self.skipped_rows += 1
+            else:
+                output = ""
+                self.failed += 1
+            self.writer.add(index, row, output)
+        self.publish()
+        if not self.cancelled:
+            runner.remove()
+
+    def duplicate_output(self, input):
+        # a batch duplicate whose output has aged out of unique_outputs falls back to the cache when
+        # it is on, every fetched batch result is stored there
+        output = self.unique_outputs.get(input)
+        if output is None and self.use_cache:
+            cached = self.cache.get(self.row_key(input))
+            if cached is not None:
+                output = cached[0]
+                self.unique_outputs.put(input, output)
+        return output
+
+    def publish(self, message=None, force=False):
+        # called on every completion, only writes to the shared progress every PUBLISH_INTERVAL
+        now = time.monotonic()
+        if not force and message is None and now - self.last_publish < PUBLISH_INTERVAL:
+            return
+        self.last_publish = now
+        self.update_cost()
+        latency = self.metrics.recent_latency()
+        self.progress.publish({
+            "rows": self.count,
+            "total": -1 if self.total is None else self.total,
+            "failed": self.failed,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost": self.cost,
+            "requests": self.metrics.requests.value,
+            "errors": sum(counter.value for counter in list(self.metrics.errors.values())),
+            "retries": self.metrics.retries.value,
+            "workers": self.concurrency.current if self.mode == "realtime" else 0,
+            "max_workers": self.max_workers,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "saved_calls": self.saved_calls,
+            "skipped": self.abandoned_rows + self.skipped_rows,
+            "packing_saved_tokens": self.packing_saved_tokens.value,
+            "latency_p50": latency["p50"],
+            "latency_p95": latency["p95"],
+            "elapsed": self.metrics.elapsed(),
+        }, message)
+
+
+    def row_key(self, input):
+        return cache_key(self.model, build_messages(self.message, input), self.temperature, self.max_tokens)
+
+    def process_row(self, index, input):
+        key = self.row_key(input)
+        cached = self.cached_row(index, key)
+        if cached is not None:
+            return cached
+        return self.fetch_row(index, key, input)
+
+    async def process_row_async(self, index, input):
+        key = self.row_key(input)
+        cached = self.cached_row(index, key)
+        if cached is not None:
+            return cached
+        return await self.fetch_row_async(index, key, input)
+
+    def fetch_row(self, index, key, input):
+        if self.cancelled:
+            return None
+        self.sent.add(index)
+        try:
+            open_response = self.response_wrapper(input)
+        except Cancelled:
+            self.sent.discard(index)
+            return None
+        return self.finish_row(index, key, open_response)
+
+    async def fetch_row_async(self, index, key, input):
+        if self.cancelled:
+            return None
+        self.sent.add(index)
+        try:
+            open_response = await self.async_response_wrapper(input)
+        except Cancelled:
+            self.sent.discard(index)
+            return None
+        return self.finish_row(index, key, open_response)
+
+    def start_pack(self, indices, inputs):
+        # returns the outputs found in the cache and the positions that still need a request
+        outputs = [None] * len(inputs)
+        keys = [self.row_key(input) for input in inputs]
+        pending = []
+        for i, index in enumerate(indices):
+            cached = self.cached_row(index, keys[i])
+            if cached is not None:
+                outputs[i] = cached
+            else:
+                pending.append(i)
+        return outputs, keys, pending
+
+    def process_pack(self, indices, inputs):
+        # several rows in one request, any row whose answer can't be read back is sent again on its own
+        outputs, keys, pending = self.start_pack(indices, inputs)
+        if len(pending) > 1 and not self.cancelled:
+            self.sent.update(indices[i] for i in pending)
+            pack_input = build_pack_input([inputs[i] for i in pending])
+            try:
+                open_response = self.response_wrapper(pack_input, max_tokens=pack_max_tokens(self.max_tokens, len(pending)))
+                self.finish_pack(indices, inputs, pending, outputs, open_response)
+            except Cancelled:
+                self.sent.difference_update(indices[i] for i in pending)
+        for i in pending:
+            if outputs[i] is None:
+                outputs[i] = self.fetch_row(indices[i], keys[i], inputs[i])
+        return outputs
+
+    async def process_pack_async(self, indices, inputs):
+        outputs, keys, pending = self.start_pack(indices, inputs)
+        if len(pending) > 1 and not self.cancelled:
+            self.sent.update(indices[i] for i in pending)
+            pack_input = build_pack_input([inputs[i] for i in pending])
+            try:
+                open_response = await self.async_response_wrapper(pack_input, max_tokens=pack_max_tokens(self.max_tokens, len(pending)))
+                self.finish_pack(indices, inputs, pending, outputs, open_response)
+            except Cancelled:
+                self.sent.difference_update(indices[i] for i in pending)
+        for i in pending:
+            if outputs[i] is None:
+                outputs[i] = await self.fetch_row_async(indices[i], keys[i], inputs[i])
+        return outputs
+
+    def finish_pack(self, indices, inputs, pending, outputs, open_response):
+        answers = parse_pack_output(open_response.choices[0].message.content, len(pending))
+        parsed = [(i, answer) for i, answer in zip(pending, answers) if answer is not None]
+        if len(parsed) < len(pending):
+            self.log.write(f"Could not read {len(pending) - len(parsed)} of {len(pending)} packed answers, sending them on their own")
+        if len(parsed) == 0:
+            return
+        # the journal keeps tokens per row, split the pack's usage between the rows it answered
+        prompt_tokens = open_response.usage.prompt_tokens
+        completion_tokens = open_response.usage.completion_tokens
+        for n, (i, answer) in enumerate(parsed):
+            outputs[i] = answer
+            self.journal.record(indices[i], answer, prompt_tokens // len(parsed) + (prompt_tokens % len(parsed) if n == 0 else 0), completion_tokens // len(parsed) + (completion_tokens % len(parsed) if n == 0 else 0))
+        self.count_rows([indices[i] for i, _ in parsed])
+        # what the answered rows would have cost in prompt tokens if sent one by one
+        single_tokens = sum(self.context_tokens + TOKENS_PER_MESSAGE + count_text_tokens(inputs[i], self.encoding) for i, _ in parsed)
+        self.packing_saved_tokens.add(single_tokens - prompt_tokens)
+        self.publish()
+
+    def cached_row(self, index, key):
+        if not self.use_cache:
+            return None
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        # a cached response costs nothing so only the row count moves
+        self.journal.record(index, cached[0], 0, 0)
+        self.count_rows([index])
+        self.publish()
+        return cached[0]
+
+    def finish_row(self, index, key, open_response):
+        output = open_response.choices[0].message.content
+        self.journal.record(index, output, open_response.usage.prompt_tokens, open_response.usage.completion_tokens)
+        self.cache.put(key, output, open_response.usage.prompt_tokens, open_response.usage.completion_tokens)
+        self.count_rows([index])
+        return output
+
+    def count_rows(self, indices):
+        # A row is counted once, in rows or, when answered after a cancel left it out of the output,
+        # in abandoned_rows by count_left_out
+        with self.rows_lock:
+            if self.left_out_counted:
+                return
+            if self.cancelled:
+                self.answered_late.update(indices)
+            self.metrics.rows.add(len(indices))
+
+    def response_wrapper(self, input, max_tokens=None):
+        open_response = response(client=self.client, input=input, model=self.model, context=self.message, timeout=self.task_timeout, sleep_time=self.sleep_time, temperature=self.temperature, max_tokens=max_tokens or self.max_tokens, concurrency=self.concurrency, limiter=self.limiter, metrics=self.metrics, retry=self.retry, hedge=self.hedge, pool=self.pool)
+        self.record_usage(open_response)
+        return open_response
+
+    async def async_response_wrapper(self, input, max_tokens=None):
+        open_response = await async_response(client=None, input=input, model=self.model, context=self.message, timeout=self.task_timeout, sleep_time=self.sleep_time, temperature=self.temperature, max_tokens=max_tokens or self.max_tokens, concurrency=self.concurrency, limiter=self.limiter, metrics=self.metrics, retry=self.retry, hedge=self.hedge, pool=self.pool)
+        self.record_usage(open_response)
+        return open_response
+
+    def record_usage(self, open_response):
+        # rows are counted once their answers are journaled, a pack's answers may not all be readable
+        self.metrics.input_tokens.add(open_response.usage.prompt_tokens)
+        self.metrics.output_tokens.add(open_response.usage.completion_tokens)
+        self.publish()
+
+    def summary(self):
+        self.update_cost()
+        summary = {
+            "output_file": self.output_file_name,
+            "model": self.model,
+            "mode": self.mode,
+            "engine": self.engine,
+            "rows": self.count,
+            "failed_rows": self.failed,
+            "cancelled": self.cancelled,
+            "abandoned_rows": self.abandoned_rows,
+            "skipped_rows": self.skipped_rows,
+            "calls_saved_by_deduplication": self.saved_calls,
+            "retry_budget_exhausted": self.retry.exhausted,
+            "prompt_tokens_saved_by_packing": self.packing_saved_tokens.value,
+            "cost": round(self.cost, 6),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+        if self.use_cache:
+            summary["cache"] = {"hits": self.cache.hits, "misses": self.cache.misses}
+        if self.hedge is not None:
+            summary["hedging"] = self.hedge.summary()
+        if len(self.pool.members) > 1:
+            summary["clients"] = self.pool.summary(self.input_cost, self.output_cost, self.cost_multiplier)
+        summary.update(self.metrics.snapshot())
+        return summary
+
+    def write_summary(self):
+        # machine readable stats next to the output file
+        with open(self.output_file_name + ".stats.json", "w") as summary_file:
+            json.dump(self.summary(), summary_file, indent=4)
+
+    def write_data(self):
+        self.writer.close()
+        self.write_summary()
+        self.publish(force=True)
+        self.progress.publish({"finished": 1}, "Job Cancelled" if self.cancelled else "Job Complete")
+        if self.console:
+            self.print_totals()
+
+    def print_totals(self):
+        os.system('cls' if os.name == 'nt' else 'clear')
+        if self.cancelled:
+            print("Job Cancelled. Completed rows written to: " + self.output_file_name)
+            print(f"Rows Left Out: {self.abandoned_rows} in flight, {self.skipped_rows} not sent, run the job again to finish them")
+        else:
+            print("Job Complete. Output written to: " + self.output_file_name)
+        self.update_cost()
+        print("Total Cost: $" + str(round(self.cost, 6)))
+        print("Total Tokens: " + str(self.input_tokens + self.output_tokens))
+        if self.use_cache:
+            print(self.cache.status())
+        if self.deduplicate:
+            print("Calls Saved By Deduplication: " + str(self.saved_calls))
+        if self.pack_rows > 1:
+            print("Prompt Tokens Saved By Packing: ~" + str(self.packing_saved_tokens.value))
+        if self.failed > 0:
+            print(f"Failed Rows: {self.failed}, run the job again to retry them")
+    
+    def main(self):
+        self.open_journal()
+        self.open_writer()
+        try:
+            if self.mode == "batch":
+                self.run_batch()
+            elif self.engine == "async":
+                asyncio.run(self.create_workers_async())
+            else:
+                self.create_workers()
+            self.write_data()
+        except Exception as e:
+            self.writer.close()
+            self.journal.close()
+            raise e
+        finally:
+            self.cache.close()
+            if self.hedge is not None:
+                self.hedge.close()
+        if self.failed > 0 or self.cancelled or self.keep_journal:
+            self.journal.close()
+        else:
+            self.journal.remove()
+
+def build_messages(context, input):
+    if len(input) > 0:
+        return context + [{"role": "user", "content": input}]
+    return context
+
+def create_completion(client, messages, model, timeout, temperature, max_tokens, concurrency=None, limiter=None, metrics=None, pool=None):
+    # one attempt. A rate limiter makes the attempt wait for its share of the rpm/tpm budget first,
+    # a concurrency controller makes it hold one of its slots and report latency or congestion back,
+    # metrics gets the latency of every successful attempt and the type of every failed one. With a
+    # ClientPool the attempt goes to the member it picks, within that member's own limits
+    admission = None
+    if limiter is not None and limiter.enabled:
+        admission = limiter.admit(messages, max_tokens)
+    member = None
+    member_admission = None
+    if pool is not None:
+        member = pool.choose()
+        client = member.client
+        if member.limiter.enabled:
+            member_admission = member.limiter.admit(messages, max_tokens)
+    if concurrency is not None:
+        try:
+            concurrency.acquire()
+        except Cancelled:
+            # never sent, nothing was spent
+            if admission is not None:
+                limiter.settle(admission)
+            if member_admission is not None:
+                member.limiter.settle(member_admission)
+            raise
+    start = time.monotonic()
+    open_ai_res = None
+    try:
+        open_ai_res = client.chat.completions.create(model=model, messages=messages, timeout=timeout, temperature=temperature, max_tokens=max_tokens, top_p=1)
+    except Exception as error:
+        if metrics is not None:
+            metrics.record_error(error)
+        if member is not None:
+            pool.record_failure(member, error)
+        if concurrency is not None and isinstance(error, (openai.RateLimitError, openai.APITimeoutError)):
+            concurrency.record_congestion()
+        raise error
+    finally:
+        if concurrency is not None:
+            concurrency.release()
+        if admission is not None:
+            limiter.settle(admission, open_ai_res.usage if open_ai_res is not None else None)
+        if member_admission is not None:
+            member.limiter.settle(member_admission, open_ai_res.usage if open_ai_res is not None else None)
+    latency = time.monotonic() - start
+    if concurrency is not None:
+        concurrency.record_success(latency)
+    if metrics is not None:
+        metrics.record_request(latency, open_ai_res.usage)
+    if member is not None:
+        pool.record_success(member, open_ai_res.usage)
+    return open_ai_res
+
+async def async_create_completion(client, messages, model, timeout, temperature, max_tokens, concurrency=None, limiter=None, metrics=None, pool=None):
+    admission = None
+    if limiter is not None and limiter.enabled:
+        admission = await limiter.admit_async(messages, max_tokens)
+    member = None
+    member_admission = None
+    if pool is not None:
+        member = pool.choose()
+        client = member.async_client
+        if member.limiter.enabled:
+            member_admission = await member.limiter.admit_async(messages, max_tokens)
+    if concurrency is not None:
+        try:
+            await concurrency.acquire_async()
+        except Cancelled:
+            if admission is not None:
+                limiter.settle(admission)
+            if member_admission is not None:
+                member.limiter.settle(member_admission)
+            raise
+    start = time.monotonic()
+    open_ai_res = None
+    try:
+        open_ai_res = await client.chat.completions.create(model=model, messages=messages, timeout=timeout, temperature=temperature, max_tokens=max_tokens, top_p=1)
+    except Exception as error:
+        if metrics is not None:
+            metrics.record_error(error)
+        if member is not None:
+            pool.record_failure(member, error)
+        if concurrency is not None and isinstance(error, (openai.RateLimitError, openai.APITimeoutError)):
+            concurrency.record_congestion()
+        raise error
+    finally:
+        if concurrency is not None:
+            await concurrency.release_async()
+        if admission is not None:
+            limiter.settle(admission, open_ai_res.usage if open_ai_res is not None else None)
+        if member_admission is not None:
+            member.limiter.settle(member_admission, open_ai_res.usage if open_ai_res is not None else None)
+    latency = time.monotonic() - start
+    if concurrency is not None:
+        concurrency.record_success(latency)
+    if metrics is not None:
+        metrics.record_request(latency, open_ai_res.usage)
+    if member is not None:
+        pool.record_success(member, open_ai_res.usage)
+    return open_ai_res
+
+def response(client, input, model, context, timeout=20, sleep_time=10,temperature=1, max_tokens=500, concurrency=None, limiter=None, metrics=None, retry=None, hedge=None, pool=None):
+    # retries in a loop as the RetryPolicy allows, a request without one gets a policy of its own.
+    # A request whose ClientPool member was taken out goes straight to another member.
+    # With a HedgePolicy each attempt may be sent twice, the first copy to succeed is the attempt's result
+    messages = build_messages(context, input)
+    if retry is None:
+        retry = RetryPolicy(sleep_time)
+    retry.record_request()
+    attempt = 0
+    while True:
+        try:
+            if hedge is not None:
+                return hedge.run(lambda: create_completion(client, messages, model, timeout, temperature, max_tokens, concurrency, limiter, metrics, pool))
+            return create_completion(client, messages, model, timeout, temperature, max_tokens, concurrency, limiter, metrics, pool)
+        except Exception as error:
+            if pool is not None and pool.failover(error):
+                continue
+            backoff = retry.delay(error, attempt)
+            if backoff is None:
+                raise error
+            reason, wait = backoff
+            if metrics is not None:
+                metrics.record_retry(wait, reason)
+                # the dispatcher doesn't count a row in backoff against its window, see create_workers
+                metrics.backing_off.add()
+            attempt += 1
+            if concurrency is not None:
+                concurrency.backoff(wait)
+            else:
+                time.sleep(wait)
+            if metrics is not None:
+                metrics.backing_off.add(-1)
+
+async def async_response(client, input, model, context, timeout=20, sleep_time=10,temperature=1, max_tokens=500, concurrency=None, limiter=None, metrics=None, retry=None, hedge=None, pool=None):
+    messages = build_messages(context, input)
+    if retry is None:
+        retry = RetryPolicy(sleep_time)
+    retry.record_request()
+    attempt = 0
+    while True:
+        try:
+            if hedge is not None:
+                return await hedge.run_async(lambda: async_create_completion(client, messages, model, timeout, temperature, max_tokens, concurrency, limiter, metrics, pool))
+            return await async_create_completion(client, messages, model, timeout, temperature, max_tokens, concurrency, limiter, metrics, pool)
+        except Exception as error:
+            if pool is not None and pool.failover(error):
+                continue
+            backoff = retry.delay(error, attempt)
+            if backoff is None:
+                raise error
+            reason, wait = backoff
+            if metrics is not None:
+                metrics.record_retry(wait, reason)
+                metrics.backing_off.add()
+            attempt += 1
+            await asyncio.sleep(wait)
+            if metrics is not None:
+                metrics.backing_off.add(-1)
+
+def stream_response(client, input, model, context, timeout=20, sleep_time=10, temperature=1, max_tokens=500, on_text=None, retry=None):
+    # streamed version of response for sample inputs, on_text gets the response so far each time more
+    # of it arrives. Returns (content, seconds to the first token, total seconds, usage). An attempt is
+    # only retried if it failed before any text arrived, after that the caller has already shown it
+    messages = build_messages(context, input)
+    if retry is None:
+        retry = RetryPolicy(sleep_time)
+    retry.record_request()
+    attempt = 0
+    while True:
+        start = time.monotonic()
+        first_token = None
+        content = ""
+        usage = None
+        try:
+            stream = client.chat.completions.create(model=model, messages=messages, timeout=timeout, temperature=temperature, max_tokens=max_tokens, top_p=1, stream=True, stream_options={"include_usage": True})
+            for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if len(chunk.choices) == 0 or not chunk.choices[0].delta.content:
+                    continue
+                if first_token is None:
+                    first_token = time.monotonic() - start
+                content += chunk.choices[0].delta.content
+                if on_text is not None:
+                    on_text(content)
+            return content, first_token, time.monotonic() - start, usage
+        except Exception as error:
+            backoff = retry.delay(error, attempt) if first_token is None else None
+            if backoff is None:
+                raise error
+            attempt += 1
+            time.sleep(backoff[1])
+
+
+def bounded_dispatch(executor, fn, items, window, cancelled=None, drain_timeout=0, abandoned=None, backing_off=None):
+    # Submits fn(index, input) for each (index, row, input) while keeping at most `window` calls in flight,
+    # yields (index, row, result) in completion order. Once cancelled() returns True nothing more is
+    # submitted and the calls in flight get drain_timeout seconds to finish, the rest are abandoned.
+    # Calls not yet started are cancelled, the futures of those already running go in the abandoned list.
+    # backing_off() is how many calls are waiting to retry, up to window of them don't count as in flight.
+    pending = dict()
+    items = iter(items)
+    exhausted = False
+    deadline = None
+    while True:
+        if deadline is None and cancelled is not None and cancelled():
+            exhausted = True
+            deadline = time.monotonic() + drain_timeout
+        while not exhausted and len(pending) < window + (0 if backing_off is None else min(backing_off(), window)):
+            item = next(items, None)
+            if item is None:
+                exhausted = True
+                break
+            pending[executor.submit(fn, item[0], item[2])] = item
+        if len(pending) == 0:
+            return
+        timeout = None if cancelled is None else CANCEL_POLL_INTERVAL
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                for future in pending:
+                    if not future.cancel() and abandoned is not None:
+                        abandoned.append(future)
+                return
+        done, _ = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            index, row, _ = pending.pop(future)
+            yield index, row, future.result()
+
+async def async_bounded_dispatch(fn, items, window, cancelled=None, drain_timeout=0, abandoned=None, backing_off=None):
+    # asyncio version of bounded_dispatch, fn is a coroutine function. Tasks abandoned by a cancel are
+    # left running in the abandoned list when one is given, and cancelled otherwise
+    pending = dict()
+    items = iter(items)
+    exhausted = False
+    deadline = None
+    try:
+        while True:
+            if deadline is None and cancelled is not None and cancelled():
+                exhausted = True
+                deadline = time.monotonic() + drain_timeout
+            while not exhausted and len(pending) < window + (0 if backing_off is None else min(backing_off(), window)):
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending[asyncio.ensure_future(fn(item[0], item[2]))] = item
+            if len(pending) == 0:
+                return
+            timeout = None if cancelled is None else CANCEL_POLL_INTERVAL
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    # the finally below cancels whatever is still pending
+                    if abandoned is not None:
+                        abandoned.extend(pending)
+                        pending.clear()
+                    return
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, row, _ = pending.pop(task)
+                yield index, row, task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def create_job(config, log_path, progress=None, console=True):
+    # a realtime job with processes above 1 runs as shards, each in its own process
+    if config.get("processes", 1) > 1 and config.get("mode", "realtime") == "realtime":
+        from shards import ShardedJob
+        return ShardedJob(config, log_path, progress, console)
+    return Job(config, log_path, progress, console)
+
+def main(config, log, progress, fake=False,error=False):
+    job = create_job(config, log, progress)
+    if fake:
+        fake_job(error, progress)
+    else:
+        job.main()
+
+
+if __name__ == "__main__":
+    import cli
+    sys.exit(cli.main())
+
+
+
+
+def fake_job(error, data):
+    if error:
+        import random
+        while True:
+            if random.randint(1,10) == 7:
+                raise Exception("A RANDOM ERROR OCCURED")
+                break
+            else:
+                print(data["requests"])
+                data["requests"] += 1
+                time.sleep(5)
+    else:
+        while True:
+            time.sleep(10)
+            data["requests"] += 1
+
+        
+
+
@@ -0,0 +1,97 @@
+import json
+import hashlib
+import threading
+import os
+
+
+# config keys that change what a response would be, if any of these differ the journal can't be reused
+FINGERPRINT_KEYS = ["input_file", "input_columns", "row_start", "row_end", "separator", "model", "system_msg", "context", "temperature", "max_tokens"]
+
+
+def config_fingerprint(config):
+    # the input file's size and modification time stand in for its contents, an edited input starts over
+    values = {key: config.get(key) for key in FINGERPRINT_KEYS}
+    try:
+        stat = os.stat(config["input_file"])
+        values["input_stat"] = [stat.st_size, stat.st_mtime_ns]
+    except (KeyError, TypeError, OSError):
+        values["input_stat"] = None
+    data = json.dumps(values, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class Journal:
+    # Append only record of completed rows kept next to the output file, one json object per line.
+    # Every record is flushed as it is written so a killed job process loses at most the line in progress.
+    def __init__(self, path, fingerprint, log):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.log = log
+        self.lock = threading.Lock()
+        self.journal_file = None
+
+    def load(self):
+        # returns {index: (output, input_tokens, output_tokens)} for a journal written with the same config
+        completed = dict()
+        if not os.path.isfile(self.path):
+            return completed
+        with open(self.path, "r", encoding="utf-8") as journal_file:
+            try:
+                header = json.loads(journal_file.readline())
+            except ValueError:
+                header = dict()
+            if header.get("fingerprint") != self.fingerprint:
+                self.log.write(f"Journal {self.path} was written with a different config, starting over")
+                return completed
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # partial line from a crash mid write
+                    continue
+                completed[record["index"]] = (record["output"], record["input_tokens"], record["output_tokens"])
+        return completed
+
+    def open(self, resume):
+        if resume:
+            self.trim_partial_line()
+            self.journal_file = open(self.path, "a", encoding="utf-8")
+        else:
+            self.journal_file = open(self.path, "w", encoding="utf-8")
+            self.journal_file.write(json.dumps({"fingerprint": self.fingerprint}) + "\n")
+            self.journal_file.flush()
+
+    def trim_partial_line(self):
+        # a crash mid write leaves part of a line at the end, cut back to the last newline so the next
+        # record starts a line of its own instead of being glued onto the partial one
+        with open(self.path, "rb+") as journal_file:
+            end = journal_file.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - 4096)
+                journal_file.seek(start)
+                newline = journal_file.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                journal_file.truncate(position)
+
+    def record(self, index, output, input_tokens, output_tokens):
+        line = json.dumps({"index": index, "output": output, "input_tokens": input_tokens, "output_tokens": output_tokens}) + "\n"
+        with self.lock:
+            self.journal_file.write(line)
+            self.journal_file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.journal_file is not None and not self.journal_file.closed:
+                self.journal_file.flush()
+                os.fsync(self.journal_file.fileno())
+                self.journal_file.close()
+
+    def remove(self):
+        self.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
@@ -0,0 +1,164 @@
+import bisect
+import math
+import threading
+import time
+
+
+class Counter:
+    # Sharded counter, every thread adds to its own cell so workers never contend on a lock
+    # and no update can be lost. Reading sums the cells.
+    def __init__(self):
+        self.local = threading.local()
+        self.cells = []
+        self.lock = threading.Lock()
+
+    def cell(self):
+        cell = getattr(self.local, "cell", None)
+        if cell is None:
+            cell = [0]
+            with self.lock:
+                self.cells.append(cell)
+            self.local.cell = cell
+        return cell
+
+    def add(self, amount=1):
+        # only the owning thread ever writes a cell
+        self.cell()[0] += amount
+
+    @property
+    def value(self):
+        return sum(cell[0] for cell in list(self.cells))
+
+
+# bucket upper bounds in seconds, 1ms to about 20 minutes growing by 10% a bucket
+LATENCY_BUCKETS = [0.001 * 1.1 ** i for i in range(int(math.log(1200 / 0.001, 1.1)) + 2)]
+
+
+class LatencyHistogram:
+    # Log bucketed latency histogram, sharded per thread like Counter. Percentiles are accurate
+    # to the 10% width of a bucket.
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            # bucket counts, then total seconds and the largest value seen
+            shard = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0.0]
+            with self.lock:
+                self.shards.append(shard)
+            self.local.shard = shard
+        return shard
+
+    def record(self, seconds):
+        shard = self.shard()
+        shard[0][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        shard[1] += seconds
+        shard[2] = max(shard[2], seconds)
+
+    def merged(self):
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        total = 0.0
+        largest = 0.0
+        for shard in list(self.shards):
+            for i, count in enumerate(shard[0]):
+                counts[i] += count
+            total += shard[1]
+            largest = max(largest, shard[2])
+        return counts, total, largest
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99)):
+        counts, total, largest = self.merged()
+        samples = sum(counts)
+        result = {"count": samples, "mean": total / samples if samples > 0 else 0, "max": largest}
+        for quantile in quantiles:
+            name = f"p{int(quantile * 100)}"
+            if samples == 0:
+                result[name] = 0
+                continue
+            rank = math.ceil(quantile * samples)
+            seen = 0
+            for i, count in enumerate(counts):
+                seen += count
+                if seen >= rank:
+                    result[name] = min(LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else largest, largest)
+                    break
+        return result
+
+
+class Metrics:
+    # Stats for a job, safe to record into from any number of worker threads
+    def __init__(self):
+        self.start = time.monotonic()
+        # job totals, these include rows restored from the journal, duplicates and cache hits
+        self.rows = Counter()
+        self.input_tokens = Counter()
+        self.output_tokens = Counter()
+        # api requests made by this run
+        self.requests = Counter()
+        self.prompt_tokens = Counter()
+        self.completion_tokens = Counter()
+        self.retries = Counter()
+        self.backoff_seconds = Counter()
+        # requests sleeping out a retry backoff right now, they hold no concurrency slot
+        self.backing_off = Counter()
+        self.latency = LatencyHistogram()
+        self.errors = dict()
+        self.retry_reasons = dict()
+        self.errors_lock = threading.Lock()
+        self.last_latency = {"p50": 0, "p95": 0}
+        self.last_latency_time = 0
+
+    def record_request(self, seconds, usage=None):
+        self.requests.add()
+        self.latency.record(seconds)
+        if usage is not None:
+            self.prompt_tokens.add(usage.prompt_tokens)
+            self.completion_tokens.add(usage.completion_tokens)
+
+    def record_retry(self, wait=0, reason=None):
+        self.retries.add()
+        self.backoff_seconds.add(wait)
+        if reason is not None:
+            self.count(self.retry_reasons, reason)
+
+    def record_error(self, error):
+        self.count(self.errors, type(error).__name__)
+
+    def count(self, counters, name):
+        counter = counters.get(name)
+        if counter is None:
+            with self.errors_lock:
+                counter = counters.setdefault(name, Counter())
+        counter.add()
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def snapshot(self):
+        elapsed = self.elapsed()
+        requests = self.requests.value
+        tokens = self.prompt_tokens.value + self.completion_tokens.value
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "requests": requests,
+            "requests_per_second": round(requests / elapsed, 3) if elapsed > 0 else 0,
+            "prompt_tokens": self.prompt_tokens.value,
+            "completion_tokens": self.completion_tokens.value,
+            "tokens_per_second": round(tokens / elapsed, 3) if elapsed > 0 else 0,
+            "latency_seconds": {name: round(value, 4) if isinstance(value, float) else value for name, value in self.latency.percentiles().items()},
+            "retries": self.retries.value,
+            "retries_by_reason": {name: counter.value for name, counter in list(self.retry_reasons.items())},
+            "backoff_seconds": round(self.backoff_seconds.value, 3),
+            "errors": {name: counter.value for name, counter in list(self.errors.items())},
+        }
+
+    def recent_latency(self, max_age=1):
+        # p50 and p95 for the live progress, published many times a second, so only recomputed once a second
+        now = time.monotonic()
+        if now - self.last_latency_time >= max_age:
+            self.last_latency = self.latency.percentiles((0.5, 0.95))
+            self.last_latency_time = now
+        return self.last_latency
@@ -0,0 +1,273 @@
+import argparse
+import email.parser
+import http.server
+import itertools
+import json
+import math
+import random
+import sys
+import threading
+import time
+
+from tokens import count_message_tokens
+
+
+class QuietHTTPServer(http.server.ThreadingHTTPServer):
+    # a client going away while its request is read or answered is routine here, a hedge's losing copy,
+    # a cancel or a client timeout, only anything else gets the usual traceback
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            http.server.ThreadingHTTPServer.handle_error(self, request, client_address)
+
+
+class MockOpenAIServer:
+    # Local stand-in for the chat completions endpoint, for measuring the job runner without paying for
+    # it. Each request waits a latency drawn from a lognormal around latency (latency_sigma of 0 makes
+    # it constant) plus prompt_token_latency per prompt token and token_latency per output token, then answers with usage counted the way the
+    # planner estimates it. A share of requests can be answered with a 429 carrying Retry-After, a 500,
+    # or held for timeout_seconds so the client times out. The files and batches endpoints run batch
+    # jobs: an uploaded jsonl of requests becomes a batch that completes after batch_polls retrieves,
+    # with every request answered as above but without the wait, failures going to its error file.
+    # Point a client at it with OPENAI_BASE_URL=<url> or base_url=<url>, GET /stats returns what it
+    # has served.
+    def __init__(self, host="127.0.0.1", port=0, latency=0.5, latency_sigma=0.5, token_latency=0.0, output_tokens=(10, 30),
+                 rate_limit_rate=0.0, server_error_rate=0.0, timeout_rate=0.0, retry_after=1, timeout_seconds=60, seed=None, prompt_token_latency=0.0, batch_polls=1):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.token_latency = token_latency
+        self.prompt_token_latency = prompt_token_latency
+        self.output_tokens = output_tokens
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.timeout_rate = timeout_rate
+        self.retry_after = retry_after
+        self.timeout_seconds = timeout_seconds
+        self.batch_polls = batch_polls
+        self.random = random.Random(seed)
+        self.counts = dict.fromkeys(["requests", "completions", "rate_limited", "server_errors", "timeouts", "prompt_tokens", "completion_tokens", "files", "batches"], 0)
+        self.lock = threading.Lock()
+        # file id -> (file object, content bytes), batch id -> [batch object, retrieves left]
+        self.files = dict()
+        self.batches = dict()
+        self.ids = itertools.count(1)
+        self.thread = None
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            # keep-alive, the openai client reuses its connections
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, body, headers=None):
+                self.send_data(status, json.dumps(body).encode("utf-8"), "application/json", headers)
+
+            def send_data(self, status, data, content_type, headers=None):
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(data)))
+                    for name, value in (headers or {}).items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client went away, a hedge's losing copy, a cancel or a client timeout
+                    self.close_connection = True
+
+            def do_GET(self):
+                if self.path.endswith("/models"):
+                    self.send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model", "created": 0, "owned_by": "mock"}]})
+                elif self.path.endswith("/stats"):
+                    self.send_json(200, server.stats())
+                elif "/files/" in self.path and self.path.endswith("/content"):
+                    content = server.file_content(self.path.split("/")[-2])
+                    if content is None:
+                        self.send_json(404, {"error": {"message": "No such file", "type": "invalid_request_error"}})
+                    else:
+                        self.send_data(200, content, "application/octet-stream")
+                elif "/batches/" in self.path:
+                    batch = server.retrieve_batch(self.path.split("/")[-1])
+                    if batch is None:
+                        self.send_json(404, {"error": {"message": "No such batch", "type": "invalid_request_error"}})
+                    else:
+                        self.send_json(200, batch)
+                else:
+                    self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.endswith("/files"):
+                    self.send_json(200, server.upload_file(self.headers.get("Content-Type", ""), data))
+                    return
+                request = json.loads(data or b"{}")
+                if self.path.endswith("/batches"):
+                    self.send_json(200, server.create_batch(request))
+                    return
+                if not self.path.endswith("/chat/completions"):
+                    self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                    return
+                status, body, headers, delay = server.handle(request)
+                time.sleep(delay)
+                self.send_json(status, body, headers)
+
+        self.httpd = QuietHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.request_queue_size = 1024
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.counts[name] += amount
+
+    def handle(self, request):
+        # returns (status, body, headers, seconds to wait before answering)
+        with self.lock:
+            roll = self.random.random()
+            latency = self.latency if self.latency_sigma <= 0 else self.random.lognormvariate(math.log(self.latency), self.latency_sigma)
+            completion_tokens = self.random.randint(*self.output_tokens)
+        self.count(requests=1)
+        if roll < self.rate_limit_rate:
+            self.count(rate_limited=1)
+            error = {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}
+            return 429, {"error": error}, {"retry-after": str(self.retry_after)}, 0
+        roll -= self.rate_limit_rate
+        if roll < self.server_error_rate:
+            self.count(server_errors=1)
+            return 500, {"error": {"message": "Internal server error (mock)", "type": "server_error"}}, None, latency
+        roll -= self.server_error_rate
+        if roll < self.timeout_rate:
+            self.count(timeouts=1)
+            return 500, {"error": {"message": "Held past the client timeout (mock)", "type": "server_error"}}, None, self.timeout_seconds
+
+        completion_tokens = min(completion_tokens, request.get("max_tokens") or completion_tokens)
+        prompt_tokens = count_message_tokens(request.get("messages", []))
+        self.count(completions=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        body = {
+            "id": f"chatcmpl-mock-{self.counts['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock-model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(["word"] * completion_tokens)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+        return 200, body, None, latency + self.prompt_token_latency * prompt_tokens + self.token_latency * completion_tokens
+
+    def next_id(self, prefix):
+        with self.lock:
+            return f"{prefix}-mock-{next(self.ids)}"
+
+    def add_file(self, file_name, content, purpose):
+        file_id = self.next_id("file")
+        file = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()), "filename": file_name, "purpose": purpose, "status": "processed"}
+        with self.lock:
+            self.files[file_id] = (file, content)
+        return file
+
+    def upload_file(self, content_type, data):
+        # a multipart/form-data upload with the file and its purpose
+        message = email.parser.BytesParser().parsebytes(b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + data)
+        fields = {part.get_param("name", header="content-disposition"): part for part in message.get_payload()}
+        self.count(files=1)
+        return self.add_file(fields["file"].get_filename() or "upload.jsonl", fields["file"].get_payload(decode=True), fields["purpose"].get_payload(decode=True).decode("utf-8"))
+
+    def file_content(self, file_id):
+        with self.lock:
+            entry = self.files.get(file_id)
+        return None if entry is None else entry[1]
+
+    def create_batch(self, request):
+        batch = {
+            "id": self.next_id("batch"),
+            "object": "batch",
+            "endpoint": request.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": request["input_file_id"],
+            "completion_window": request.get("completion_window", "24h"),
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        self.count(batches=1)
+        with self.lock:
+            self.batches[batch["id"]] = [batch, self.batch_polls]
+        return batch
+
+    def retrieve_batch(self, batch_id):
+        with self.lock:
+            entry = self.batches.get(batch_id)
+            if entry is None:
+                return None
+            entry[1] -= 1
+            run = entry[1] == 0
+        if run:
+            self.run_batch(entry[0])
+        return entry[0]
+
+    def run_batch(self, batch):
+        # answers every request of the batch's input file into an output and an error file
+        outputs = []
+        errors = []
+        for line in self.file_content(batch["input_file_id"]).decode("utf-8").splitlines():
+            if len(line.strip()) == 0:
+                continue
+            request = json.loads(line)
+            status, body, _, _ = self.handle(request["body"])
+            result = {"id": self.next_id("batch_req"), "custom_id": request["custom_id"], "response": {"status_code": status, "body": body}, "error": None}
+            (outputs if status == 200 else errors).append(json.dumps(result))
+        for name, lines in [("output_file_id", outputs), ("error_file_id", errors)]:
+            if len(lines) > 0:
+                batch[name] = self.add_file(f"{batch['id']}_{name[:-8]}.jsonl", ("\n".join(lines) + "\n").encode("utf-8"), "batch_output")["id"]
+        batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+        batch["status"] = "completed"
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI chat completions endpoint. Run a job against it with OPENAI_BASE_URL set to the printed url.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="median seconds per request")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="spread of the lognormal latency, 0 for a constant latency")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="extra seconds per output token")
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0, help="extra seconds per prompt token")
+    parser.add_argument("--output-tokens", type=int, nargs=2, default=[10, 30], metavar=("MIN", "MAX"), help="output tokens per response, capped at the request's max_tokens")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests held for --timeout-seconds")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--timeout-seconds", type=float, default=60)
+    parser.add_argument("--batch-polls", type=int, default=1, help="retrieves of a batch before it completes")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    mock = MockOpenAIServer(args.host, args.port, args.latency, args.latency_sigma, args.token_latency, tuple(args.output_tokens),
+                            args.rate_limit_rate, args.server_error_rate, args.timeout_rate, args.retry_after, args.timeout_seconds, prompt_token_latency=args.prompt_token_latency, batch_polls=args.batch_polls)
+    print(f"Mock OpenAI server on {mock.url}, Ctrl+C to stop")
+    try:
+        mock.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(mock.stats(), indent=4))
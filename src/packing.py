@@ -0,0 +1,57 @@
+import json
+import re
+
+
+PACK_INSTRUCTIONS = (
+    "Answer each of the following {count} inputs separately, exactly as you would answer it on its own. "
+    "Reply with only a JSON object that maps each input number to its answer as a string, "
+    'like {{"1": "answer to input 1", "2": "answer to input 2"}}.'
+)
+
+# room for the json keys and quoting around each answer
+TOKENS_PER_PACKED_ANSWER = 10
+
+
+def pack_items(items, size):
+    # groups (index, row, input) items into (indices, rows, inputs) packs of up to size items
+    pack = []
+    for item in items:
+        pack.append(item)
+        if len(pack) >= size:
+            yield tuple(zip(*pack))
+            pack = []
+    if len(pack) > 0:
+        yield tuple(zip(*pack))
+
+
+def build_pack_input(inputs):
+    numbered = {str(i + 1): input for i, input in enumerate(inputs)}
+    return PACK_INSTRUCTIONS.format(count=len(inputs)) + "\n\n" + json.dumps(numbered, ensure_ascii=False, indent=0)
+
+
+def pack_max_tokens(max_tokens, count):
+    return (max_tokens + TOKENS_PER_PACKED_ANSWER) * count
+
+
+def parse_pack_output(content, count):
+    # returns a list of count answers, None for any answer that couldn't be read
+    outputs = [None] * count
+    if content is None:
+        return outputs
+    # models sometimes wrap the json in a code fence or add a sentence around it
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    if match is None:
+        return outputs
+    try:
+        answers = json.loads(match.group(0))
+    except ValueError:
+        return outputs
+    if not isinstance(answers, dict):
+        return outputs
+    for i in range(count):
+        answer = answers.get(str(i + 1))
+        if isinstance(answer, str):
+            outputs[i] = answer
+        elif isinstance(answer, (int, float)) and not isinstance(answer, bool):
+            outputs[i] = str(answer)
+    return outputs
@@ -0,0 +1,116 @@
+import json
+import sys
+
+from readers import stream_file
+from tokens import TokenCounter, count_message_tokens, count_text_tokens, TOKENS_PER_MESSAGE
+from packing import PACK_INSTRUCTIONS, TOKENS_PER_PACKED_ANSWER
+from cache import RecentOutputs
+
+
+# used to project runtime when no latency is given: time to first token plus generation speed
+BASE_LATENCY = 0.5
+OUTPUT_TOKENS_PER_SECOND = 50
+
+
+def plan_job(config, batch_size=1000):
+    # Dry run of a job: reads the selected rows and tokenizes the prompts without calling the api,
+    # then projects tokens, cost and runtime. Output tokens are projected at max_tokens per request
+    # so the cost is an upper bound.
+    _, rows = stream_file(config["input_file"], config["input_columns"], config["row_start"], config["row_end"], config["separator"], columns=[])
+    message = [{"role": "system", "content": config["system_msg"]}] + config["context"]
+    counter = TokenCounter(config["model"], batch_size=batch_size)
+    context_tokens = count_message_tokens(message, counter.encoding)
+    deduplicate = config.get("deduplicate", True)
+    pack_rows = max(1, config.get("pack_rows", 1))
+
+    total_rows = 0
+    sent_rows = 0
+    # the same bounded window of recent inputs the job deduplicates with, a duplicate of an input that
+    # has aged out of it is sent again
+    seen = RecentOutputs(config.get("dedup_entries", 10000))
+    input_tokens = 0
+    batch = []
+
+    def count_batch(batch):
+        return sum(counter.count(batch)) + len(batch) * TOKENS_PER_MESSAGE
+
+    for _, _, input in rows:
+        total_rows += 1
+        if deduplicate:
+            if seen.get(input) is not None:
+                continue
+            seen.put(input, "")
+        sent_rows += 1
+        batch.append(input)
+        if len(batch) >= batch_size:
+            input_tokens += count_batch(batch)
+            batch = []
+    if len(batch) > 0:
+        input_tokens += count_batch(batch)
+
+    if pack_rows > 1:
+        requests = (sent_rows + pack_rows - 1) // pack_rows
+        instruction_tokens = count_text_tokens(PACK_INSTRUCTIONS, counter.encoding)
+        prompt_tokens = requests * (context_tokens + instruction_tokens) + input_tokens
+        output_tokens = sent_rows * (config["max_tokens"] + TOKENS_PER_PACKED_ANSWER)
+    else:
+        requests = sent_rows
+        prompt_tokens = requests * context_tokens + input_tokens
+        output_tokens = sent_rows * config["max_tokens"]
+
+    cost_multiplier = config.get("batch_discount", 0.5) if config.get("mode", "realtime") == "batch" else 1
+    cost = (config["input_cost"] * prompt_tokens / 1000 + config["output_cost"] * output_tokens / 1000) * cost_multiplier
+
+    # requests per second allowed by each limit, the smallest one sets the pace
+    output_per_request = output_tokens / requests if requests > 0 else 0
+    latency = config.get("latency_estimate") or BASE_LATENCY + output_per_request / OUTPUT_TOKENS_PER_SECOND
+    rates = {"workers": config["max_workers"] / latency}
+    if config.get("rpm_limit", 0) > 0:
+        rates["rpm_limit"] = config["rpm_limit"] / 60
+    if config.get("tpm_limit", 0) > 0 and requests > 0:
+        rates["tpm_limit"] = config["tpm_limit"] / 60 / ((prompt_tokens + output_tokens) / requests)
+    # a client pool is only limited when each of its members is, together they allow the sum
+    clients = config.get("clients") or []
+    if len(clients) > 0 and all(client.get("rpm_limit", 0) > 0 for client in clients):
+        rates["client_rpm_limits"] = sum(client["rpm_limit"] for client in clients) / 60
+    if len(clients) > 0 and all(client.get("tpm_limit", 0) > 0 for client in clients) and requests > 0:
+        rates["client_tpm_limits"] = sum(client["tpm_limit"] for client in clients) / 60 / ((prompt_tokens + output_tokens) / requests)
+    limited_by = min(rates, key=rates.get)
+    runtime = requests / rates[limited_by] if requests > 0 else 0
+
+    return {
+        "rows": total_rows,
+        "requests": requests,
+        "duplicate_rows": total_rows - sent_rows,
+        "context_tokens": context_tokens,
+        "prompt_tokens": prompt_tokens,
+        "max_output_tokens": output_tokens,
+        "max_cost": round(cost, 6),
+        "estimated_latency_seconds": round(latency, 3),
+        "estimated_runtime_seconds": round(runtime, 1),
+        "limited_by": limited_by,
+        "exact_tokenizer": counter.encoding is not None,
+    }
+
+
+def format_plan(plan):
+    runtime = plan["estimated_runtime_seconds"]
+    hours, remainder = divmod(int(runtime), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    lines = [
+        f"Rows: {plan['rows']} ({plan['duplicate_rows']} duplicates)",
+        f"Requests: {plan['requests']}",
+        f"Context Tokens Per Request: {plan['context_tokens']}",
+        f"Input Tokens: {plan['prompt_tokens']}",
+        f"Output Tokens (at most): {plan['max_output_tokens']}",
+        f"Cost (at most): ${plan['max_cost']}",
+        f"Runtime: about {hours}h {minutes}m {seconds}s, limited by {plan['limited_by']}",
+    ]
+    if not plan["exact_tokenizer"]:
+        lines.append("Token counts are estimated, install tiktoken for exact counts")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], "r") as config_file:
+        print(json.dumps(plan_job(json.load(config_file)), indent=4))
@@ -0,0 +1,84 @@
+import multiprocessing
+import threading
+import time
+
+
+# counters published by a job, the first slot is the sequence number guarding every write
+FIELDS = [
+    "sequence",
+    "rows",
+    "total",
+    "failed",
+    "input_tokens",
+    "output_tokens",
+    "cost",
+    "requests",
+    "errors",
+    "retries",
+    "workers",
+    "max_workers",
+    "cache_hits",
+    "cache_misses",
+    "saved_calls",
+    "skipped",
+    "packing_saved_tokens",
+    "latency_p50",
+    "latency_p95",
+    "elapsed",
+    "finished",
+]
+FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+MESSAGE_SIZE = 256
+
+
+class Progress:
+    # Job progress in shared memory. The job process writes its counters in place and the GUI
+    # samples them on a timer, so nothing is pickled or queued per completion. The sequence number
+    # is odd while a write is in progress, a reader that sees it odd or changed reads again.
+    # Cancellation travels the other way, the GUI sets the event and the job checks it between rows.
+    def __init__(self):
+        self.values = multiprocessing.RawArray("d", len(FIELDS))
+        self.message_buffer = multiprocessing.RawArray("c", MESSAGE_SIZE)
+        self.cancel_event = multiprocessing.Event()
+        self.values[FIELD_INDEX["total"]] = -1
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # the shared arrays travel to the job process, the lock only guards writer threads within it
+        return {"values": self.values, "message_buffer": self.message_buffer, "cancel_event": self.cancel_event}
+
+    def __setstate__(self, state):
+        self.values = state["values"]
+        self.message_buffer = state["message_buffer"]
+        self.cancel_event = state["cancel_event"]
+        self.lock = threading.Lock()
+
+    def publish(self, values=None, message=None):
+        with self.lock:
+            self.values[0] += 1
+            for name, value in (values or {}).items():
+                self.values[FIELD_INDEX[name]] = value
+            if message is not None:
+                self.message_buffer.value = message.encode("utf-8")[:MESSAGE_SIZE - 1]
+            self.values[0] += 1
+
+    def read(self, attempts=100):
+        # returns (values, message), values maps every field but the sequence number
+        for _ in range(attempts):
+            sequence = self.values[0]
+            values = list(self.values)
+            message = self.message_buffer.value
+            if sequence % 2 == 0 and self.values[0] == sequence:
+                break
+            time.sleep(0)
+        return dict(zip(FIELDS[1:], values[1:])), message.decode("utf-8", errors="replace")
+
+    def request_cancel(self):
+        self.cancel_event.set()
+
+    def cancel_requested(self):
+        return self.cancel_event.is_set()
+
+    def wait_for_cancel(self, timeout):
+        # sleeps up to timeout seconds, returns True as soon as a cancel is requested
+        return self.cancel_event.wait(timeout)
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+from tokens import get_encoding, count_message_tokens, TOKENS_PER_REPLY
+
+
+class TokenBucket:
+    # Refills at rate_per_minute, holding at most burst_seconds worth. Callers reserve what they
+    # need up front and are told how long to wait for it, so waiting callers are served in order.
+    def __init__(self, rate_per_minute, burst_seconds=10):
+        self.rate = rate_per_minute / 60
+        self.capacity = self.rate * burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self.refill(now)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def refund(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    # Client side requests per minute and tokens per minute limits, a limit of 0 is unlimited.
+    # A request is charged its estimated prompt tokens plus max_tokens before it is sent, the
+    # difference from the actual usage is settled afterwards and also used to correct later estimates.
+    def __init__(self, rpm=0, tpm=0, model=None):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.encoding = get_encoding(model) if self.tokens is not None else None
+        self.lock = threading.Lock()
+        # actual prompt tokens / estimated prompt tokens
+        self.correction = 1.0
+        # every request repeats the same system message and context, only count them once
+        self.prefix = None
+        self.prefix_tokens = 0
+
+    @property
+    def enabled(self):
+        return self.requests is not None or self.tokens is not None
+
+    def estimate(self, messages, max_tokens):
+        if self.tokens is None:
+            return 0, 0
+        prefix = messages[:-1]
+        if prefix != self.prefix:
+            self.prefix_tokens = count_message_tokens(prefix, self.encoding)
+            self.prefix = prefix
+        prompt_tokens = self.prefix_tokens + count_message_tokens(messages[-1:], self.encoding) - TOKENS_PER_REPLY
+        return prompt_tokens, int(prompt_tokens * self.correction) + max_tokens
+
+    def reserve(self, charge):
+        now = time.monotonic()
+        with self.lock:
+            wait = 0
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.reserve(charge, now))
+        return wait
+
+    def admit(self, messages, max_tokens):
+        # blocks until the request fits in both buckets, returns what settle needs afterwards
+        estimate, charge = self.estimate(messages, max_tokens)
+        wait = self.reserve(charge)
+        if wait > 0:
+            time.sleep(wait)
+        return estimate, charge
+
+    async def admit_async(self, messages, max_tokens):
+        estimate, charge = self.estimate(messages, max_tokens)
+        wait = self.reserve(charge)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return estimate, charge
+
+    def settle(self, admission, usage=None):
+        # usage is None when the request failed, nothing but the request itself was spent
+        estimate, charge = admission
+        if self.tokens is None:
+            return
+        with self.lock:
+            if usage is None:
+                self.tokens.refund(charge)
+                return
+            self.tokens.refund(charge - usage.prompt_tokens - usage.completion_tokens)
+            if estimate > 0:
+                self.correction = 0.9 * self.correction + 0.1 * (usage.prompt_tokens / estimate)
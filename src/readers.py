@@ -0,0 +1,232 @@
+import csv
+import itertools
+import json
+import os
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# file extension -> format, anything else is read as csv
+FILE_FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+
+# rows per record batch read from parquet
+BATCH_ROWS = 10000
+
+
+def file_format(file_name):
+    return FILE_FORMATS.get(os.path.splitext(file_name)[1].lower(), "csv")
+
+
+def require_pyarrow(format):
+    if pyarrow is None:
+        raise Exception(f"Reading and writing {format} files needs pyarrow, install it with: pip install pyarrow")
+
+
+def format_row(input_columns, separator, row):
+    return separator.join(str(row[column]) for column in input_columns)
+
+
+def parse_input_columns(input_columns_input, input_headers):
+    input_columns = list()
+    for column in input_columns_input.split(","):
+        input_columns.append(int(column) - 1)
+        if int(column) < 1:
+            raise Exception("Input column cannot be less than 1")
+    missing_columns = set(input_columns) - set(range(len(input_headers)))
+    if len(missing_columns) > 0:
+        raise Exception(f"Input column(s) {','.join([str(column + 1) for column in missing_columns])} not found in input file")
+    return input_columns
+
+
+def read_csv_headers(file_name, input_columns_input):
+    with open(file_name, "r", newline="") as input_file:
+        reader = csv.reader(input_file)
+        input_headers = next(reader)
+    return input_headers, parse_input_columns(input_columns_input, input_headers)
+
+
+def read_jsonl_headers(file_name):
+    # the keys of the first object, in order
+    with open(file_name, "r", encoding="utf-8") as input_file:
+        for line in input_file:
+            if len(line.strip()) > 0:
+                return list(json.loads(line).keys())
+    return []
+
+
+def open_arrow_file(file_name):
+    # memory mapped, record batches are read straight from the page cache without a copy
+    return pyarrow.ipc.open_file(pyarrow.memory_map(file_name, "r"))
+
+
+def read_schema(file_name):
+    # arrow schema of a parquet or arrow file, None for the text formats
+    format = file_format(file_name)
+    if format == "parquet":
+        require_pyarrow(format)
+        return pyarrow.parquet.read_schema(file_name, memory_map=True)
+    if format == "arrow":
+        require_pyarrow(format)
+        return open_arrow_file(file_name).schema
+    return None
+
+
+def read_headers(file_name, input_columns_input):
+    format = file_format(file_name)
+    if format == "csv":
+        return read_csv_headers(file_name, input_columns_input)
+    if format == "jsonl":
+        input_headers = read_jsonl_headers(file_name)
+    else:
+        input_headers = read_schema(file_name).names
+    return input_headers, parse_input_columns(input_columns_input, input_headers)
+
+
+def parse_row_range(row_start="start", row_end="end", number=0):
+    # row_end of None means read until the end of the file
+    try:
+        row_start = (0 if str(row_start).lower() == "start" else int(row_start))
+        if number != 0:
+            row_end = row_start + number
+        else:
+            row_end = (None if str(row_end).lower() == "end" else int(row_end))
+        if row_start < 0:
+            raise Exception("Row start cannot be less than 0")
+        if row_end is not None and row_end < 0:
+            raise Exception("Row end cannot be less than 0")
+        if row_end is not None and row_start > row_end:
+            raise Exception("Row start must be less than row end")
+    except ValueError:
+        raise Exception("Row start and row end must be integers or 'start' and 'end'")
+    return row_start, row_end
+
+
+def count_csv_rows(file_name):
+    # number of rows after the headers, read as csv so quoted newlines don't count
+    with open(file_name, "r", newline="") as input_file:
+        reader = csv.reader(input_file)
+        next(reader, None)
+        return sum(1 for _ in reader)
+
+
+def count_rows(file_name):
+    # parquet and arrow files know their row count without reading the data
+    format = file_format(file_name)
+    if format == "csv":
+        return count_csv_rows(file_name)
+    if format == "jsonl":
+        with open(file_name, "rb") as input_file:
+            return sum(1 for _ in input_file)
+    if format == "parquet":
+        require_pyarrow(format)
+        return pyarrow.parquet.ParquetFile(file_name, memory_map=True).metadata.num_rows
+    require_pyarrow(format)
+    reader = open_arrow_file(file_name)
+    return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+def iter_csv_rows(file_name, input_columns, row_start=0, row_end=None, separator=" - "):
+    # Single pass over the file, yields (row index, row, formatted input) for the selected range
+    with open(file_name, "r", newline="") as input_file:
+        reader = csv.reader(input_file)
+        next(reader) # skip headers
+        for index, row in enumerate(itertools.islice(reader, row_start, row_end), row_start):
+            if len(row) == 0:
+                continue
+            yield index, row, format_row(input_columns, separator, row)
+
+
+def iter_jsonl_rows(file_name, input_columns, row_start=0, row_end=None, separator=" - "):
+    # one object per line, a row is its values in the order of the first object's keys
+    input_headers = read_jsonl_headers(file_name)
+    with open(file_name, "r", encoding="utf-8") as input_file:
+        for index, line in enumerate(itertools.islice(input_file, row_start, row_end), row_start):
+            if len(line.strip()) == 0:
+                continue
+            data = json.loads(line)
+            row = ["" if data.get(name) is None else data[name] for name in input_headers]
+            yield index, row, format_row(input_columns, separator, row)
+
+
+def iter_record_batches(file_name, format, names, row_start):
+    # yields (index of the batch's first row, batch) from the first batch holding row_start on,
+    # batches before it are skipped from the file's metadata without being read
+    if format == "parquet":
+        parquet_file = pyarrow.parquet.ParquetFile(file_name, memory_map=True)
+        metadata = parquet_file.metadata
+        start = 0
+        group = 0
+        while group < metadata.num_row_groups and start + metadata.row_group(group).num_rows <= row_start:
+            start += metadata.row_group(group).num_rows
+            group += 1
+        if group == metadata.num_row_groups:
+            return
+        for batch in parquet_file.iter_batches(batch_size=BATCH_ROWS, row_groups=range(group, metadata.num_row_groups), columns=names):
+            yield start, batch
+            start += batch.num_rows
+        return
+    reader = open_arrow_file(file_name)
+    start = 0
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        if start + batch.num_rows > row_start:
+            yield start, batch.select(names)
+        start += batch.num_rows
+
+
+def iter_table_rows(file_name, input_columns, row_start=0, row_end=None, separator=" - ", columns=None):
+    # Rows of a parquet or arrow file. Only the given column indices are read, the others are left
+    # empty in the row, columns of None reads them all.
+    format = file_format(file_name)
+    require_pyarrow(format)
+    input_headers = read_schema(file_name).names
+    columns = range(len(input_headers)) if columns is None else sorted(set(columns) | set(input_columns))
+    names = [input_headers[column] for column in columns]
+    for start, batch in iter_record_batches(file_name, format, names, row_start):
+        values = [batch.column(i).to_pylist() for i in range(len(names))]
+        for offset in range(max(row_start - start, 0), batch.num_rows):
+            index = start + offset
+            if row_end is not None and index >= row_end:
+                return
+            row = [""] * len(input_headers)
+            for column, column_values in zip(columns, values):
+                if column_values[offset] is not None:
+                    row[column] = column_values[offset]
+            yield index, row, format_row(input_columns, separator, row)
+
+
+def stream_file(file_name, input_columns_input, row_start="start", row_end="end", separator=" - ", number=0, columns=None):
+    # input headers and a generator of (row index, row, formatted input) for any supported format,
+    # columns limits which columns of a parquet or arrow file are read
+    input_headers, input_columns = read_headers(file_name, input_columns_input)
+    row_start, row_end = parse_row_range(row_start, row_end, number)
+    format = file_format(file_name)
+    if format == "csv":
+        return input_headers, iter_csv_rows(file_name, input_columns, row_start, row_end, separator)
+    if format == "jsonl":
+        return input_headers, iter_jsonl_rows(file_name, input_columns, row_start, row_end, separator)
+    return input_headers, iter_table_rows(file_name, input_columns, row_start, row_end, separator, columns)
+
+
+def read_file(file_name, input_columns_input, row_start="start", row_end="end", separator=" - ", number=0):
+    input_headers, rows = stream_file(file_name, input_columns_input, row_start, row_end, separator, number)
+    input_data = []
+    input_column_data = []
+    for _, row, input in rows:
+        input_data.append(row)
+        input_column_data.append(input)
+    return input_headers, input_data, input_column_data
@@ -0,0 +1,95 @@
+import datetime
+import email.utils
+import random
+import threading
+
+import openai
+
+
+# backoff for each kind of retryable error: retries allowed per request, delay before the first
+# retry in seconds, doubling up to max_delay. A timeout's base delay is the job's sleep_time.
+RETRY_RULES = {
+    "rate_limit": {"max_retries": 10, "base_delay": 1, "max_delay": 60},
+    "server_error": {"max_retries": 5, "base_delay": 1, "max_delay": 30},
+    "timeout": {"max_retries": 5, "base_delay": 10, "max_delay": 60},
+    "connection": {"max_retries": 5, "base_delay": 0.5, "max_delay": 30},
+}
+
+# the longest Retry-After that is honored, anything longer is capped to it
+MAX_RETRY_AFTER = 120
+
+
+def classify_error(error):
+    # returns the RETRY_RULES key for a retryable error, None for one that won't get better by retrying
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection"
+    if isinstance(error, openai.RateLimitError):
+        # out of credit is a 429 too, but no amount of waiting fixes it
+        return None if getattr(error, "code", None) == "insufficient_quota" else "rate_limit"
+    if isinstance(error, openai.APIStatusError) and (error.status_code >= 500 or error.status_code == 408):
+        return "server_error"
+    return None
+
+
+def retry_after(error):
+    # seconds the server asked us to wait, from retry-after-ms or retry-after (seconds or an http date)
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            date = email.utils.parsedate_to_datetime(value)
+            return max((date - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    # One retry policy for every request of a job. Each error class backs off exponentially with
+    # jitter, or for as long as the server's Retry-After asks. A retry budget shared by all requests
+    # caps retries at budget_minimum plus budget_ratio of the requests made, so a failing api
+    # fails the job instead of multiplying the load on it.
+    def __init__(self, sleep_time=10, budget_ratio=0.2, budget_minimum=100):
+        self.rules = {name: dict(rule) for name, rule in RETRY_RULES.items()}
+        self.rules["timeout"]["base_delay"] = sleep_time
+        self.budget_ratio = budget_ratio
+        self.budget_minimum = budget_minimum
+        self.requests = 0
+        self.retries = 0
+        self.exhausted = 0
+        self.lock = threading.Lock()
+
+    def record_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def delay(self, error, attempt):
+        # returns (error class, seconds to wait) before retrying a request that failed attempt + 1 times,
+        # or None when it should not be retried
+        reason = classify_error(error)
+        if reason is None:
+            return None
+        rule = self.rules[reason]
+        if attempt >= rule["max_retries"]:
+            return None
+        with self.lock:
+            if self.retries >= self.budget_minimum + self.budget_ratio * self.requests:
+                self.exhausted += 1
+                return None
+            self.retries += 1
+        wait = retry_after(error)
+        if wait is not None:
+            # a little jitter so requests told the same time don't all come back at once
+            return reason, min(wait, MAX_RETRY_AFTER) * random.uniform(1, 1.1)
+        wait = min(rule["max_delay"], rule["base_delay"] * 2 ** attempt)
+        return reason, wait / 2 + random.uniform(0, wait / 2)
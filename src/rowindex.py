@@ -0,0 +1,122 @@
+import codecs
+import csv
+import hashlib
+import io
+import itertools
+import json
+import locale
+import os
+import threading
+
+from readers import read_csv_headers, format_row, file_format, stream_file
+
+
+# rows between the byte offsets kept in an index, a read seeks to the one before its first row
+STRIDE = 1000
+
+
+def build_offsets(file_name, stride=STRIDE):
+    # Returns the byte offset of every stride-th data row and the number of data rows. The file is
+    # parsed by the csv module so quoted newlines don't end a row, it pulls one line at a time and
+    # stops at the end of a row, so the bytes read so far always end on a row boundary.
+    offsets = []
+    position = 0
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))()
+    with open(file_name, "rb") as input_file:
+        def lines():
+            nonlocal position
+            for line in input_file:
+                position += len(line)
+                yield decoder.decode(line)
+        reader = csv.reader(lines())
+        if next(reader, None) is None:
+            return offsets, 0
+        rows = 0
+        offsets.append(position)
+        for _ in reader:
+            rows += 1
+            if rows % stride == 0:
+                offsets.append(position)
+    return offsets, rows
+
+
+class RowIndexes:
+    # Row indexes of csv files, kept in memory and on disk and rebuilt when a file's mtime or size
+    # changes. Reading rows from the middle of a large file then costs a seek and at most stride rows
+    # of parsing instead of a pass over everything before them.
+    def __init__(self, path, stride=STRIDE):
+        self.path = str(path)
+        self.stride = stride
+        self.indexes = dict()
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def get(self, file_name):
+        # returns (offsets, rows), building the index if the file changed since it was last indexed
+        file_name = os.path.abspath(file_name)
+        stat = os.stat(file_name)
+        version = [stat.st_mtime_ns, stat.st_size, self.stride]
+        # one build at a time, a preview asking for a file that is being indexed waits for it
+        with self.lock:
+            cached = self.indexes.get(file_name)
+            if cached is not None and cached["version"] == version:
+                return cached["offsets"], cached["rows"]
+            index_path = os.path.join(self.path, hashlib.sha256(file_name.encode("utf-8")).hexdigest() + ".json")
+            try:
+                with open(index_path, "r") as index_file:
+                    cached = json.load(index_file)
+            except (OSError, ValueError):
+                cached = None
+            if cached is None or cached["version"] != version:
+                offsets, rows = build_offsets(file_name, self.stride)
+                cached = {"version": version, "offsets": offsets, "rows": rows}
+                with open(index_path, "w") as index_file:
+                    json.dump(cached, index_file)
+            self.indexes[file_name] = cached
+            return cached["offsets"], cached["rows"]
+
+    def prefetch(self, file_name):
+        # builds the index on a background thread so the first preview far into the file doesn't wait
+        def build():
+            try:
+                self.get(file_name)
+            except (OSError, csv.Error, UnicodeDecodeError):
+                pass
+        thread = threading.Thread(target=build)
+        thread.daemon = True
+        thread.start()
+
+    def read_rows(self, file_name, row_start, number):
+        # yields (row index, row) for number rows from row_start. Rows near the top are read straight
+        # from the head of the file, anything further seeks using the index
+        if row_start < self.stride:
+            with open(file_name, "r", newline="") as input_file:
+                reader = csv.reader(input_file)
+                next(reader, None)
+                yield from enumerate(itertools.islice(reader, row_start, row_start + number), row_start)
+            return
+        offsets, rows = self.get(file_name)
+        if row_start >= rows:
+            return
+        block = min(row_start // self.stride, len(offsets) - 1)
+        skip = row_start - block * self.stride
+        with open(file_name, "rb") as raw_file:
+            raw_file.seek(offsets[block])
+            with io.TextIOWrapper(raw_file, newline="") as input_file:
+                reader = csv.reader(input_file)
+                yield from enumerate(itertools.islice(reader, skip, skip + number), row_start)
+
+    def preview(self, file_name, input_columns_input, row_start, number, separator=" - "):
+        # formatted inputs of the first number non-empty rows from row_start, like read_csv_file
+        # without parsing the rows before row_start or after the last one shown
+        if file_format(file_name) != "csv":
+            # parquet and arrow skip to row_start from their metadata, jsonl lines are cheap to skip
+            _, rows = stream_file(file_name, input_columns_input, row_start, "end", separator, number, columns=[])
+            return [input for _, _, input in rows]
+        _, input_columns = read_csv_headers(file_name, input_columns_input)
+        row_start = 0 if str(row_start).lower() == "start" else int(row_start)
+        inputs = []
+        for _, row in self.read_rows(file_name, row_start, number):
+            if len(row) > 0:
+                inputs.append(format_row(input_columns, separator, row))
+        return inputs
@@ -0,0 +1,244 @@
+import csv
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import signal
+import threading
+import time
+
+from job import Job
+from readers import read_headers, parse_row_range, count_rows, file_format, pyarrow
+from log import Log
+from progress import Progress, FIELDS
+
+
+# seconds between aggregated progress updates
+AGGREGATE_INTERVAL = 0.25
+
+# progress fields that add up across shards, the rest are combined in aggregate
+LATENCY_FIELDS = ["latency_p50", "latency_p95"]
+SUMMED_FIELDS = [name for name in FIELDS if name not in ["sequence", "elapsed", "finished"] + LATENCY_FIELDS]
+
+# summary fields that add up across shards
+SUMMED_STATS = [
+    "rows", "failed_rows", "abandoned_rows", "skipped_rows", "calls_saved_by_deduplication", "prompt_tokens_saved_by_packing",
+    "cost", "input_tokens", "output_tokens", "requests", "prompt_tokens", "completion_tokens", "retries", "backoff_seconds",
+    "retry_budget_exhausted",
+]
+
+
+def shard_ranges(row_start, row_end, processes):
+    # splits [row_start, row_end) into up to processes contiguous ranges of near equal size
+    rows = row_end - row_start
+    count = max(1, min(processes, rows))
+    size = math.ceil(rows / count) if rows > 0 else 0
+    return [(start, min(start + size, row_end)) for start in range(row_start, row_start + size * count, size)] if size > 0 else [(row_start, row_end)]
+
+
+def run_shard(config, log_path, progress):
+    # entry point of a shard process, the parent removes the journal once the shard outputs are merged.
+    # A Ctrl+C reaches every process in the group, only the parent acts on it and cancels the shards
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    Job(config, log_path, progress, console=False, keep_journal=True).main()
+
+
+class ShardedJob:
+    # Runs a job as several Job processes, each on a contiguous slice of the selected rows with its own
+    # client and its share of max_workers and the rate limits. Their progress is summed into the
+    # caller's Progress and their outputs are appended in shard order, so the output file is the same
+    # as one process would write.
+    def __init__(self, config, log_path, progress=None, console=True):
+        self.config = config
+        self.log_path = log_path
+        self.log = Log(log_path)
+        self.progress = progress if progress is not None else Progress()
+        self.console = console
+        self.output_file_name = config["output_file"]
+        # the shard files are named after the output file, so their format is passed on rather than guessed
+        self.output_format = config.get("output_format") or file_format(self.output_file_name)
+        self.cancelled = False
+        self.failed = 0
+        self.stats = None
+        self.start = time.monotonic()
+
+        row_start, row_end = parse_row_range(config["row_start"], config["row_end"])
+        if row_end is None:
+            row_end = max(row_start, count_rows(config["input_file"]))
+        self.ranges = shard_ranges(row_start, row_end, config.get("processes", 1))
+        self.shards = []
+        for number, (start, end) in enumerate(self.ranges):
+            shard_config = dict(config)
+            shard_config.update({
+                "row_start": start,
+                "row_end": end,
+                "output_file": f"{self.output_file_name}.shard-{number + 1:03d}",
+                "include_headers": False,
+                "output_format": self.output_format,
+                "max_workers": max(1, math.ceil(config["max_workers"] / len(self.ranges))),
+                "rpm_limit": config.get("rpm_limit", 0) / len(self.ranges),
+                "tpm_limit": config.get("tpm_limit", 0) / len(self.ranges),
+                "clients": [dict(entry, rpm_limit=entry.get("rpm_limit", 0) / len(self.ranges), tpm_limit=entry.get("tpm_limit", 0) / len(self.ranges)) for entry in config.get("clients") or []],
+            })
+            self.shards.append({"config": shard_config, "progress": Progress(), "process": None})
+
+    def aggregate(self):
+        values = dict.fromkeys(SUMMED_FIELDS + LATENCY_FIELDS, 0)
+        messages = []
+        finished = 0
+        for shard in self.shards:
+            shard_values, message = shard["progress"].read()
+            for name in SUMMED_FIELDS:
+                values[name] += shard_values[name]
+            # percentiles don't add up, the slowest shard's stand for the job
+            for name in LATENCY_FIELDS:
+                values[name] = max(values[name], shard_values[name])
+            finished += int(shard_values["finished"])
+            if len(message) > 0 and not shard_values["finished"]:
+                messages.append(message)
+        values["elapsed"] = time.monotonic() - self.start
+        message = f"Shards Finished: {finished}/{len(self.shards)}"
+        if len(messages) > 0:
+            message += f" | {messages[0]}"
+        self.progress.publish(values, message)
+
+    def main(self):
+        self.log.write(f"Running job as {len(self.shards)} shards of rows {self.ranges[0][0]} to {self.ranges[-1][1]}")
+        # Daemonic so the shards go down with a job process that exits on an error. A job process stopped
+        # with SIGTERM, as the GUI stops it, skips multiprocessing's exit handler and would leave the
+        # shards running as orphans, so they are stopped first. The headless runner handles SIGTERM
+        # itself as a cancel, which reaches the shards through their progress
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+            previous_handler = signal.signal(signal.SIGTERM, self.stop_shards)
+        try:
+            for shard in self.shards:
+                shard["process"] = multiprocessing.Process(target=run_shard, args=(shard["config"], self.log_path, shard["progress"]), daemon=True)
+                shard["process"].start()
+            self.wait_for_shards()
+        finally:
+            if previous_handler is not None:
+                signal.signal(signal.SIGTERM, previous_handler)
+
+        errors = [number + 1 for number, shard in enumerate(self.shards) if not shard["progress"].read()[0]["finished"]]
+        if len(errors) > 0:
+            # the finished shards keep their journals, running the job again only redoes the rest
+            raise Exception(f"Shards {errors} stopped with an error, see log. Run the job again to resume them")
+
+        self.merge_outputs()
+        self.stats = self.merge_summaries(self.shard_summaries())
+        summary = self.stats
+        self.cancelled = summary["cancelled"]
+        self.failed = summary["failed_rows"]
+        with open(self.output_file_name + ".stats.json", "w") as summary_file:
+            json.dump(summary, summary_file, indent=4)
+        self.remove_shards(summary["shards"])
+        self.progress.publish({"finished": 1}, "Job Cancelled" if self.cancelled else "Job Complete")
+        if self.console:
+            print(("Job Cancelled. Completed rows written to: " if self.cancelled else "Job Complete. Output written to: ") + self.output_file_name)
+            print("Total Cost: $" + str(summary["cost"]))
+            print("Total Tokens: " + str(summary["input_tokens"] + summary["output_tokens"]))
+            if self.failed > 0:
+                print(f"Failed Rows: {self.failed}, run the job again to retry them")
+
+    def wait_for_shards(self):
+        cancel_sent = False
+        while any(shard["process"].is_alive() for shard in self.shards):
+            if not cancel_sent and self.progress.cancel_requested():
+                for shard in self.shards:
+                    shard["progress"].request_cancel()
+                cancel_sent = True
+            self.aggregate()
+            # a shard that finished cancelled can be held open by its abandoned calls
+            for shard in self.shards:
+                if cancel_sent and shard["progress"].read()[0]["finished"] and shard["process"].is_alive():
+                    shard["process"].terminate()
+            time.sleep(AGGREGATE_INTERVAL)
+        self.aggregate()
+
+    def stop_shards(self, signum, frame):
+        for shard in self.shards:
+            if shard["process"] is not None and shard["process"].is_alive():
+                shard["process"].terminate()
+        for shard in self.shards:
+            if shard["process"] is not None:
+                shard["process"].join()
+        # then go down with the signal as the job process would have without the handler
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    def merge_outputs(self):
+        if self.output_format == "parquet":
+            # parquet files can't be joined end to end, their row groups are copied into a new file
+            output_file = None
+            for shard in self.shards:
+                shard_file = pyarrow.parquet.ParquetFile(shard["config"]["output_file"])
+                if output_file is None:
+                    output_file = pyarrow.parquet.ParquetWriter(self.output_file_name, shard_file.schema_arrow)
+                for group in range(shard_file.num_row_groups):
+                    output_file.write_table(shard_file.read_row_group(group))
+            output_file.close()
+            return
+        with open(self.output_file_name, "w", newline="") as output_file:
+            if self.config["include_headers"] and self.output_format == "csv":
+                csv.writer(output_file).writerow(read_headers(self.config["input_file"], self.config["input_columns"])[0])
+            for shard in self.shards:
+                with open(shard["config"]["output_file"], "r", newline="") as shard_file:
+                    shutil.copyfileobj(shard_file, output_file)
+
+    def shard_summaries(self):
+        summaries = []
+        for shard in self.shards:
+            with open(shard["config"]["output_file"] + ".stats.json", "r") as summary_file:
+                summaries.append(json.load(summary_file))
+        return summaries
+
+    def summary(self):
+        return self.stats
+
+    def merge_summaries(self, summaries):
+        summary = {
+            "output_file": self.output_file_name,
+            "model": self.config["model"],
+            "processes": len(self.shards),
+            "cancelled": any(shard_summary["cancelled"] for shard_summary in summaries),
+            "elapsed_seconds": round(time.monotonic() - self.start, 3),
+        }
+        for name in SUMMED_STATS:
+            summary[name] = sum(shard_summary.get(name, 0) for shard_summary in summaries)
+        summary["cost"] = round(summary["cost"], 6)
+        errors = dict()
+        for shard_summary in summaries:
+            for name, count in shard_summary.get("errors", {}).items():
+                errors[name] = errors.get(name, 0) + count
+        summary["errors"] = errors
+        clients = dict()
+        for shard_summary in summaries:
+            for client in shard_summary.get("clients", []):
+                if client["name"] not in clients:
+                    clients[client["name"]] = dict(client)
+                    continue
+                merged = clients[client["name"]]
+                for name in ["requests", "errors", "prompt_tokens", "completion_tokens", "cost"]:
+                    merged[name] += client[name]
+                merged["cost"] = round(merged["cost"], 6)
+                merged["disabled"] = merged["disabled"] or client["disabled"]
+        if len(clients) > 0:
+            summary["clients"] = list(clients.values())
+        summary["requests_per_second"] = round(summary["requests"] / summary["elapsed_seconds"], 3) if summary["elapsed_seconds"] > 0 else 0
+        # latency percentiles can't be merged from the summaries, each shard's are kept as they are
+        summary["shards"] = summaries
+        return summary
+
+    def remove_shards(self, summaries):
+        for shard, shard_summary in zip(self.shards, summaries):
+            path = shard["config"]["output_file"]
+            # a shard with rows left to do keeps its journal for the next run
+            suffixes = ["", ".stats.json"]
+            if shard_summary["failed_rows"] == 0 and not shard_summary["cancelled"]:
+                suffixes.append(".journal")
+            for suffix in suffixes:
+                if os.path.isfile(path + suffix):
+                    os.remove(path + suffix)
@@ -0,0 +1,61 @@
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+# tokens the chat format adds around every message and to prime the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+def get_encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_text_tokens(text, encoding=None):
+    if encoding is None:
+        # roughly 4 characters per token for english text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages, encoding=None):
+    tokens = TOKENS_PER_REPLY
+    for message in messages:
+        tokens += TOKENS_PER_MESSAGE + count_text_tokens(message["content"], encoding)
+    return tokens
+
+
+def count_texts_tokens(texts, encoding=None):
+    if encoding is None:
+        return [count_text_tokens(text) for text in texts]
+    return [len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=())]
+
+
+class TokenCounter:
+    # Counts tokens for many texts a batch at a time, remembering the counts of recent texts so
+    # repeated inputs are only tokenized once
+    def __init__(self, model=None, batch_size=1000, cache_size=100000):
+        self.encoding = get_encoding(model)
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.cache = dict()
+
+    def count(self, texts):
+        counts = {text: self.cache.get(text) for text in texts}
+        missing = [text for text, count in counts.items() if count is None]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            for text, count in zip(batch, count_texts_tokens(batch, self.encoding)):
+                counts[text] = count
+                if len(self.cache) >= self.cache_size:
+                    # drop the oldest entry, dicts keep insertion order
+                    del self.cache[next(iter(self.cache))]
+                self.cache[text] = count
+        return [counts[text] for text in texts]
@@ -0,0 +1,174 @@
+import csv
+import json
+import time
+import collections
+
+from readers import file_format, require_pyarrow, pyarrow
+
+
+# rows per parquet row group, the file can't be read until it is closed so rows are only held to this
+PARQUET_GROUP_ROWS = 50000
+
+
+class OutputWriter:
+    # Appends rows to the output csv as they complete. Rows can finish out of order so they are held
+    # in a reorder buffer until every row dispatched before them has been written.
+    def __init__(self, file_name, input_headers, output_column, keep_data, include_headers, log, flush_rows=100, flush_interval=5, append=False):
+        self.file_name = file_name
+        self.input_headers = input_headers
+        self.output_column = output_column
+        self.keep_data = keep_data
+        self.log = log
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+
+        self.expected = collections.deque()
+        self.buffer = dict()
+        self.written = 0
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+        self.column_warning = False
+
+        self.open(include_headers, append)
+
+    def open(self, include_headers, append):
+        self.output_file = open(self.file_name, "a" if append else "w", newline="")
+        self.writer = csv.writer(self.output_file)
+        if include_headers and not append:
+            self.writer.writerow(self.input_headers)
+
+    def expect(self, index):
+        self.expected.append(index)
+
+    def add(self, index, row, output):
+        self.buffer[index] = (row, output)
+        while len(self.expected) > 0 and self.expected[0] in self.buffer:
+            row, output = self.buffer.pop(self.expected.popleft())
+            self.write_row(row, output)
+        if self.unflushed >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def build_row(self, row, output):
+        if not self.keep_data:
+            return [output]
+        try:
+            row[self.output_column] = output
+        except IndexError:
+            if not self.column_warning:
+                self.log.write("Output column is out of range")
+                self.column_warning = True
+            for j in range(self.output_column - len(row)):
+                row.append(None)
+            row.append(output)
+        return row
+
+    def write_row(self, row, output):
+        self.write_values(self.build_row(row, output))
+        self.written += 1
+        self.unflushed += 1
+
+    def write_values(self, values):
+        self.writer.writerow(values)
+
+    def output_names(self):
+        # column names of the output, for the formats that name every value
+        if not self.keep_data:
+            return [self.input_headers[self.output_column] if self.output_column < len(self.input_headers) else "output"]
+        names = list(self.input_headers)
+        names += [f"column_{number + 1}" for number in range(len(names), self.output_column)]
+        if self.output_column >= len(self.input_headers):
+            names.append("output")
+        return names
+
+    def flush(self):
+        self.output_file.flush()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if self.output_file.closed:
+            return
+        if len(self.buffer) > 0:
+            self.log.write(f"{len(self.buffer)} completed rows were never written, rows before them did not finish")
+        self.flush()
+        self.output_file.close()
+
+
+class JsonlWriter(OutputWriter):
+    # one json object per row, keyed by the input headers
+    def open(self, include_headers, append):
+        self.output_file = open(self.file_name, "a" if append else "w", encoding="utf-8")
+        self.names = self.output_names()
+
+    def write_values(self, values):
+        self.output_file.write(json.dumps(dict(zip(self.names, values)), ensure_ascii=False, default=str) + "\n")
+
+
+class ParquetWriter(OutputWriter):
+    # Rows are collected into row groups of PARQUET_GROUP_ROWS. Columns keep their type from a parquet
+    # or arrow input, the output column and every column of a text input are strings. Resuming
+    # relies on the journal, a parquet file can't be appended to.
+    def __init__(self, *args, schema=None, **kwargs):
+        self.input_schema = schema
+        OutputWriter.__init__(self, *args, **kwargs)
+
+    def open(self, include_headers, append):
+        require_pyarrow("parquet")
+        if append:
+            raise Exception("Parquet output can't be appended to")
+        names = self.output_names()
+        fields = []
+        for column, name in enumerate(names):
+            if self.keep_data and column != self.output_column and self.input_schema is not None and column < len(self.input_schema):
+                fields.append(pyarrow.field(name, self.input_schema.field(column).type))
+            else:
+                fields.append(pyarrow.field(name, pyarrow.string()))
+        self.schema = pyarrow.schema(fields)
+        self.rows = []
+        self.output_file = pyarrow.parquet.ParquetWriter(self.file_name, self.schema)
+
+    def write_values(self, values):
+        self.rows.append(values)
+
+    def flush(self):
+        if len(self.rows) >= PARQUET_GROUP_ROWS:
+            self.write_group()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def write_group(self):
+        if len(self.rows) == 0:
+            return
+        columns = []
+        for column, field in enumerate(self.schema):
+            values = [row[column] if column < len(row) else None for row in self.rows]
+            if field.type == pyarrow.string():
+                values = [None if value is None else str(value) for value in values]
+            else:
+                # an empty value in a typed column is a null
+                values = [None if value == "" else value for value in values]
+            columns.append(pyarrow.array(values, type=field.type))
+        self.output_file.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        if self.output_file is None:
+            return
+        if len(self.buffer) > 0:
+            self.log.write(f"{len(self.buffer)} completed rows were never written, rows before them did not finish")
+        self.write_group()
+        self.output_file.close()
+        self.output_file = None
+
+
+OUTPUT_WRITERS = {"csv": OutputWriter, "jsonl": JsonlWriter, "parquet": ParquetWriter}
+
+
+def create_writer(file_name, input_headers, output_column, keep_data, include_headers, log, flush_rows=100, flush_interval=5, append=False, output_format=None, schema=None):
+    # the writer for output_format, or for the output file's extension when it isn't given
+    output_format = output_format or file_format(file_name)
+    if output_format not in OUTPUT_WRITERS:
+        raise Exception(f"Unknown output format: {output_format}, must be one of {', '.join(OUTPUT_WRITERS)}")
+    if output_format == "parquet":
+        return ParquetWriter(file_name, input_headers, output_column, keep_data, include_headers, log, flush_rows, flush_interval, append, schema=schema)
+    return OUTPUT_WRITERS[output_format](file_name, input_headers, output_column, keep_data, include_headers, log, flush_rows, flush_interval, append)